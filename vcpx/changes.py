@@ -13,6 +13,67 @@ __docformat__ = 'reStructuredText'
 
 from vcpx import TailorBug
 
+_interned_unicode = {}
+
+def intern_string(s):
+    """
+    Return the canonical instance of string `s`.
+
+    Pathnames, revisions and authors are heavily repeated over the
+    history, in particular when it comes from CVS: keeping a single
+    copy of each distinct value saves lots of memory.  Plain strings
+    go thru the builtin ``intern()``, that releases them when they
+    are no longer used; unicode strings, that it does not accept,
+    are kept in a table until `forget_interned_strings()` is called.
+    In both cases the type of the string never changes.
+    """
+
+    if type(s) is str:
+        return intern(s)
+    elif type(s) is unicode:
+        return _interned_unicode.setdefault(s, s)
+    else:
+        return s
+
+
+def forget_interned_strings():
+    """
+    Drop the references kept by `intern_string()` to unicode strings,
+    at the end of a session.
+    """
+
+    _interned_unicode.clear()
+
+
+def _interned_property(slot):
+    """
+    Build a property that interns the values stored in `slot`.
+    """
+
+    def fget(self):
+        return getattr(self, slot)
+
+    def fset(self, value):
+        setattr(self, slot, intern_string(value))
+
+    return property(fget, fset)
+
+
+def _restore_legacy_state(obj, state):
+    """
+    Set the attributes of `obj` from the old-style pickled `state`.
+
+    Obsolete attributes are silently dropped, unless the class of
+    `obj` has a ``__dict__`` to store them.
+    """
+
+    for attr, value in state.items():
+        try:
+            setattr(obj, attr, value)
+        except AttributeError:
+            pass
+
+
 class ChangesetEntry(object):
     """
     Represent a changed entry in a Changeset.
@@ -21,6 +82,10 @@ class ChangesetEntry(object):
     ``old_revision``, the ``new_revision`` after this change, an
     ``action_kind`` to denote the kind of change, and finally a ``status``
     to indicate possible conflicts.
+
+    To keep the memory footprint low the instances do not have a
+    ``__dict__`` (subclasses may have one, though) and the strings are
+    interned.
     """
 
     ADDED = 'ADD'
@@ -31,17 +96,78 @@ class ChangesetEntry(object):
     APPLIED = 'APPLIED'
     CONFLICT = 'CONFLICT'
 
-    old_name = None
-    old_revision = None
-    new_revision = None
-    action_kind = None
-    status = None
-    unidiff = None # This is the unidiff of this particular entry
-    is_directory = False # This usually makes sense only on ADDs and DELs
-    is_symlink = False
+    __slots__ = ('_name', '_old_name', '_old_revision', '_new_revision',
+                 'action_kind', 'status', 'unidiff', 'is_directory', 'is_symlink')
+
+    _CODES = (None, ADDED, DELETED, UPDATED, RENAMED, APPLIED, CONFLICT)
+    """The values of ``action_kind`` and ``status``, by pickled code."""
 
     def __init__(self, name):
         self.name = name
+        self._old_name = None
+        self._old_revision = None
+        self._new_revision = None
+        self.action_kind = None
+        self.status = None
+        self.unidiff = None # This is the unidiff of this particular entry
+        self.is_directory = False # This usually makes sense only on ADDs and DELs
+        self.is_symlink = False
+
+    name = _interned_property('_name')
+    old_name = _interned_property('_old_name')
+    old_revision = _interned_property('_old_revision')
+    new_revision = _interned_property('_new_revision')
+
+    def __getstate__(self):
+        """
+        Return a compact tuple, with the flags packed in an integer
+        and the action kind and the status replaced by their small
+        integer code.
+
+        In memory they stay strings: the attribute is a reference to
+        one of the class constants either way, so codes would only
+        cost a translation at each access, and the backends and the
+        hooks would see different values.
+        """
+
+        codes = self._CODES
+        action_kind = self.action_kind
+        if action_kind in codes:
+            action_kind = codes.index(action_kind)
+        status = self.status
+        if status in codes:
+            status = codes.index(status)
+        return (self._name, self._old_name, self._old_revision,
+                self._new_revision, action_kind, status, self.unidiff,
+                int(bool(self.is_directory)) | int(bool(self.is_symlink))<<1,
+                getattr(self, '__dict__', None))
+
+    def __setstate__(self, state):
+        """
+        Restore the state, either the compact one or the plain
+        ``__dict__`` of instances pickled by older versions of tailor.
+        """
+
+        if isinstance(state, dict):
+            ChangesetEntry.__init__(self, state.pop('name'))
+            _restore_legacy_state(self, state)
+        else:
+            (name, old_name, old_revision, new_revision, action_kind,
+             status, self.unidiff, flags, extra) = state
+            if type(action_kind) is int:
+                action_kind = self._CODES[action_kind]
+            if type(status) is int:
+                status = self._CODES[status]
+            self.action_kind = action_kind
+            self.status = status
+            self.name = name
+            self.old_name = old_name
+            self.old_revision = old_revision
+            self.new_revision = new_revision
+            self.is_directory = bool(flags & 1)
+            self.is_symlink = bool(flags & 2)
+            if extra:
+                self.__dict__.update(extra)
 
     def __str__(self):
         entry_kind = []
@@ -136,24 +262,23 @@ class Changeset(object):
     REFILL_MESSAGE = False
     """Refill changelogs"""
 
+    __slots__ = ('revision', '_date', '_author', 'log', 'entries',
+                 'unidiff', 'tags')
+
     def _get_date(self):
-        try:
-            return self.__date
-        except AttributeError, e:
-            # handle state-file Changesets created with previous versions of tailor
-            from vcpx.tzinfo import UTC
-            self.__date = self.__dict__['date'].replace(tzinfo=UTC)
-            return self.__date
+        return self._date
 
     def _set_date(self, date):
         if date and date.tzinfo is None:
             raise TailorBug("Changeset dates must have a timezone!")
-        self.__date = date
+        self._date = date
 
     # date has to be a property because some backends (eg. monotone)
     # update it after the constructor
     date = property(_get_date, _set_date)
 
+    author = _interned_property('_author')
+
     def __init__(self, revision, date, author, log, entries=None, **other):
         """
         Initialize a new Changeset.
@@ -169,6 +294,40 @@ class Changeset(object):
         self.unidiff = None        # This is the unidiff of the whole changeset
         self.tags = other.get('tags', None)
 
+    def __getstate__(self):
+        """
+        Return a compact tuple, not carrying the attribute names.
+        """
+
+        return (self.revision, self._date, self._author, self.log,
+                self.entries, self.unidiff, self.tags,
+                getattr(self, '__dict__', None))
+
+    def __setstate__(self, state):
+        """
+        Restore the state, either the compact one or the plain
+        ``__dict__`` of instances pickled by older versions of tailor.
+        """
+
+        if isinstance(state, dict):
+            from vcpx.tzinfo import UTC
+
+            if '_Changeset__date' in state:
+                date = state.pop('_Changeset__date')
+            else:
+                # Even older versions used naive dates
+                date = state.pop('date').replace(tzinfo=UTC)
+            self.unidiff = None
+            self.tags = None
+            _restore_legacy_state(self, state)
+            self._date = date
+        else:
+            (self.revision, self._date, author, self.log, self.entries,
+             self.unidiff, self.tags, extra) = state
+            self.author = author
+            if extra:
+                self.__dict__.update(extra)
+
     # Don't take into account the entries, to compare changesets, because they
     # may be loaded after changeset application: the not-yet-applied changeset
     # will be different from the same-but-just-applied one.
@@ -0,0 +1,364 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Minimal CVS client/server protocol implementation
+# :Creato:   dom 18 ott 2026 00:12:47 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+"""
+Talk to ``cvs server`` directly, to execute several updates at
+different revisions within a single connection.
+
+Each ``cvs update`` pays for its own connection to the server, and
+with ``:ext:`` repositories that means a whole SSH session: the
+`CvsServerSession` keeps the connection open and sends one update
+command for each group of entries, handling the responses itself,
+just like the ``cvs`` client would.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from vcpx import TailorException
+
+
+class CvsServerError(TailorException):
+    "Failure talking with the CVS server"
+
+
+class CvsServerClosed(CvsServerError):
+    "The CVS server closed the connection"
+
+
+VALID_RESPONSES = ('ok', 'error', 'Valid-requests', 'Checked-in',
+                   'New-entry', 'Checksum', 'Copy-file', 'Updated',
+                   'Created', 'Update-existing', 'Merged', 'Mode',
+                   'Mod-time', 'Removed', 'Remove-entry',
+                   'Set-static-directory', 'Clear-static-directory',
+                   'Set-sticky', 'Clear-sticky', 'Template', 'Notified',
+                   'Module-expansion', 'Wrapper-rcsOption', 'M', 'Mbinary',
+                   'E', 'F', 'MT')
+"""The responses understood by the session: leaving out ``Patched`` and
+``Rcs-diff`` the server sends the whole content of each file."""
+
+
+def parse_cvsroot(cvsroot):
+    """
+    Split a CVSROOT into its (method, user, host, path) components.
+    """
+
+    if cvsroot.startswith(':'):
+        method, rest = cvsroot[1:].split(':', 1)
+        # Strip the connection options, as in ":ext;CVS_RSH=ssh:"
+        method = method.split(';')[0]
+    elif cvsroot.startswith('/') or ':' not in cvsroot:
+        method, rest = 'local', cvsroot
+    else:
+        method, rest = 'ext', cvsroot
+
+    user = host = None
+    if method in ('local', 'fork'):
+        path = rest
+    else:
+        slash = rest.find('/')
+        if slash < 0:
+            raise CvsServerError("Bad CVSROOT %r" % cvsroot)
+        host, path = rest[:slash], rest[slash:]
+        # Drop the separator, and the port number if any
+        host = host.rstrip(':0123456789')
+        if '@' in host:
+            user, host = host.split('@', 1)
+    return method, user, host, path
+
+
+def parse_mode(mode):
+    """Convert a mode like "u=rw,g=r,o=r" to the corresponding bits."""
+
+    bits = 0
+    for part in mode.split(','):
+        if '=' not in part:
+            continue
+        who, perms = part.split('=', 1)
+        shift = {'u': 6, 'g': 3, 'o': 0}[who]
+        for perm in perms:
+            bits |= {'r': 4, 'w': 2, 'x': 1}[perm] << shift
+    return bits
+
+
+def parse_mod_time(modtime):
+    """Convert a date like "25 Jan 2004 10:00:00 -0000" to a timestamp."""
+
+    from calendar import timegm
+    from time import strptime
+
+    parts = modtime.split()
+    timestamp = timegm(strptime(' '.join(parts[:4]), '%d %b %Y %H:%M:%S'))
+    if len(parts) > 4:
+        tz = parts[4]
+        offset = (int(tz[1:3]) * 60 + int(tz[3:5])) * 60
+        if tz[0] == '-':
+            timestamp += offset
+        else:
+            timestamp -= offset
+    return timestamp
+
+
+class CvsServerSession(object):
+    """
+    A connection to ``cvs server`` operating on a working directory.
+
+    Only the ``:local:``, ``:fork:`` and ``:ext:`` access methods are
+    supported, as the others need an authentication step.
+    """
+
+    def __init__(self, cvsroot, basedir, executable='cvs'):
+        from logging import getLogger
+        from os import getenv
+        from vcpx.shwrap import Popen, PIPE
+
+        self.log = getLogger('tailor.vcpx.cvsclient')
+
+        self.basedir = basedir
+        """The root of the working directory."""
+
+        method, user, host, self.root = parse_cvsroot(cvsroot)
+        if method in ('local', 'fork'):
+            command = [executable, 'server']
+        elif method == 'ext':
+            command = [getenv('CVS_RSH') or 'ssh']
+            if user:
+                command.extend(['-l', user])
+            command.extend([host, '%s server' % (getenv('CVS_SERVER') or
+                                                  'cvs')])
+        else:
+            raise CvsServerError("Access method %r not supported" % method)
+
+        self.log.info("Starting CVS session: %s", ' '.join(command))
+        self.process = Popen(command, stdin=PIPE, stdout=PIPE)
+
+        self.valid_requests = []
+        """The requests the server understands."""
+
+        self.__send('Root %s' % self.root,
+                    'Valid-responses %s' % ' '.join(VALID_RESPONSES),
+                    'valid-requests')
+        self.__responses()
+        if not 'update' in self.valid_requests:
+            self.close()
+            raise CvsServerError("The CVS server does not know the update "
+                                 "request")
+        requests = ['Global_option -q']
+        if 'UseUnchanged' in self.valid_requests:
+            requests.insert(0, 'UseUnchanged')
+        self.__send(*requests)
+
+    def close(self):
+        """Close the connection, waiting for the server to exit."""
+
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+    def update(self, names, revision, options=()):
+        """
+        Bring the entries `names` to the given `revision`, like
+        ``cvs update -r revision`` with the given `options` would do.
+        """
+
+        from os.path import join, exists, split
+
+        requests = ['Argument %s' % arg
+                    for arg in list(options) + ['-r', revision, '--']]
+
+        bydir = {}
+        for name in names:
+            dir, base = split(name)
+            bydir.setdefault(dir, []).append(base)
+        dirs = bydir.keys()
+        dirs.sort()
+        for dir in dirs:
+            requests.extend(self.__directory(dir))
+            entries = self.__entries(dir)
+            for base in bydir[dir]:
+                entry = entries.get(base)
+                if entry is not None:
+                    # Without an Unchanged the server sends it back, as
+                    # it happens with files lost from the working copy
+                    requests.append('Entry %s' % entry)
+                    if exists(join(self.basedir, dir, base)):
+                        requests.append('Unchanged %s' % base)
+        requests.extend(['Argument %s' % name for name in names])
+        requests.extend(self.__directory(''))
+        requests.append('update')
+
+        self.__send(*requests)
+        self.__responses()
+
+    def __send(self, *requests):
+        """Send the `requests` to the server."""
+
+        if self.process is None:
+            raise CvsServerClosed()
+        try:
+            self.process.stdin.write('\n'.join(requests) + '\n')
+            self.process.stdin.flush()
+        except IOError, e:
+            raise CvsServerClosed(str(e))
+
+    def __readline(self):
+        """Read a line of response, without the newline."""
+
+        line = self.process.stdout.readline()
+        if not line:
+            raise CvsServerClosed()
+        return line[:-1]
+
+    def __readFile(self):
+        """Read a file transmission."""
+
+        size = self.__readline()
+        if size.startswith('z'):
+            raise CvsServerError("Compressed file transmission not supported")
+        size = int(size)
+        chunks = []
+        while size > 0:
+            chunk = self.process.stdout.read(size)
+            if not chunk:
+                raise CvsServerClosed()
+            chunks.append(chunk)
+            size -= len(chunk)
+        return ''.join(chunks)
+
+    def __repository(self, dir):
+        """Return the full repository name of the local directory `dir`."""
+
+        from os.path import join
+
+        f = open(join(self.basedir, dir, 'CVS', 'Repository'))
+        repository = f.readline()[:-1]
+        f.close()
+        if not repository.startswith('/'):
+            repository = self.root + '/' + repository
+        return repository
+
+    def __directory(self, dir):
+        """Return the Directory request for the local directory `dir`."""
+
+        return ['Directory %s' % (dir or '.'), self.__repository(dir)]
+
+    def __entries(self, dir):
+        """Return the Entries lines of `dir`, keyed on the file name."""
+
+        from os.path import join, exists
+
+        entries = {}
+        efn = join(self.basedir, dir, 'CVS', 'Entries')
+        if exists(efn):
+            f = open(efn)
+            for line in f.readlines():
+                if line.startswith('/'):
+                    entries[line.split('/')[1]] = line[:-1]
+            f.close()
+        return entries
+
+    def __responses(self):
+        """
+        Handle the responses to a command, until the final ``ok``,
+        applying the changes to the working directory.
+        """
+
+        from os import chmod, remove, utime
+        from os.path import join, exists, getmtime
+        from time import asctime, gmtime
+        from vcpx.repository.cvs import rewrite_cvs_entries
+
+        changes = {}
+        errors = []
+        modtime = None
+        try:
+            while True:
+                line = self.__readline()
+                if ' ' in line:
+                    response, arg = line.split(' ', 1)
+                else:
+                    response, arg = line, ''
+
+                if response == 'ok':
+                    return
+                elif response == 'error':
+                    errors.append(arg)
+                    raise CvsServerError('\n'.join(errors))
+                elif response == 'Valid-requests':
+                    self.valid_requests = arg.split()
+                elif response in ('M', 'MT', 'F'):
+                    self.log.debug("%s %s", response, arg)
+                elif response == 'E':
+                    self.log.warning(arg)
+                    errors.append(arg)
+                elif response == 'Mbinary':
+                    self.__readFile()
+                elif response == 'Mod-time':
+                    modtime = parse_mod_time(arg)
+                elif response in ('Mode', 'Checksum', 'Module-expansion',
+                                  'Wrapper-rcsOption'):
+                    pass
+                elif response in VALID_RESPONSES:
+                    # All the others refer to a pathname, followed by
+                    # its name in the repository
+                    dir = arg.rstrip('/')
+                    if dir == '.':
+                        dir = ''
+                    elif dir.startswith('./'):
+                        dir = dir[2:]
+                    name = self.__readline().split('/')[-1]
+                    dirchanges = changes.setdefault(dir, {})
+                    if response in ('Updated', 'Created', 'Update-existing',
+                                    'Merged'):
+                        entry = self.__readline()
+                        mode = parse_mode(self.__readline())
+                        data = self.__readFile()
+                        path = join(self.basedir, dir, name)
+                        f = open(path, 'wb')
+                        f.write(data)
+                        f.close()
+                        chmod(path, mode)
+                        if modtime is not None:
+                            utime(path, (modtime, modtime))
+                            modtime = None
+                        fields = entry.split('/')
+                        if response == 'Merged':
+                            fields[3] = 'Result of merge'
+                        else:
+                            fields[3] = asctime(gmtime(getmtime(path)))
+                        dirchanges[name] = '/'.join(fields)
+                    elif response in ('Checked-in', 'New-entry'):
+                        dirchanges[name] = self.__readline()
+                    elif response == 'Removed':
+                        path = join(self.basedir, dir, name)
+                        if exists(path):
+                            remove(path)
+                        dirchanges[name] = None
+                    elif response == 'Remove-entry':
+                        dirchanges[name] = None
+                    elif response == 'Copy-file':
+                        self.__readline()
+                    elif response == 'Set-sticky':
+                        f = open(join(self.basedir, dir, 'CVS', 'Tag'), 'w')
+                        f.write(self.__readline() + '\n')
+                        f.close()
+                    elif response == 'Clear-sticky':
+                        tag = join(self.basedir, dir, 'CVS', 'Tag')
+                        if exists(tag):
+                            remove(tag)
+                    elif response == 'Template':
+                        self.__readFile()
+                else:
+                    raise CvsServerError("Unexpected response from the CVS "
+                                         "server: %r" % line)
+        finally:
+            # Record what has been done, even when interrupted
+            for dir, dirchanges in changes.items():
+                if dirchanges:
+                    rewrite_cvs_entries(join(self.basedir, dir, 'CVS'),
+                                        dirchanges)
@@ -23,6 +23,7 @@ __docformat__ = 'reStructuredText'
 from source import UpdatableSourceWorkingDir, InvocationError
 from target import SynchronizableTargetWorkingDir
 from shwrap import ExternalCommand
+from mirror import Mirror
 from datetime import datetime
 
 IGNORED_METADIRS = []
@@ -59,6 +60,31 @@ class DualWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         self.source.shared_basedirs = shared
         self.target.shared_basedirs = shared
 
+        # The source may skip listing the content of the added
+        # directories, when the target does not need it
+        self.source.subtree_entries = self.target.needsSubtreeEntries()
+
+        # Pipelining needs a source working dir distinct from the
+        # target one, to stage next changeset while committing.
+        project = source_repo.projectref()
+        pipelined = project.config.get(project.name, 'pipelined-apply', False)
+        if pipelined and shared:
+            project.log.warning('Ignoring pipelined-apply, source and target '
+                                'share the same directory')
+        self.pipelined = pipelined and not shared
+
+        # With disjunct directories, a value different from 1 means
+        # syncing only the entries touched by each changeset, with a
+        # full rsync every that many changesets
+        self.full_sync_interval = int(project.config.get(
+            project.name, 'full-sync-interval', '1'))
+        self._unverified_syncs = 0
+
+        # Hard links are safe only when both backends replace the
+        # files instead of rewriting them in place
+        self.mirror = Mirror(project.config.get(project.name,
+                                                'mirror-hardlinks', False))
+
         IGNORED_METADIRS = filter(None, [source_repo.METADIR,
                                          target_repo.METADIR])
         IGNORED_METADIRS.extend(source_repo.EXTRA_METADIRS)
@@ -92,27 +118,67 @@ class DualWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         self.target.logfile = logfile
 
     def applyPendingChangesets(self, applyable=None, replay=None, applied=None):
-        def pre_replay(changeset):
-            if applyable and not applyable(changeset):
-                return
-            return self.target._prepareToReplayChangeset(changeset)
+        try:
+            if self.pipelined:
+                return self.source.applyPendingChangesets(
+                    replay=self.target.replayChangeset,
+                    stage=self.stageChangeset,
+                    applyable=applyable, applied=applied)
+
+            def pre_replay(changeset):
+                if applyable and not applyable(changeset):
+                    return
+                return self.target._prepareToReplayChangeset(changeset)
 
-        return self.source.applyPendingChangesets(replay=self.replayChangeset,
-                                                  applyable=pre_replay,
-                                                  applied=applied)
+            return self.source.applyPendingChangesets(
+                replay=self.replayChangeset, applyable=pre_replay,
+                applied=applied)
+        finally:
+            self.target.finalizeTargetRepository()
 
     def importFirstRevision(self, source_repo, changeset, initial):
-        if not self.shared_basedirs:
-            self._syncTargetWithSource()
-        self.target.importFirstRevision(source_repo, changeset, initial)
+        try:
+            if not self.shared_basedirs:
+                self._mirrorTree()
+            self.target.importFirstRevision(source_repo, changeset, initial)
+        finally:
+            self.target.finalizeTargetRepository()
 
     def replayChangeset(self, changeset):
         if not self.shared_basedirs:
             self._saveRenamedTargets(changeset)
-            self._syncTargetWithSource()
+            self._syncTargetWithSource(changeset)
         self.target.replayChangeset(changeset)
 
-    def _syncTargetWithSource(self):
+    def stageChangeset(self, changeset):
+        """
+        Prepare the target for `changeset` and mirror the source tree
+        over it, so that the source dir may proceed with the next one.
+        """
+
+        if not self.target._prepareToReplayChangeset(changeset):
+            return False
+        self._saveRenamedTargets(changeset)
+        self._syncTargetWithSource(changeset)
+        return True
+
+    def _syncTargetWithSource(self, changeset=None):
+        """
+        Mirror the source working directory over the target one.
+
+        When `changeset` is given and ``full-sync-interval`` allows it,
+        only its entries are considered, otherwise ``rsync`` does the
+        job on the whole tree.
+        """
+
+        interval = self.full_sync_interval
+        if changeset is not None and interval != 1:
+            if not interval or self._unverified_syncs < interval-1:
+                self._unverified_syncs += 1
+                self._syncEntries(changeset)
+                return
+            self._unverified_syncs = 0
+
         cmd = ['rsync', '--archive']
         now = datetime.now()
         if hasattr(self, '_last_rsync'):
@@ -129,6 +195,154 @@ class DualWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         rsync = ExternalCommand(command=cmd)
         rsync.execute(self.source.repository.basedir+'/', self.target.repository.basedir)
 
+    def _mirrorTree(self):
+        """
+        Mirror the whole source working directory over the target one,
+        cloning or linking the files when possible, otherwise using
+        ``rsync``.
+
+        As ``rsync`` does, the ``--delete`` flag requested by the
+        target removes what's not in the source, except the metadirs;
+        any other flag is honored falling back to ``rsync``.
+        """
+
+        from os import listdir, walk
+        from os.path import join, isdir
+
+        sbdir = self.source.repository.basedir
+        tbdir = self.target.repository.basedir
+        flags = self.target.repository.EXTRA_RSYNC_FLAGS or []
+        delete = '--delete' in flags
+
+        if ([f for f in flags if f <> '--delete'] or
+            not (self.mirror.hardlinks or self.mirror.canReflink(sbdir, tbdir))):
+            self._syncTargetWithSource()
+            return
+
+        for dir, subdirs, files in walk(sbdir):
+            for md in IGNORED_METADIRS:
+                if md in subdirs:
+                    subdirs.remove(md)
+            relative = dir[len(sbdir)+1:]
+            if delete and isdir(join(tbdir, relative)):
+                for item in listdir(join(tbdir, relative)):
+                    if (item not in IGNORED_METADIRS and
+                        item not in subdirs and item not in files):
+                        self._removePath(join(tbdir, relative, item))
+            for item in subdirs + files:
+                self._copyPath(join(dir, item), join(tbdir, relative, item))
+
+    def _syncEntries(self, changeset):
+        """
+        Mirror just the entries touched by `changeset`.
+
+        Like the rsync invocation, this does not remove from the target
+        what's gone from the source, unless the target asks for it with
+        the ``--delete`` flag: usually the target backend takes care
+        of that, when it replays the removals.
+        """
+
+        from os.path import join, lexists
+
+        delete = '--delete' in (self.target.repository.EXTRA_RSYNC_FLAGS or [])
+        sbdir = self.source.repository.basedir
+        tbdir = self.target.repository.basedir
+
+        for e in changeset.entries:
+            gone = []
+            if e.action_kind == e.DELETED:
+                gone.append(e.name)
+            else:
+                if e.action_kind == e.RENAMED:
+                    gone.append(e.old_name)
+                self._mirrorPath(e.name, e.action_kind in (e.ADDED, e.RENAMED))
+            if delete:
+                for name in gone:
+                    if not lexists(join(sbdir, name)):
+                        self._removeTargetPath(name)
+
+    def _mirrorPath(self, name, subtree=False):
+        """
+        Copy `name` from the source to the target working directory,
+        creating its missing parents.  When `subtree` is True and `name`
+        is a directory, copy its whole content too.
+        """
+
+        from os import walk
+        from os.path import join, split, isdir, lexists
+
+        for component in name.split('/'):
+            if component in IGNORED_METADIRS:
+                return
+
+        source = join(self.source.repository.basedir, name)
+        if not lexists(source):
+            # Removed by some later entry
+            return
+
+        parent = split(name)[0]
+        if parent and not isdir(join(self.target.repository.basedir, parent)):
+            self._mirrorPath(parent)
+
+        self._copyPath(source, join(self.target.repository.basedir, name))
+
+        if subtree and isdir(source):
+            for dir, subdirs, files in walk(source):
+                for md in IGNORED_METADIRS:
+                    if md in subdirs:
+                        subdirs.remove(md)
+                relative = dir[len(self.source.repository.basedir)+1:]
+                for item in subdirs + files:
+                    self._copyPath(join(dir, item), join(
+                        self.target.repository.basedir, relative, item))
+
+    def _copyPath(self, source, target):
+        """
+        Copy a single file, symlink or directory (without its content),
+        preserving permissions and times as ``rsync --archive`` does.
+        """
+
+        from os import mkdir, readlink, remove, symlink
+        from os.path import isdir, islink, lexists
+        from shutil import copystat
+
+        if islink(source):
+            if lexists(target):
+                self._removePath(target)
+            symlink(readlink(source), target)
+        elif isdir(source):
+            if lexists(target) and (islink(target) or not isdir(target)):
+                remove(target)
+            if not lexists(target):
+                mkdir(target)
+            copystat(source, target)
+        else:
+            # Never write over the target, it may be a hard link
+            if lexists(target):
+                self._removePath(target)
+            self.mirror.copyFile(source, target)
+
+    def _removeTargetPath(self, name):
+        """
+        Remove `name` from the target working directory.
+        """
+
+        from os.path import join, lexists
+
+        target = join(self.target.repository.basedir, name)
+        if lexists(target):
+            self._removePath(target)
+
+    def _removePath(self, path):
+        from os import remove
+        from os.path import isdir, islink
+        from shutil import rmtree
+
+        if isdir(path) and not islink(path):
+            rmtree(path)
+        else:
+            remove(path)
+
     def _saveRenamedTargets(self, changeset):
         """
         Save old names from `rename`, before rsync replace it with new file.
@@ -0,0 +1,119 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Cheap copies of working directory files
+# :Creato:   sab 17 ott 2026 18:04:37 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+"""
+Copy files between the source and the target working directories in
+the cheapest way the filesystem allows.
+
+The best option is a *reflink*, that is a copy-on-write clone of the
+file supported by filesystems like btrfs and xfs: it costs nothing,
+both in time and space, and the two copies stay independent.  When
+that's not possible, and only if the user says it's safe, a hard link
+is used, otherwise the file gets copied as usual.
+"""
+
+__docformat__ = 'reStructuredText'
+
+FICLONE = 0x40049409
+"""The Linux ``ioctl()`` that clones a file, aka BTRFS_IOC_CLONE."""
+
+
+def reflink(source, target):
+    """
+    Make `target` a copy-on-write clone of `source`.
+
+    Return False when the platform or the filesystem does not support
+    the operation, leaving no `target` behind.
+    """
+
+    from errno import EXDEV, EINVAL, ENOTTY, ENOSYS, EOPNOTSUPP, EPERM
+    from os import remove
+
+    try:
+        from fcntl import ioctl
+    except ImportError:
+        return False
+
+    src = open(source, 'rb')
+    try:
+        dst = open(target, 'wb')
+        try:
+            try:
+                ioctl(dst.fileno(), FICLONE, src.fileno())
+            except (IOError, OSError), e:
+                if e.errno in (EXDEV, EINVAL, ENOTTY, ENOSYS, EOPNOTSUPP, EPERM):
+                    dst.close()
+                    remove(target)
+                    return False
+                raise
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    return True
+
+
+class Mirror(object):
+    """
+    Copy single files, preserving permissions and times.
+
+    The first failed reflink disables further attempts, as it usually
+    means that the filesystem does not support them.
+    """
+
+    def __init__(self, hardlinks=False):
+        self.reflinks = None
+        """Whether reflinks work, None until the first attempt."""
+
+        self.hardlinks = hardlinks
+        """Whether hard links may be used, when reflinks do not work."""
+
+    def canReflink(self, sourcedir, targetdir):
+        """
+        Check whether files can be cloned from `sourcedir` to `targetdir`.
+        """
+
+        from os import close, remove
+        from os.path import join, basename
+        from tempfile import mkstemp
+
+        if self.reflinks is None:
+            fd, source = mkstemp('', '.tailor-reflink-', sourcedir)
+            close(fd)
+            try:
+                target = join(targetdir, basename(source))
+                self.reflinks = reflink(source, target)
+                if self.reflinks:
+                    remove(target)
+            finally:
+                remove(source)
+        return self.reflinks
+
+    def copyFile(self, source, target):
+        """
+        Copy the `source` file to `target`, that must not exist.
+        """
+
+        from os import link
+        from shutil import copy2, copystat
+
+        if self.reflinks is not False:
+            self.reflinks = reflink(source, target)
+            if self.reflinks:
+                copystat(source, target)
+                return
+
+        if self.hardlinks:
+            try:
+                link(source, target)
+            except OSError:
+                # Different devices, too many links, no support...
+                pass
+            else:
+                return
+
+        copy2(source, target)
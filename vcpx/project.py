@@ -15,7 +15,7 @@ __docformat__ = 'reStructuredText'
 
 from vcpx import TailorException
 from vcpx.config import ConfigurationError
-from vcpx.statefile import StateFile
+from vcpx.statefile import STATE_FILE_FORMATS
 
 
 class UnknownProjectError(TailorException):
@@ -45,6 +45,9 @@ class Project(object):
     state-file
       Name of the state file needed to store tailor last activity.
 
+    state-file-format
+      Either ``indexed`` (the default) or ``sqlite``.
+
     source
       The source repository: a repository name is something like
       "darcs:somename", that will be loaded from the homonymous section
@@ -146,7 +149,14 @@ class Project(object):
 
         sfpath = self.config.get(self.name, 'state-file', self.name + '.state')
         sfpath = join(self.rootdir, self.target.stateFilePath(sfpath))
-        self.state_file = StateFile(sfpath, self.config)
+        sfformat = self.config.get(self.name, 'state-file-format', 'indexed')
+        try:
+            sfclass = STATE_FILE_FORMATS[sfformat]
+        except KeyError:
+            raise ConfigurationError('Project "%s" uses an unknown '
+                                     'state-file-format: %s' %
+                                     (self.name, sfformat))
+        self.state_file = sfclass(sfpath, self.config)
 
         before = self.config.getTuple(self.name, 'before-commit')
         try:
@@ -0,0 +1,642 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Direct access to RCS files
+# :Creato:   sab 17 ott 2026 21:36:12 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+"""
+Read the ``,v`` files of a local CVS repository, without going thru
+``cvs`` itself.
+
+`RcsFile` parses the delta tree of a single file and rebuilds the
+text of any of its revisions applying the RCS deltas; `rlog()`
+emits the very same lines ``cvs rlog`` would print for a whole
+module, so that the usual CVS log parser builds the changesets.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from vcpx import TailorException
+
+
+class RcsFileError(TailorException):
+    "Malformed RCS file"
+
+
+KEYWORDS = ('Author', 'Date', 'Header', 'Id', 'Locker', 'Name',
+            'RCSfile', 'Revision', 'Source', 'State')
+"""The RCS keywords expanded at checkout. ``$Log$`` is left as is."""
+
+
+def split_lines(text):
+    """
+    Split `text` in lines, keeping their terminator.
+
+    Unlike ``str.splitlines()`` only the newline is a terminator, as
+    RCS does.
+    """
+
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [l + '\n' for l in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def apply_delta(lines, delta):
+    """
+    Apply an RCS `delta`, a sequence of lines with ``aN M`` and ``dN M``
+    commands, to a list of `lines`, returning the new list.
+    """
+
+    result = []
+    pos = 0
+    i = 0
+    n = len(delta)
+    while i < n:
+        cmd = delta[i]
+        i += 1
+        start, count = cmd[1:].split()
+        start = int(start)
+        count = int(count)
+        if cmd[0] == 'd':
+            result.extend(lines[pos:start-1])
+            pos = start - 1 + count
+        elif cmd[0] == 'a':
+            result.extend(lines[pos:start])
+            pos = start
+            result.extend(delta[i:i+count])
+            i += count
+        else:
+            raise RcsFileError("Bad delta command %r" % cmd)
+    result.extend(lines[pos:])
+    return result
+
+
+def delta_size(delta):
+    """
+    Return the number of lines added and removed by an RCS `delta`.
+    """
+
+    added = removed = 0
+    i = 0
+    n = len(delta)
+    while i < n:
+        cmd = delta[i]
+        count = int(cmd[1:].split()[1])
+        if cmd[0] == 'a':
+            added += count
+            i += count
+        else:
+            removed += count
+        i += 1
+    return added, removed
+
+
+def normalize_rcs_rev(rev):
+    """
+    Turn a CVS magic branch number like ``1.2.0.4`` into the real
+    branch number, ``1.2.4``.
+    """
+
+    nums = rev.split('.')
+    if len(nums) > 2 and nums[-2] == '0':
+        del nums[-2]
+    return '.'.join(nums)
+
+
+def rev_branch(rev):
+    """Return the branch of a revision, that is, `rev` minus its last number."""
+
+    return rev[:rev.rfind('.')]
+
+
+class RcsRevision(object):
+    """The information RCS keeps about a single revision of a file."""
+
+    __slots__ = ('revision', 'date', 'author', 'state', 'branches', 'next',
+                 'log', 'text')
+
+    def __init__(self, revision):
+        self.revision = revision
+        self.date = None
+        self.author = None
+        self.state = None
+        self.branches = []
+        self.next = None
+        self.log = ''
+        self.text = ''
+
+    def getDate(self, separator='/'):
+        """Return the date as "YYYY/MM/DD hh:mm:ss"."""
+
+        y,m,d,hh,mm,ss = self.date.split('.')
+        if len(y) == 2:
+            y = '19' + y
+        return '%s%s%s%s%s %s:%s:%s' % (y, separator, m, separator, d,
+                                        hh, mm, ss)
+
+
+class RcsFile(object):
+    """
+    Parsed content of an RCS ``,v`` file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        """The pathname of the ``,v`` file."""
+
+        self.head = None
+        """The head revision on the trunk."""
+
+        self.branch = None
+        """The default branch, if any."""
+
+        self.symbols = []
+        """The list of (name, revision) symbolic names, as stored."""
+
+        self.expand = None
+        """The keyword substitution mode."""
+
+        self.description = ''
+        """The file description."""
+
+        self.revisions = {}
+        """Dict of `RcsRevision` keyed on their number."""
+
+        self.__texts = {}
+        """Cache of the already rebuilt texts, keyed on the revision."""
+
+        self.__parse(open(path, 'rb').read())
+
+    def __str__(self):
+        return "RcsFile(%r, %d revisions)" % (self.path, len(self.revisions))
+
+    def __parse(self, data):
+        """Parse the whole content of the file."""
+
+        from re import compile
+
+        token_re = compile(r'\s*(?:(@)|([;:])|([^\s;:@]+))')
+        size = len(data)
+        # Python 2 closures cannot rebind outer variables
+        state = {'pos': 0}
+
+        def token():
+            m = token_re.match(data, state['pos'])
+            if m is None:
+                state['pos'] = size
+                return None
+            if m.group(1):
+                # Strings are delimited by '@', doubled when inside
+                start = m.end()
+                end = start
+                while True:
+                    end = data.find('@', end)
+                    if end < 0:
+                        raise RcsFileError("Unterminated string in %s"
+                                           % self.path)
+                    if data[end+1:end+2] == '@':
+                        end += 2
+                    else:
+                        break
+                state['pos'] = end + 1
+                return ('@', data[start:end].replace('@@', '@'))
+            state['pos'] = m.end()
+            return m.group(2) or m.group(3)
+
+        def value(tok):
+            if type(tok) is tuple:
+                return tok[1]
+            return tok
+
+        def phrase():
+            """Read the values up to the ';'."""
+            values = []
+            tok = token()
+            while tok != ';':
+                if tok is None:
+                    raise RcsFileError("Premature end of %s" % self.path)
+                values.append(value(tok))
+                tok = token()
+            return values
+
+        # Admin section
+        tok = token()
+        while tok not in (None, 'desc') and not tok[0].isdigit():
+            values = phrase()
+            if tok == 'head':
+                self.head = values and values[0] or None
+            elif tok == 'branch':
+                self.branch = values and values[0] or None
+            elif tok == 'symbols':
+                # name : rev name : rev ...
+                self.symbols = [(values[i], values[i+2])
+                                for i in range(0, len(values), 3)]
+            elif tok == 'expand':
+                self.expand = values and values[0] or None
+            tok = token()
+
+        # Delta nodes
+        while tok is not None and tok != 'desc':
+            rev = RcsRevision(tok)
+            self.revisions[tok] = rev
+            tok = token()
+            while tok is not None and tok != 'desc' and not tok[0].isdigit():
+                values = phrase()
+                if tok == 'date':
+                    rev.date = values[0]
+                elif tok == 'author':
+                    rev.author = values[0]
+                elif tok == 'state':
+                    rev.state = values and values[0] or ''
+                elif tok == 'branches':
+                    rev.branches = values
+                elif tok == 'next':
+                    rev.next = values and values[0] or None
+                tok = token()
+
+        if tok != 'desc':
+            raise RcsFileError("Missing description in %s" % self.path)
+        self.description = value(token())
+
+        # Delta texts
+        tok = token()
+        while tok is not None:
+            rev = self.revisions.get(tok)
+            if rev is None:
+                raise RcsFileError("Unknown revision %s in %s"
+                                   % (value(tok), self.path))
+            tok = token()
+            while tok is not None and tok != 'text':
+                if tok == 'log':
+                    rev.log = value(token())
+                else:
+                    phrase()
+                tok = token()
+            if tok is None:
+                raise RcsFileError("Premature end of %s" % self.path)
+            rev.text = value(token())
+            tok = token()
+
+    def symbol(self, name):
+        """Return the (normalized) revision of the symbolic `name`, or None."""
+
+        for sym, rev in self.symbols:
+            if sym == name:
+                return normalize_rcs_rev(rev)
+        return None
+
+    def trunk(self):
+        """Return the trunk revisions, from the head downwards."""
+
+        revs = []
+        rev = self.head
+        while rev:
+            revs.append(rev)
+            rev = self.revisions[rev].next
+        return revs
+
+    def branchRevisions(self, branch):
+        """
+        Return the revisions on `branch`, from the newest downwards.
+        """
+
+        if branch.count('.') == 0:
+            return [r for r in self.trunk() if rev_branch(r) == branch]
+
+        root = self.revisions.get(rev_branch(branch))
+        if root is None:
+            return []
+        revs = []
+        for first in root.branches:
+            if rev_branch(first) == branch:
+                rev = first
+                while rev:
+                    revs.insert(0, rev)
+                    rev = self.revisions[rev].next
+        return revs
+
+    def headRevision(self):
+        """Return what CVS calls ``HEAD``, the head of the default branch."""
+
+        if self.branch:
+            revs = self.branchRevisions(self.branch)
+            if revs:
+                return revs[0]
+        return self.head
+
+    def resolve(self, name):
+        """
+        Resolve a symbolic `name`, ``HEAD`` or a revision number into a
+        revision or branch number. Return None if unknown.
+        """
+
+        if name == 'HEAD':
+            return self.headRevision()
+        if name[:1].isdigit():
+            return normalize_rcs_rev(name)
+        return self.symbol(name)
+
+    def select(self, spec):
+        """
+        Return the revisions selected by `spec`, using the syntax of the
+        ``-r`` option of ``rlog``: ``rev``, ``rev.``, ``rev1:rev2``.
+        """
+
+        if spec.endswith('.'):
+            rev = self.resolve(spec[:-1])
+            if rev is None:
+                return []
+            if rev.count('.') % 2 == 1:
+                rev = rev_branch(rev)
+            revs = self.branchRevisions(rev)
+            return revs[:1]
+
+        if ':' in spec:
+            low, high = spec.split(':', 1)
+            high = high and self.resolve(high) or self.headRevision()
+            if high is None:
+                return []
+            if high.count('.') % 2 == 0:
+                revs = self.branchRevisions(high)
+                if not revs:
+                    return []
+                high = revs[0]
+            branch = rev_branch(high)
+            if low:
+                low = self.resolve(low)
+                if low is None or rev_branch(low) != branch:
+                    return []
+            revs = self.branchRevisions(branch)
+            last = int(high.split('.')[-1])
+            first = low and int(low.split('.')[-1]) or 0
+            return [r for r in revs
+                    if first <= int(r.split('.')[-1]) <= last]
+
+        rev = self.resolve(spec)
+        if rev is None:
+            return []
+        if rev.count('.') % 2 == 0:
+            return self.branchRevisions(rev)
+        if self.revisions.has_key(rev):
+            return [rev]
+        return []
+
+    def getLinesCount(self, revision):
+        """
+        Return the "lines: +a -d" info of a revision, or None if it has
+        no predecessor.
+        """
+
+        rev = self.revisions[revision]
+        if revision.count('.') == 1:
+            if not rev.next:
+                return None
+            # The delta of the previous revision is a reverse one
+            removed, added = delta_size(split_lines(
+                self.revisions[rev.next].text))
+        else:
+            added, removed = delta_size(split_lines(rev.text))
+        return added, removed
+
+    def getLines(self, revision):
+        """Return the text of `revision` as a list of lines."""
+
+        lines = self.__texts.get(revision)
+        if lines is not None:
+            return lines
+
+        if not self.revisions.has_key(revision):
+            raise RcsFileError("Unknown revision %s in %s"
+                               % (revision, self.path))
+
+        nums = revision.split('.')
+        if len(nums) == 2:
+            # Walk the trunk down from the head, applying the reverse
+            # deltas and keeping the texts along the way, as the next
+            # request will most probably be for a newer revision
+            rev = self.head
+            lines = self.__texts.get(rev)
+            if lines is None:
+                lines = split_lines(self.revisions[rev].text)
+                self.__texts[rev] = lines
+            while rev != revision:
+                rev = self.revisions[rev].next
+                if rev is None:
+                    raise RcsFileError("Revision %s not on the trunk of %s"
+                                       % (revision, self.path))
+                cached = self.__texts.get(rev)
+                if cached is None:
+                    cached = apply_delta(lines, split_lines(
+                        self.revisions[rev].text))
+                    self.__texts[rev] = cached
+                lines = cached
+        else:
+            # Branch revisions hold forward deltas from the branch point
+            branch = rev_branch(revision)
+            lines = self.getLines(rev_branch(branch))
+            for rev in self.branchRevisions(branch)[::-1]:
+                cached = self.__texts.get(rev)
+                if cached is None:
+                    cached = apply_delta(lines, split_lines(
+                        self.revisions[rev].text))
+                    self.__texts[rev] = cached
+                lines = cached
+                if rev == revision:
+                    break
+        return lines
+
+    def checkout(self, revision, mode=None):
+        """
+        Return the content of `revision`, expanding the keywords as
+        `mode` (by default, the file's one) requests.
+        """
+
+        text = ''.join(self.getLines(revision))
+        if mode is None:
+            mode = self.expand or 'kv'
+        if mode in ('b', 'o'):
+            return text
+        return self.expandKeywords(text, revision, mode)
+
+    def expandKeywords(self, text, revision, mode):
+        """Expand, or collapse with ``k`` mode, the keywords in `text`."""
+
+        from os.path import basename
+        from re import compile
+
+        rev = self.revisions[revision]
+        date = rev.getDate()
+        rcsfile = basename(self.path)
+        values = {
+            'Author': rev.author,
+            'Date': date,
+            'Header': '%s %s %s %s %s' % (self.path, revision, date,
+                                          rev.author, rev.state),
+            'Id': '%s %s %s %s %s' % (rcsfile, revision, date,
+                                      rev.author, rev.state),
+            'Locker': '',
+            'Name': '',
+            'RCSfile': rcsfile,
+            'Revision': revision,
+            'Source': self.path,
+            'State': rev.state,
+            }
+
+        def expand(m):
+            keyword = m.group(1)
+            if mode == 'k':
+                return '$%s$' % keyword
+            elif mode == 'v':
+                return values[keyword]
+            else:
+                return '$%s: %s $' % (keyword, values[keyword])
+
+        keywords = compile(r'\$(%s)(?::[^$\n]*)?\$' % '|'.join(KEYWORDS))
+        return keywords.sub(expand, text)
+
+
+def rlog_file(rcsfile, revisions=None, default_branch=False, after=None):
+    """
+    Yield the lines printed by ``rlog`` about a single `rcsfile`.
+
+    `revisions` is an ``-r`` spec, `default_branch` is the ``-b``
+    flag and `after` selects the revisions committed at or after
+    that "YYYY-MM-DD hh:mm:ss" UTC date, as ``-d 'date<'`` does.
+    """
+
+    if revisions is None and not default_branch:
+        selected = rcsfile.revisions.keys()
+    else:
+        selected = []
+        if revisions is not None:
+            selected.extend(rcsfile.select(revisions))
+        if default_branch:
+            if rcsfile.branch:
+                selected.extend(rcsfile.branchRevisions(rcsfile.branch))
+            else:
+                selected.extend(rcsfile.trunk())
+    selected = dict([(r, True) for r in selected])
+    if after is not None:
+        for rev in selected.keys():
+            if rcsfile.revisions[rev].getDate('-') < after:
+                del selected[rev]
+
+    yield '\n'
+    yield 'RCS file: %s\n' % rcsfile.path
+    yield 'head: %s\n' % (rcsfile.head or '')
+    yield 'branch:%s\n' % (rcsfile.branch and ' ' + rcsfile.branch or '')
+    yield 'locks: strict\n'
+    yield 'access list:\n'
+    yield 'symbolic names:\n'
+    for name, rev in rcsfile.symbols:
+        yield '\t%s: %s\n' % (name, rev)
+    yield 'keyword substitution: %s\n' % (rcsfile.expand or 'kv')
+    yield 'total revisions: %d;\tselected revisions: %d\n' % (
+        len(rcsfile.revisions), len(selected))
+    yield 'description:\n'
+    if rcsfile.description:
+        yield rcsfile.description
+        if not rcsfile.description.endswith('\n'):
+            yield '\n'
+
+    # Same order as rlog: the trunk from the head down, then the
+    # branches starting from the oldest branch point, each from its
+    # newest revision
+    order = rcsfile.trunk()
+
+    def tree(rev):
+        chain = []
+        while rev:
+            chain.append(rev)
+            rev = rcsfile.revisions[rev].next
+        chain.reverse()
+        for rev in chain:
+            for first in rcsfile.revisions[rev].branches[::-1]:
+                order.extend(rcsfile.branchRevisions(rev_branch(first)))
+                tree(first)
+
+    tree(rcsfile.head)
+
+    for revision in order:
+        if not selected.has_key(revision):
+            continue
+        rev = rcsfile.revisions[revision]
+        yield '----------------------------\n'
+        yield 'revision %s\n' % revision
+        info = 'date: %s;  author: %s;  state: %s;' % (rev.getDate(),
+                                                       rev.author, rev.state)
+        lines = rcsfile.getLinesCount(revision)
+        if lines is not None:
+            info += '  lines: +%d -%d' % lines
+        yield info + '\n'
+        if rev.branches:
+            yield 'branches:  %s;\n' % ';  '.join(
+                [rev_branch(b) for b in rev.branches])
+        log = rev.log or '*** empty log message ***\n'
+        yield log
+        if not log.endswith('\n'):
+            yield '\n'
+    yield '=' * 77 + '\n'
+
+
+def rcs_path(root, name):
+    """
+    Return the pathname of the ``,v`` file of the entry `name` under the
+    repository directory `root`, looking in the ``Attic`` too, or None.
+    """
+
+    from os.path import join, split, exists
+
+    path = join(root, name + ',v')
+    if exists(path):
+        return path
+    dir, base = split(name)
+    path = join(root, dir, 'Attic', base + ',v')
+    if exists(path):
+        return path
+    return None
+
+
+def rlog(root, module, revisions=None, default_branch=False, after=None):
+    """
+    Yield the lines ``cvs rlog`` would print about the `module` in the
+    local repository at `root`.
+    """
+
+    from os import listdir
+    from os.path import join, isdir
+
+    def walk(dir, name):
+        yield 'cvs rlog: Logging %s\n' % name
+
+        files = {}
+        subdirs = []
+        attic = join(dir, 'Attic')
+        if isdir(attic):
+            for fname in listdir(attic):
+                if fname.endswith(',v'):
+                    files[fname] = join(attic, fname)
+        for fname in listdir(dir):
+            path = join(dir, fname)
+            if fname.endswith(',v'):
+                files[fname] = path
+            elif fname not in ('Attic', 'CVS') and isdir(path):
+                subdirs.append(fname)
+
+        fnames = files.keys()
+        fnames.sort()
+        for fname in fnames:
+            for line in rlog_file(RcsFile(files[fname]), revisions,
+                                  default_branch, after):
+                yield line
+
+        subdirs.sort()
+        for subdir in subdirs:
+            for line in walk(join(dir, subdir), name + '/' + subdir):
+                yield line
+
+    return walk(join(root, module), module)
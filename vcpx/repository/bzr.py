@@ -195,6 +195,8 @@ class BzrWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
             self.ignored.append(file)
             self.ignored.append(file+'.old')
             self.ignored.append(file+'.journal')
+            self.ignored.append(file+'-journal')
+            self.ignored.append(file+'-wal')
 
         if version_info > (0,9):
             add_runtime_ignores(self.ignored)
@@ -205,15 +207,44 @@ class BzrWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
     #############################
     ## UpdatableSourceWorkingDir
 
+    REVISIONS_BATCH = 100
+    """Number of revisions loaded at once when collecting the changesets."""
+
     def _changesetFromRevision(self, branch, revision_id):
         """
         Generate changeset for the given Bzr revision
         """
+
+        repository = branch.repository
+        revision = repository.get_revision(revision_id)
+        deltatree = repository.get_revision_delta(revision_id)
+        return self._changesetFromDelta(revision, deltatree)
+
+    def _changesetsFromRevisions(self, branch, revision_ids):
+        """
+        Generate the changesets for the given Bzr revisions, loading
+        the revisions and their deltas in batches, without walking the
+        history of the branch for each of them.
+
+        The branch must be locked by the caller.
+        """
+
+        repository = branch.repository
+        for i in range(0, len(revision_ids), self.REVISIONS_BATCH):
+            revisions = repository.get_revisions(
+                revision_ids[i:i+self.REVISIONS_BATCH])
+            deltas = repository.get_deltas_for_revisions(revisions)
+            for revision, deltatree in zip(revisions, deltas):
+                yield self._changesetFromDelta(revision, deltatree)
+
+    def _changesetFromDelta(self, revision, deltatree):
+        """
+        Generate changeset for the given Bzr revision and its delta
+        """
+
         from datetime import datetime
         from vcpx.tzinfo import FixedOffset, UTC
 
-        revision = branch.repository.get_revision(revision_id)
-        deltatree = branch.get_revision_delta(branch.revision_id_to_revno(revision_id))
         entries = []
 
         for delta in deltatree.renamed:
@@ -275,8 +306,9 @@ class BzrWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
 
                 self.log.info("Collecting %d missing changesets", len(revisions))
 
-                for id, revision in revisions:
-                    yield self._changesetFromRevision(parent_branch, revision)
+                for changeset in self._changesetsFromRevisions(
+                    parent_branch, [revision for id, revision in revisions]):
+                    yield changeset
             except:
                 parent_branch.unlock()
                 raise
@@ -192,4 +192,8 @@ class CgWorkingDir(SynchronizableTargetWorkingDir):
             ignore.write('\n')
             ignore.write(sfrelname+'.journal')
             ignore.write('\n')
+            ignore.write(sfrelname+'-journal')
+            ignore.write('\n')
+            ignore.write(sfrelname+'-wal')
+            ignore.write('\n')
         ignore.close()
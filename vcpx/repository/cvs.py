@@ -24,6 +24,29 @@ class CvsRepository(CvspsRepository):
 
         tmc = project.config.get(self.name, 'trim-module-components', '0')
         self.trim_module_components = int(tmc)
+        self.rcs_direct = project.config.get(self.name, 'rcs-direct', False)
+
+    def _validateConfiguration(self):
+        from os.path import isdir, join
+
+        CvspsRepository._validateConfiguration(self)
+
+        self.rcs_root = None
+        """The local directory containing the RCS files of the module."""
+
+        if self.rcs_direct:
+            if self.repository.startswith(':local:'):
+                path = self.repository[7:]
+            elif self.repository.startswith('/'):
+                path = self.repository
+            else:
+                path = None
+            if path is None or not isdir(join(path, self.module)):
+                self.log.warning("Ignoring rcs-direct in %r: %r is not a "
+                                 "module of a local repository", self.name,
+                                 self.module)
+            else:
+                self.rcs_root = path
 
 
 def normalize_cvs_rev(rev):
@@ -109,6 +132,21 @@ def changesets_from_cvslog(log, module, branch=None,
         from datetime import timedelta
         threshold = timedelta(seconds=180)
 
+    # The entries of the last changeset are indexed by name, keeping
+    # the set of their action kinds and the first deletion, so that the
+    # checks below do not need to scan them over and over.
+    def index(entry, kinds, deleted):
+        kinds.setdefault(entry.name, {})[entry.action_kind] = True
+        if entry.action_kind == entry.DELETED and not entry.name in deleted:
+            deleted[entry.name] = entry
+
+    def conflicts(cs, kinds):
+        for e in cs.entries:
+            for kind in kinds.get(e.name, ()):
+                if kind <> e.action_kind:
+                    return True
+        return False
+
     # Loop over collected changesets, and collapse those with same author,
     # same changelog and that were committed within a threshold one from the
     # other. If they have entries in common, keep them separated. Special
@@ -119,21 +157,13 @@ def changesets_from_cvslog(log, module, branch=None,
         if (last and last.author == cs.author and last.log == cs.log and
             abs(lastts - cs.date) < threshold and
             not last.tags and
-            not [e for e in cs.entries
-                 if e.name in [n.name for n in last.entries
-                               if n.action_kind <> e.action_kind]]):
+            not conflicts(cs, kinds)):
             for e in cs.entries:
-                if e.action_kind == e.DELETED:
-                    doubledelete = False
-                    for n in last.entries:
-                        if n.name == e.name and n.action_kind == n.DELETED:
-                            doubledelete = True
-                            n.new_revision = e.new_revision
-                            break
-                    if not doubledelete:
-                        last.entries.append(e)
+                if e.action_kind == e.DELETED and e.name in deleted:
+                    deleted[e.name].new_revision = e.new_revision
                 else:
                     last.entries.append(e)
+                    index(e, kinds, deleted)
             last.tags = cs.tags
             if lastts < cs.date:
                 lastts = cs.date
@@ -143,6 +173,10 @@ def changesets_from_cvslog(log, module, branch=None,
                 yield last
             last = cs
             lastts = cs.date
+            kinds = {}
+            deleted = {}
+            for e in cs.entries:
+                index(e, kinds, deleted)
 
     if last:
         yield last
@@ -193,6 +227,9 @@ class ChangeSetCollector(object):
         self.changesets = {}
         """The dictionary mapping (date, author, log) to each entry."""
 
+        self.__entries = {}
+        """The entries of each changeset, indexed by their name."""
+
         self.cvslog = log
         """The log to be parsed."""
 
@@ -228,15 +265,16 @@ class ChangeSetCollector(object):
         key = (timestamp, author, changelog)
         if self.changesets.has_key(key):
             cs = self.changesets[key]
-            for e in cs.entries:
-                if e.name == entry:
-                    return e
-            return cs.addEntry(entry, revision)
+            names = self.__entries[key]
+            if names.has_key(entry):
+                return names[entry]
         else:
             cs = Changeset(_getGlobalCVSRevision(timestamp, author),
                            timestamp, author, changelog)
             self.changesets[key] = cs
-            return cs.addEntry(entry, revision)
+            names = self.__entries[key] = {}
+        e = names[entry] = cs.addEntry(entry, revision)
+        return e
 
     def __readline(self, lookahead=False):
         """
@@ -577,10 +615,12 @@ class CvsWorkingDir(CvspsWorkingDir):
     CVS commits.
     """
 
+    def __init__(self, repository):
+        CvspsWorkingDir.__init__(self, repository)
+        self.__rcsfiles = {}
+
     def _getUpstreamChangesets(self, sincerev):
         from os.path import join, exists
-        from time import sleep
-
         from codecs import getreader
 
         try:
@@ -601,7 +641,11 @@ class CvsWorkingDir(CvspsWorkingDir):
             if tag[0] == 'T':
                 branch=tag[1:-1]
 
-        cmd = self.repository.command("-f", "-d", "%(repository)s", "rlog")
+        # What to ask to rlog: the -r revisions, the -b flag and
+        # the -d lower date limit
+        revisions = None
+        default_branch = False
+        after = None
 
         if not sincerev or sincerev in ("INITIAL", "HEAD"):
             # We are bootstrapping, trying to collimate the actual
@@ -610,43 +654,73 @@ class CvsWorkingDir(CvspsWorkingDir):
             since = None
             if sincerev == "HEAD":
                 if branch and branch<>'HEAD':
-                    cmd.append("-r%(branch)s.")
+                    revisions = branch + '.'
                 else:
-                    cmd.append("-rHEAD:HEAD")
+                    revisions = 'HEAD:HEAD'
             else:
-                cmd.append("-r:HEAD")
-                if not branch:
-                    cmd.append("-b")
+                revisions = ':HEAD'
+                default_branch = not branch
         elif ' by ' in sincerev:
             since, author = _splitGlobalCVSRevision(sincerev)
-            cmd.extend(["-d", "%(since)s UTC<"])
+            after = since
             if branch:
-                cmd.append("-r%(branch)s")
+                revisions = branch
             else:
-                cmd.append("-b")
+                default_branch = True
         elif sincerev[0] in '0123456789':
-            since = sincerev
-            cmd.extend(["-d", "%(since)s UTC<"])
+            since = after = sincerev
         elif ' ' in sincerev:
             branch, since = sincerev.split(' ', 1)
-            if since.strip() == 'INITIAL':
-                cmd.extend(["-r%(branch)s"])
-            else:
-                cmd.extend(["-d", "%(since)s UTC<", "-r%(branch)s"])
+            revisions = branch
+            if since.strip() <> 'INITIAL':
+                after = since
         else:
             # Then we assume it's a tag
             branch = sincerev
             since = None
-            cmd.extend(["-r:%(branch)s"])
+            revisions = ':' + branch
+
+        if self.repository.rcs_root is not None:
+            from cStringIO import StringIO
+            from vcpx.rcs import rlog
+
+            log = StringIO(''.join(rlog(self.repository.rcs_root,
+                                        self.repository.module,
+                                        revisions, default_branch, after)))
+        else:
+            log = self.__rlog(revisions, default_branch, after)
+
+        log = reader(log, self.repository.encoding_errors_policy)
+        return changesets_from_cvslog(log, self.repository.module,
+                                      branch,
+                                      CvsEntries(self.repository.rootdir),
+                                      since,
+                                      self.repository.changeset_threshold,
+                                      self.repository.trim_module_components)
+
+    def __rlog(self, revisions, default_branch, after):
+        """
+        Execute ``cvs rlog`` on the module, returning its output.
+        """
+
+        from time import sleep
+
+        cmd = self.repository.command("-f", "-d", "%(repository)s", "rlog")
+        if after:
+            cmd.extend(["-d", "%(since)s UTC<"])
+        if revisions:
+            cmd.append("-r%(revisions)s")
+        if default_branch:
+            cmd.append("-b")
 
         cvslog = ExternalCommand(command=cmd)
 
         retry = 0
         while True:
             log = cvslog.execute(self.repository.module, stdout=PIPE,
-                                 stderr=STDOUT, since=since,
+                                 stderr=STDOUT, since=after,
                                  repository=self.repository.repository,
-                                 branch=branch or 'HEAD', TZ='UTC0')[0]
+                                 revisions=revisions, TZ='UTC0')[0]
             if cvslog.exit_status:
                 retry += 1
                 if retry>3:
@@ -664,13 +738,82 @@ class CvsWorkingDir(CvspsWorkingDir):
             raise GetUpstreamChangesetsFailure(
                 "%s returned status %d" % (str(cvslog), cvslog.exit_status))
 
-        log = reader(log, self.repository.encoding_errors_policy)
-        return changesets_from_cvslog(log, self.repository.module,
-                                      branch,
-                                      CvsEntries(self.repository.rootdir),
-                                      since,
-                                      self.repository.changeset_threshold,
-                                      self.repository.trim_module_components)
+        return log
+
+    def __getRcsFile(self, name):
+        """
+        Return the parsed RCS file of the entry `name`, or None if the
+        repository does not know it.
+        """
+
+        from os import stat
+        from os.path import join
+        from vcpx.rcs import RcsFile, rcs_path
+
+        path = rcs_path(join(self.repository.rcs_root, self.repository.module),
+                        name)
+        if path is None:
+            return None
+
+        mtime = stat(path).st_mtime
+        cached = self.__rcsfiles.get(path)
+        if cached is None or cached[0] <> mtime:
+            # Keep memory bounded, as each file caches its texts
+            if len(self.__rcsfiles) >= 64:
+                self.__rcsfiles.clear()
+            cached = self.__rcsfiles[path] = (mtime, RcsFile(path))
+        return cached[1]
+
+    def _updateEntries(self, names, revision):
+        """
+        With ``rcs-direct``, extract the entries straight from the
+        RCS files, otherwise use ``cvs update``.
+        """
+
+        if self.repository.rcs_root is None:
+            return CvspsWorkingDir._updateEntries(self, names, revision)
+
+        from os import chmod, remove, stat
+        from os.path import join, exists, split
+        from time import asctime, gmtime
+
+        basedir = self.repository.basedir
+        changes = {}
+        for name in names:
+            rcsfile = self.__getRcsFile(name)
+            if rcsfile is None or not rcsfile.revisions.has_key(revision):
+                self.log.warning("Cannot find revision %s of %s in the "
+                                 "repository", revision, name)
+                continue
+
+            dir, base = split(name)
+            path = join(basedir, name)
+            if rcsfile.revisions[revision].state == 'dead':
+                if exists(path):
+                    remove(path)
+                changes.setdefault(dir, {})[base] = None
+                continue
+
+            mode = rcsfile.expand or 'kv'
+            if self.repository.freeze_keywords and mode not in ('b', 'o'):
+                mode = 'k'
+            f = open(path, 'wb')
+            f.write(rcsfile.checkout(revision, mode))
+            f.close()
+
+            # Carry the executable bits of the RCS file, as CVS does
+            st = stat(path)
+            xbits = stat(rcsfile.path).st_mode & 0111
+            chmod(path, (st.st_mode & 07666) | xbits)
+
+            kflag = mode <> 'kv' and '-k' + mode or ''
+            changes.setdefault(dir, {})[base] = '/%s/%s/%s/%s/T%s' % (
+                base, revision, asctime(gmtime(st.st_mtime)), kflag, revision)
+
+        for dir, dirchanges in changes.items():
+            rewrite_cvs_entries(join(basedir, dir, 'CVS'), dirchanges)
+
+        self.log.debug("%s extracted at %s", ','.join(names), revision)
 
     def _checkoutUpstreamRevision(self, revision):
         """
@@ -822,3 +965,158 @@ class CvsEntries(object):
         """Return True is this directory does not contain any subentry."""
 
         return not self.files and not self.directories
+
+
+def rewrite_cvs_entries(cvsdir, changes):
+    """
+    Update the ``Entries`` file in `cvsdir`, replacing the lines of
+    the files in the `changes` dictionary, or removing them when the
+    new line is None.
+    """
+
+    from os import rename
+    from os.path import join, exists
+
+    efn = join(cvsdir, 'Entries')
+    lines = []
+    if exists(efn):
+        f = open(efn)
+        for line in f.readlines():
+            if not (line.startswith('/') and
+                    changes.has_key(line.split('/')[1])):
+                lines.append(line)
+        f.close()
+    for line in changes.values():
+        if line is not None:
+            lines.append(line + '\n')
+
+    # Like CVS, write a new file and rename it over the old one
+    backup = join(cvsdir, 'Entries.Backup')
+    f = open(backup, 'w')
+    f.writelines(lines)
+    f.close()
+    rename(backup, efn)
+
+
+class CvsEntriesCache(object):
+    """Incrementally maintained index of the `CvsEntry` of a working dir.
+
+       Building a `CvsEntries` parses every ``CVS/Entries`` file of
+       the working copy: this keeps the parsed entries around instead,
+       keyed on their full path, and re-parses only the directories
+       whose ``CVS/Entries`` changed since the last `refresh()`."""
+
+    __slots__ = ('root', 'files', 'directories')
+
+    def __init__(self, root):
+        self.root = root
+        """The working directory."""
+
+        self.files = {}
+        """Dict of `CvsEntry`, keyed on the full path of each file."""
+
+        self.directories = {}
+        """Dict of (signature, files, subdirectories) tuples, keyed on
+           the path of each directory under revision control."""
+
+        self.refresh()
+
+    def __str__(self):
+        return "CvsEntriesCache(%d files, %d directories)" % (
+            len(self.files), len(self.directories))
+
+    def refresh(self):
+        """Bring the index up to date with the working directory."""
+
+        seen = {}
+        self.__refresh('', seen)
+        for dir in self.directories.keys():
+            if not seen.has_key(dir):
+                self.__forget(dir)
+
+    def __signature(self, dir):
+        """Return what identifies the current state of a directory,
+           or None if it is not under revision control."""
+
+        from os import stat
+        from os.path import join
+
+        absdir = join(self.root, dir)
+        try:
+            # CVS rewrites the Entries file thru a rename: besides its
+            # mtime, look at its inode to spot changes happened within
+            # the same second.  The directory mtime changes when a
+            # subdirectory appears.
+            est = stat(join(absdir, 'CVS', 'Entries'))
+            dst = stat(absdir)
+        except OSError:
+            return None
+        return (est.st_mtime, est.st_size, est.st_ino, dst.st_mtime)
+
+    def __refresh(self, dir, seen):
+        """Recursively update the entries of `dir` and its subdirectories."""
+
+        signature = self.__signature(dir)
+        if signature is None:
+            return
+
+        seen[dir] = True
+
+        cached = self.directories.get(dir)
+        if cached is not None and cached[0] == signature:
+            subdirs = cached[2]
+        else:
+            if cached is not None:
+                self.__forget(dir)
+            subdirs = self.__parse(dir, signature)
+
+        for subdir in subdirs:
+            if dir:
+                subdir = dir + '/' + subdir
+            self.__refresh(subdir, seen)
+
+    def __parse(self, dir, signature):
+        """Parse the CVS/Entries of `dir`, returning its subdirectories."""
+
+        from os.path import join, exists
+        from os import listdir
+
+        absdir = join(self.root, dir)
+        prefix = dir and dir + '/'
+        files = []
+        subdirs = []
+
+        for entry in open(join(absdir, 'CVS', 'Entries')).readlines():
+            entry = entry[:-1]
+
+            if entry.startswith('/'):
+                e = CvsEntry(entry)
+                files.append(e.filename)
+                self.files[prefix + e.filename] = e
+            elif entry.startswith('D/'):
+                subdirs.append(entry.split('/')[1])
+
+        # Sometimes the Entries file does not contain the directories:
+        # crawl the current directory looking for missing ones.
+
+        for entry in listdir(absdir):
+            if entry == '.svn' or entry in subdirs:
+                continue
+            if exists(join(absdir, entry, 'CVS', 'Entries')):
+                subdirs.append(entry)
+
+        self.directories[dir] = (signature, files, subdirs)
+        return subdirs
+
+    def __forget(self, dir):
+        """Drop the entries of `dir` from the index."""
+
+        signature, files, subdirs = self.directories.pop(dir)
+        prefix = dir and dir + '/'
+        for filename in files:
+            self.files.pop(prefix + filename, None)
+
+    def getFileInfo(self, fpath):
+        """Fetch the info about a path, if known.  Otherwise return None."""
+
+        return self.files.get(fpath)
@@ -20,6 +20,7 @@ from vcpx.source import UpdatableSourceWorkingDir, ChangesetApplicationFailure,
                         InvocationError
 from vcpx.target import SynchronizableTargetWorkingDir, TargetInitializationFailure
 from vcpx.tzinfo import UTC
+from vcpx.workdir import WorkingDir
 
 
 class EmptyRepositoriesFoolsMe(TailorException):
@@ -41,6 +42,7 @@ class CvspsRepository(Repository):
         self.__cvsps = project.config.get(self.name, 'cvsps-command', 'cvsps')
         self.tag_entries = project.config.get(self.name, 'tag-entries', 'True')
         self.freeze_keywords = project.config.get(self.name, 'freeze-keywords', 'False')
+        self.batch_updates = project.config.get(self.name, 'batch-updates', False)
         threshold = project.config.get(self.name, 'changeset-threshold', '180')
         self.changeset_threshold = timedelta(seconds=float(threshold))
 
@@ -228,6 +230,26 @@ class CvspsWorkingDir(UpdatableSourceWorkingDir,
     changes that would otherwise be sparsed, as CVS is file-centric.
     """
 
+    def __init__(self, repository):
+        WorkingDir.__init__(self, repository)
+        self.__entries = None
+        self.__session = None
+        self.__batch_updates = repository.batch_updates
+
+    def __getEntries(self):
+        """
+        Return the index of the entries in the working copy, updated
+        with whatever changed since the last call.
+        """
+
+        from vcpx.repository.cvs import CvsEntriesCache
+
+        if self.__entries is None:
+            self.__entries = CvsEntriesCache(self.repository.basedir)
+        else:
+            self.__entries.refresh()
+        return self.__entries
+
     ## UpdatableSourceWorkingDir
 
     def _getUpstreamChangesets(self, sincerev=None):
@@ -252,7 +274,8 @@ class CvspsWorkingDir(UpdatableSourceWorkingDir,
                                       "--root", self.repository.repository,
                                       cvsps=True)
         cvsps = ExternalCommand(command=cmd)
-        log = cvsps.execute(self.repository.module, stdout=PIPE, TZ='UTC0')[0]
+        log = cvsps.execute(self.repository.module, stdout=PIPE, TZ='UTC0',
+                            stream=True)[0]
 
         for cs in changesets_from_cvsps(log, sincerev):
             yield cs
@@ -278,10 +301,9 @@ class CvspsWorkingDir(UpdatableSourceWorkingDir,
     def _applyChangeset(self, changeset):
         from os.path import join, exists, split
         from shutil import rmtree
-        from time import sleep
         from vcpx.repository.cvs import CvsEntries, compare_cvs_revs
 
-        entries = CvsEntries(self.repository.basedir)
+        entries = self.__getEntries()
 
         # Collect added and deleted directories
         addeddirs = []
@@ -342,36 +364,13 @@ class CvspsWorkingDir(UpdatableSourceWorkingDir,
         revs = reventries.keys()
         revs.sort(compare_cvs_revs)
 
-        cmd = self.repository.command("-f", "-d", "%(repository)s",
-                                      "-q", "update", "-d", "-P",
-                                      "-r", "%(revision)s")
-        if self.repository.freeze_keywords:
-            cmd.append('-kk')
-        cvsup = ExternalCommand(cwd=self.repository.basedir, command=cmd)
-        for rev in revs:
-            names = reventries[rev]
-            retry = 0
-            while True:
-                cvsup.execute(names, repository=self.repository.repository,
-                              revision=rev)
-                if cvsup.exit_status:
-                    retry += 1
-                    if retry>3:
-                        break
-                    delay = 2**retry
-                    self.log.warning("%s returned status %s, "
-                                     "retrying in %d seconds...",
-                                     str(cvsup), cvsup.exit_status, delay)
-                    sleep(retry)
-                else:
-                    break
-
-            if cvsup.exit_status:
-                raise ChangesetApplicationFailure(
-                    "%s returned status %s" % (str(cvsup),
-                                               cvsup.exit_status))
-
-            self.log.debug("%s updated to %s", ','.join(names), e.new_revision)
+        try:
+            for rev in revs:
+                self._updateEntries(reventries[rev], rev)
+        finally:
+            if self.__session is not None:
+                self.__session.close()
+                self.__session = None
 
         # Fake up ADD and DEL events for the directories implicitly
         # added/removed, so that the replayer gets their name.
@@ -408,6 +407,97 @@ class CvspsWorkingDir(UpdatableSourceWorkingDir,
                                  "longer knows about it.", entry.name)
                 changeset.entries.remove(entry)
 
+    def __updateThruSession(self, names, revision):
+        """
+        Update the entries within the ``cvs server`` session shared by
+        all the revisions of the changeset, opening it when needed.
+
+        Return False if the session cannot be established.
+        """
+
+        from vcpx.cvsclient import CvsServerSession, CvsServerError, \
+             CvsServerClosed
+
+        options = ['-d', '-P']
+        if self.repository.freeze_keywords:
+            options.append('-kk')
+
+        retry = 0
+        while True:
+            if self.__session is None:
+                try:
+                    self.__session = CvsServerSession(
+                        self.repository.repository, self.repository.basedir,
+                        self.repository.EXECUTABLE)
+                except (CvsServerError, OSError), e:
+                    self.log.warning("Cannot talk with the CVS server, "
+                                     "falling back to cvs update: %s", e)
+                    self.__batch_updates = False
+                    return False
+            try:
+                self.__session.update(names, revision, options)
+            except CvsServerClosed:
+                # Some servers may accept a single command per
+                # connection: reconnect, at worst once per revision
+                try:
+                    self.__session.close()
+                except IOError:
+                    pass
+                self.__session = None
+                retry += 1
+                if retry > 1:
+                    raise ChangesetApplicationFailure(
+                        "The CVS server closed the connection while "
+                        "updating %s to %s" % (','.join(names), revision))
+            except CvsServerError, e:
+                raise ChangesetApplicationFailure(
+                    "The CVS server failed updating %s to %s: %s" % (
+                    ','.join(names), revision, e))
+            else:
+                break
+
+        self.log.debug("%s updated to %s", ','.join(names), revision)
+        return True
+
+    def _updateEntries(self, names, revision):
+        """
+        Bring the given entries to the specified `revision`.
+        """
+
+        from time import sleep
+
+        if self.__batch_updates and self.__updateThruSession(names, revision):
+            return
+
+        cmd = self.repository.command("-f", "-d", "%(repository)s",
+                                      "-q", "update", "-d", "-P",
+                                      "-r", "%(revision)s")
+        if self.repository.freeze_keywords:
+            cmd.append('-kk')
+        cvsup = ExternalCommand(cwd=self.repository.basedir, command=cmd)
+        retry = 0
+        while True:
+            cvsup.execute(names, repository=self.repository.repository,
+                          revision=revision)
+            if cvsup.exit_status:
+                retry += 1
+                if retry>3:
+                    break
+                delay = 2**retry
+                self.log.warning("%s returned status %s, "
+                                 "retrying in %d seconds...",
+                                 str(cvsup), cvsup.exit_status, delay)
+                sleep(retry)
+            else:
+                break
+
+        if cvsup.exit_status:
+            raise ChangesetApplicationFailure(
+                "%s returned status %s" % (str(cvsup),
+                                           cvsup.exit_status))
+
+        self.log.debug("%s updated to %s", ','.join(names), revision)
+
     def _checkoutUpstreamRevision(self, revision):
         """
         Concretely do the checkout of the upstream sources. Use
@@ -124,6 +124,8 @@ class DarcsRepository(Repository):
             ignored.append('^%s$' % re.escape(sfrelname))
             ignored.append('^%s$' % re.escape(sfrelname+'.old'))
             ignored.append('^%s$' % re.escape(sfrelname+'.journal'))
+            ignored.append('^%s$' % re.escape(sfrelname+'-journal'))
+            ignored.append('^%s$' % re.escape(sfrelname+'-wal'))
 
         boring = open(boringname, 'w')
         boring.write('\n'.join(ignored))
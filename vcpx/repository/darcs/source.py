@@ -243,11 +243,11 @@ def changesets_from_darcschanges_unsafe(changes, unidiff=False, repodir=None,
     eventually be fixed and this function can be renamed
     changesets_from_darcschanges.
     """
-    from xml.sax import make_parser
-    from xml.sax.handler import ContentHandler, ErrorHandler
     from datetime import datetime
+    from time import strptime
+    from xml.parsers.expat import ParserCreate
 
-    class DarcsXMLChangesHandler(ContentHandler):
+    class DarcsXMLChangesHandler(object):
         def __init__(self):
             self.changesets = []
             self.current = None
@@ -264,15 +264,16 @@ def changesets_from_darcschanges_unsafe(changes, unidiff=False, repodir=None,
                 self.current = {}
                 self.current['author'] = attributes['author']
                 date = attributes['date']
-                from time import strptime
-                try:
+                if len(date) == 14 and date.isdigit():
                     # 20040619130027
-                    timestamp = datetime(*strptime(date, '%Y%m%d%H%M%S')[:6])
-                except ValueError:
+                    timestamp = datetime(int(date[:4]), int(date[4:6]),
+                                         int(date[6:8]), int(date[8:10]),
+                                         int(date[10:12]), int(date[12:]),
+                                         0, UTC)
+                else:
                     # Old darcs patches use the form Sun Oct 20 20:01:05 EDT 2002
                     timestamp = datetime(*strptime(date[:19] + date[-5:], '%a %b %d %H:%M:%S %Y')[:6])
-
-                timestamp = timestamp.replace(tzinfo=UTC) # not true for the ValueError case, but oh well
+                    timestamp = timestamp.replace(tzinfo=UTC) # not true, but oh well
 
                 self.current['date'] = timestamp
                 self.current['comment'] = ''
@@ -333,10 +334,14 @@ def changesets_from_darcschanges_unsafe(changes, unidiff=False, repodir=None,
         def characters(self, data):
             self.current_field.append(data)
 
-    parser = make_parser()
+    # Use expat directly, without the overhead of the SAX layer,
+    # collecting the text of each element in a single chunk
+    parser = ParserCreate()
+    parser.buffer_text = True
     handler = DarcsXMLChangesHandler()
-    parser.setContentHandler(handler)
-    parser.setErrorHandler(ErrorHandler())
+    parser.StartElementHandler = handler.startElement
+    parser.EndElementHandler = handler.endElement
+    parser.CharacterDataHandler = handler.characters
 
     def fixup_badchars(s, map):
         if not map:
@@ -347,12 +352,12 @@ def changesets_from_darcschanges_unsafe(changes, unidiff=False, repodir=None,
 
     chunk = fixup_badchars(changes.read(chunksize), replace_badchars)
     while chunk:
-        parser.feed(chunk)
+        parser.Parse(chunk)
         for cs in handler.changesets:
             yield cs
         handler.changesets = []
         chunk = fixup_badchars(changes.read(chunksize), replace_badchars)
-    parser.close()
+    parser.Parse('', True)
     for cs in handler.changesets:
         yield cs
 
@@ -369,10 +374,13 @@ class DarcsSourceWorkingDir(UpdatableSourceWorkingDir):
         Do the actual work of fetching the upstream changeset.
         """
 
-        # Use the newer pull --xml-output, if possible
+        # Use the newer pull --xml-output, if possible: with --summary
+        # it carries also the entries of each patch, so that there is
+        # no need to ask them to darcs when applying the changesets
         use_xml = False
         if self.repository.darcs_version.startswith('2'):
-            cmd = self.repository.command("pull", "--dry-run", "--xml-output")
+            cmd = self.repository.command("pull", "--dry-run", "--xml-output",
+                                          "--summary")
             pull = ExternalCommand(cwd=self.repository.basedir, command=cmd)
             output,error = pull.execute(self.repository.repository,
                                         stdout=PIPE, stderr=PIPE, TZ='UTC0')
@@ -434,7 +442,17 @@ class DarcsSourceWorkingDir(UpdatableSourceWorkingDir):
 
             badchars = self.repository.replace_badchars
 
-            return changesets_from_darcschanges(xml, replace_badchars=badchars)
+            return self._summarizedChangesets(
+                changesets_from_darcschanges(xml, replace_badchars=badchars))
+
+    def _summarizedChangesets(self, changesets):
+        """
+        Mark the `changesets` as already carrying their entries.
+        """
+
+        for cs in changesets:
+            cs.darcs_summary = True
+            yield cs
 
     def _parseDarcsPull(self, output):
         """Process 'darcs pull' output to Changesets.
@@ -568,7 +586,11 @@ class DarcsSourceWorkingDir(UpdatableSourceWorkingDir):
                 conflicts.extend(files)
             line = output.readline()
 
-        # Complete the changeset with its entries
+        # Complete the changeset with its entries, unless they were
+        # already collected by _getUpstreamChangesets()
+
+        if getattr(changeset, 'darcs_summary', False):
+            return conflicts
 
         cmd = self.repository.command("changes", selector, revtag,
                                       "--xml-output", "--summ")
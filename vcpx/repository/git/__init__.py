@@ -30,6 +30,9 @@ class GitRepository(Repository):
         self.parent_repo = project.config.get(self.name, 'parent-repo')
         self.branch_point = project.config.get(self.name, 'branchpoint', 'HEAD')
         self.branch_name = project.config.get(self.name, 'branch')
+        self.fast_import = project.config.get(self.name, 'fast-import', False)
+        self.fast_import_checkpoint = int(project.config.get(
+            self.name, 'fast-import-checkpoint', '100'))
         if self.branch_name:
             self.branch_name = 'refs/heads/' + self.branch_name
 
@@ -20,6 +20,104 @@ from vcpx.source import ChangesetApplicationFailure
 from vcpx.tzinfo import FixedOffset
 
 
+def split_nul_terminated(log, chunksize=2**15):
+    """
+    Iterate over the NUL terminated tokens read from the `log` stream.
+    """
+
+    rest = ''
+    chunk = log.read(chunksize)
+    while chunk:
+        tokens = (rest + chunk).split('\0')
+        rest = tokens.pop()
+        for token in tokens:
+            yield token
+        chunk = log.read(chunksize)
+    if rest:
+        yield rest
+
+
+def changesets_from_gitlog(log, tags=None):
+    """
+    Parse the output of ``git log --raw -M -z -m --pretty=raw``.
+
+    Each commit is followed by its differences against each parent:
+    only those against the first one are considered.  `tags` may map a
+    revision to the list of its tags.
+    """
+
+    from datetime import datetime
+    from vcpx.changes import Changeset, ChangesetEntry
+
+    action_map = {'A': ChangesetEntry.ADDED, 'D': ChangesetEntry.DELETED,
+                  'M': ChangesetEntry.UPDATED, 'T': ChangesetEntry.UPDATED,
+                  'R': ChangesetEntry.RENAMED}
+
+    def parse_header(header):
+        revision = None
+        user = Changeset.ANONYMOUS_USER
+        loglines = []
+        date = None
+        for line in header.split('\n'):
+            if line.startswith('commit '):
+                # On merges this is "commit REV (from PARENT)"
+                revision = line.split(' ')[1]
+            if line.startswith('author'):
+                author_fields = line.split(' ')[1:]
+                tz = int(author_fields.pop())
+                dt = int(author_fields.pop())
+                user = ' '.join(author_fields)
+                tzsecs = abs(tz)
+                tzsecs = (tzsecs / 100 * 60 + tzsecs % 100) * 60
+                if tz < 0:
+                    tzsecs = -tzsecs
+                date = datetime.fromtimestamp(dt, FixedOffset(tzsecs/60))
+            if line.startswith('    '):
+                loglines.append(line.lstrip('    '))
+
+        message = '\n'.join(loglines)
+        cs = Changeset(revision, date, user, message)
+        if tags and revision in tags:
+            cs.tags = tags[revision]
+        return cs
+
+    changeset = None
+    tokens = split_nul_terminated(log)
+    for token in tokens:
+        if token.startswith('commit '):
+            # The header, possibly followed by the first raw diff line
+            pos = token.find('\n:')
+            if pos < 0:
+                header, token = token, ''
+            else:
+                header, token = token[:pos], token[pos+1:]
+            cs = parse_header(header)
+            if changeset is not None and cs.revision == changeset.revision:
+                # Differences against another parent of a merge
+                skip = True
+            else:
+                if changeset is not None:
+                    yield changeset
+                changeset = cs
+                skip = False
+
+        if token.startswith(':'):
+            state = token.split(' ').pop()
+            name = tokens.next()
+            if state[0] in 'RC':
+                old_name, name = name, tokens.next()
+            if skip:
+                continue
+            e = ChangesetEntry(name)
+            e.action_kind = action_map[state[0]]
+            if e.action_kind == ChangesetEntry.RENAMED:
+                e.old_name = old_name
+            changeset.entries.append(e)
+
+    if changeset is not None:
+        yield changeset
+
+
 class GitSourceWorkingDir(UpdatableSourceWorkingDir):
 
     def _checkoutUpstreamRevision(self, revision):
@@ -50,6 +148,25 @@ class GitSourceWorkingDir(UpdatableSourceWorkingDir):
 
         return self._changesetForRevision(rev)
 
+    def _changesetsFromLog(self, args, tags=None):
+        """
+        Parse the changesets selected by `args` out of a single
+        ``git log`` streamed to the parser.
+        """
+
+        from vcpx.repository.git import GitExternalCommand
+
+        cmd = self.repository.command('log', '--raw', '-M', '-z', '-m',
+                                      '--root', '--pretty=raw', *args)
+        gitlog = GitExternalCommand(self.repository, command=cmd,
+                                    cwd=self.repository.basedir)
+        log = gitlog.execute(stdout=PIPE, stream=True)[0]
+        for cs in changesets_from_gitlog(log, tags):
+            yield cs
+        log.close()
+        if gitlog.exit_status:
+            raise GetUpstreamChangesetsFailure(str(gitlog) + ' failed')
+
     def _getUpstreamChangesets(self, since):
         # Brute-force tag search
         from os import listdir
@@ -64,14 +181,8 @@ class GitSourceWorkingDir(UpdatableSourceWorkingDir):
 
         self.repository.runCommand(['fetch'], GetUpstreamChangesetsFailure, False)
 
-        revs = self.repository.runCommand(['rev-list', '^' + since, 'origin'],
-                                           GetUpstreamChangesetsFailure)[:-1]
-        revs.reverse()
-        for rev in revs:
-            cs = self._changesetForRevision(rev)
-            if rev in tags:
-                cs.tags = tags[rev]
-            yield cs
+        return self._changesetsFromLog(['--reverse', '^' + since, 'origin'],
+                                       tags)
 
     def _applyChangeset(self, changeset):
         out = self.repository.runCommand(['merge', '-n', '--no-commit', 'fastforward',
@@ -89,59 +200,7 @@ class GitSourceWorkingDir(UpdatableSourceWorkingDir):
         return conflicts
 
     def _changesetForRevision(self, revision):
-        from datetime import datetime
-        from vcpx.changes import Changeset, ChangesetEntry
-
-        action_map = {'A': ChangesetEntry.ADDED, 'D': ChangesetEntry.DELETED,
-                      'M': ChangesetEntry.UPDATED, 'R': ChangesetEntry.RENAMED}
-
-        # find parent
-        lines = self.repository.runCommand(['rev-list', '--pretty=raw', '--max-count=1', revision],
-                                            GetUpstreamChangesetsFailure)
-        parents = []
-        user = Changeset.ANONYMOUS_USER
-        loglines = []
-        date = None
-        for line in lines:
-            if line.startswith('parent'):
-                parents.append(line.split(' ').pop())
-            if line.startswith('author'):
-                author_fields = line.split(' ')[1:]
-                tz = int(author_fields.pop())
-                dt = int(author_fields.pop())
-                user = ' '.join(author_fields)
-                tzsecs = abs(tz)
-                tzsecs = (tzsecs / 100 * 60 + tzsecs % 100) * 60
-                if tz < 0:
-                    tzsecs = -tzsecs
-                date = datetime.fromtimestamp(dt, FixedOffset(tzsecs/60))
-            if line.startswith('    '):
-                loglines.append(line.lstrip('    '))
-
-        message = '\n'.join(loglines)
-        entries = []
-        cmd = ['diff-tree', '--root', '-r', '-M', '--name-status']
-        # haven't thought about merges yet...
-        if parents:
-            cmd.append(parents[0])
-        cmd.append(revision)
-        files = self.repository.runCommand(cmd, GetUpstreamChangesetsFailure)[:-1]
-        if not parents:
-            # git lets us know what it's diffing against if we omit parent
-            if len(files) > 0:
-                files.pop(0)
-        for line in files:
-            fields = line.split('\t')
-            state = fields.pop(0)
-            name = fields.pop()
-            e = ChangesetEntry(name)
-            e.action_kind = action_map[state[0]]
-            if e.action_kind == ChangesetEntry.RENAMED:
-                e.old_name = fields.pop()
-
-            entries.append(e)
-
-        return Changeset(revision, date, user, message, entries)
+        return list(self._changesetsFromLog(['--max-count=1', revision]))[0]
 
     def _getRev(self, revision):
         """ Return the git object corresponding to the symbolic revision """
@@ -25,7 +25,70 @@ class BranchpointFailure(TailorException):
     "Specified branchpoint not found in parent branch"
 
 
+def fast_import_path(path):
+    """
+    Quote `path` for the ``git fast-import`` stream, when needed.
+    """
+
+    if path.startswith('"') or '\n' in path:
+        path = '"%s"' % path.replace('\\', '\\\\').replace('"', '\\"') \
+               .replace('\n', '\\n')
+    return path
+
+
+def fast_import_identity(name, email, date):
+    """
+    Format an author, committer or tagger line value.
+    """
+
+    from calendar import timegm
+    from time import time
+
+    if date is None:
+        timestamp = int(time())
+        tz = '+0000'
+    else:
+        timestamp = timegm(date.utctimetuple())
+        tz = date.strftime('%z') or '+0000'
+    return '%s <%s> %d %s' % (name, email, timestamp, tz)
+
+
 class GitTargetWorkingDir(SynchronizableTargetWorkingDir):
+    """
+    The git target, using either the git porcelain for each commit or,
+    when the ``fast-import`` option is enabled, a single long running
+    ``git fast-import`` that receives all the commits of the session.
+
+    In the latter mode the various entry operations just remember which
+    paths are touched by the changeset, and the commit sends their
+    current content.  The index is brought up to date at the end.
+    """
+
+    _fast_import = None
+    """The running ``git fast-import`` process, if any."""
+
+    def _touchPathnames(self, names, subtree=False):
+        """
+        Remember the paths to be sent with the next fast-import commit.
+
+        When `subtree` is True and one of the names is a directory, its
+        whole content will be sent, as it happens for new or renamed
+        directories.
+        """
+
+        from os.path import normpath
+
+        touched = self.__dict__.setdefault('_touched', {})
+        for name in map(normpath, names):
+            touched[name] = touched.get(name) or subtree
+
+    def needsSubtreeEntries(self):
+        """
+        The fast-import commit sends the whole content of the added
+        directories by itself.
+        """
+
+        return not self.repository.fast_import
 
     def _addPathnames(self, names):
         """
@@ -34,6 +97,10 @@ class GitTargetWorkingDir(SynchronizableTargetWorkingDir):
 
         from os.path import join, isdir
 
+        if self.repository.fast_import:
+            self._touchPathnames(names, subtree=True)
+            return
+
         # Currently git does not handle directories at all, so filter
         # them out.
 
@@ -48,6 +115,10 @@ class GitTargetWorkingDir(SynchronizableTargetWorkingDir):
 
         from os.path import join, isdir
 
+        if self.repository.fast_import:
+            self._touchPathnames(names)
+            return
+
         # can we assume we don't have directories in the list ?  Nope.
 
         notdirs = [n for n in names if not isdir(join(self.repository.basedir, n))]
@@ -82,6 +153,10 @@ class GitTargetWorkingDir(SynchronizableTargetWorkingDir):
 
         from os import environ
 
+        if self.repository.fast_import:
+            self.__fastImportCommit(date, author, patchname, changelog)
+            return
+
         try:
             self.repository.runCommand(['status'])
         except Exception, e:
@@ -160,8 +235,311 @@ class GitTargetWorkingDir(SynchronizableTargetWorkingDir):
             else:
                 self.repository.runCommand(['update-ref', refname, commitid])
 
+    def __startFastImport(self):
+        """
+        Start the ``git fast-import`` process, and find out the branch
+        it should update and its current tip.
+        """
+
+        from os import environ
+        from vcpx.shwrap import Popen, PIPE
+        try:
+            from os import setsid
+        except ImportError:
+            setsid = None
+
+        if self.repository.branch_name:
+            refname = self.repository.branch_name
+        else:
+            refname = self.repository.runCommand(['symbolic-ref', 'HEAD'],
+                                                 ChangesetApplicationFailure)[0]
+
+        c = GitExternalCommand(self.repository, cwd=self.repository.basedir,
+                               command=self.repository.command(
+                                   'rev-parse', '--verify', '-q', refname))
+        out = c.execute(stdout=PIPE)[0]
+        if c.exit_status:
+            self.log.info("Doing initial commit")
+            parent = None
+        else:
+            parent = out.read().split('\n')[0]
+
+        # With --done an unexpected end of the stream, when tailor dies,
+        # leaves the branch at the last checkpoint, in agreement with the
+        # state file; a new session keeps it out of reach of the SIGINT
+        # sent by the terminal, so that an interrupted session can still
+        # close the stream cleanly.
+        cmd = self.repository.command('fast-import', '--quiet', '--done')
+        env = {}
+        env.update(environ)
+        env.update(self.repository.env)
+        self.log.info('Starting %s', ' '.join(cmd))
+        process = Popen(cmd, stdin=PIPE, stdout=PIPE, env=env,
+                        cwd=self.repository.basedir, preexec_fn=setsid)
+        self._fast_import = (process, refname, parent)
+        self._fast_import_commits = 0
+        self._fast_import_unchecked = 0
+        self._fast_import_tags = []
+
+    def __fastImportFiles(self):
+        """
+        Compute the file commands for the paths touched by the changeset.
+        """
+
+        from os import lstat, readlink, walk
+        from os.path import join, isdir, islink, isfile
+        from stat import S_IXUSR
+        from vcpx.dualwd import IGNORED_METADIRS
+
+        basedir = self.repository.basedir
+        encode = self.repository.encode
+
+        exclude = [self.logfile]
+        sfname = self.state_file.filename
+        exclude.extend([sfname, sfname+'.old', sfname+'.journal',
+                        sfname+'-journal', sfname+'-wal'])
+
+        touched = self.__dict__.pop('_touched', {})
+        names = touched.keys()
+        names.sort()
+
+        deletes = []
+        contents = {}
+        walked = []
+
+        def content(name, abspath):
+            if abspath in exclude:
+                return
+            if islink(abspath):
+                contents[name] = ('120000', readlink(abspath))
+            elif isfile(abspath):
+                if lstat(abspath).st_mode & S_IXUSR:
+                    mode = '100755'
+                else:
+                    mode = '100644'
+                contents[name] = (mode, open(abspath, 'rb').read())
+
+        for name in names:
+            # Skip what's already sent with an outer subtree
+            for outer in walked:
+                if name.startswith(outer + '/'):
+                    break
+            else:
+                outer = None
+            if outer is not None:
+                continue
+
+            abspath = join(basedir, name)
+            if isdir(abspath) and not islink(abspath):
+                if not touched[name]:
+                    # Git does not track directories
+                    continue
+                walked.append(name)
+                deletes.append(name)
+                for dir, subdirs, files in walk(abspath):
+                    for excd in IGNORED_METADIRS:
+                        if excd in subdirs:
+                            subdirs.remove(excd)
+                    for f in files:
+                        absf = join(dir, f)
+                        content(absf[len(basedir)+1:], absf)
+                    for d in subdirs:
+                        absd = join(dir, d)
+                        if islink(absd):
+                            content(absd[len(basedir)+1:], absd)
+            elif islink(abspath) or isfile(abspath):
+                content(name, abspath)
+            else:
+                deletes.append(name)
+
+        commands = ['D %s\n' % fast_import_path(encode(name))
+                    for name in deletes]
+        names = contents.keys()
+        names.sort()
+        for name in names:
+            mode, data = contents[name]
+            commands.append('M %s inline %s\ndata %d\n%s\n' % (
+                mode, fast_import_path(encode(name)), len(data), data))
+        return commands
+
+    def __fastImportCommit(self, date, author, patchname, changelog):
+        """
+        Send the commit to ``git fast-import``.
+        """
+
+        if self._fast_import is None:
+            self.__startFastImport()
+        process, refname, parent = self._fast_import
+
+        files = self.__fastImportFiles()
+        if not files:
+            self.log.info("Nothing to commit")
+            return
+
+        encode = self.repository.encode
+
+        logmessage = []
+        if patchname:
+            logmessage.append(patchname)
+        if changelog:
+            logmessage.append(changelog)
+        logmessage = encode('\n'.join(logmessage))
+        if not logmessage:
+            logmessage = 'No commit message\n'
+        if not logmessage.endswith('\n'):
+            logmessage += '\n'
+
+        (name, email) = self.__parse_author(author)
+        identity = fast_import_identity(encode(name), email, date)
+
+        stream = ['commit %s\n' % refname,
+                  'author %s\n' % identity,
+                  'committer %s\n' % identity,
+                  'data %d\n%s' % (len(logmessage), logmessage)]
+        if parent:
+            # Only the first commit of the session needs it, then
+            # fast-import knows the tip of the branch
+            stream.append('from %s\n' % parent)
+            self._fast_import = (process, refname, None)
+        stream.extend(files)
+        stream.append('\n')
+
+        self._fast_import_commits += 1
+        self._fast_import_unchecked += 1
+        self.__fastImportSend(''.join(stream))
+
+    def __fastImportCheckpoint(self):
+        """
+        Ask ``git fast-import`` to update the branch and the tags, and
+        wait for its confirmation.
+        """
+
+        process = self._fast_import[0]
+        mark = 'checkpoint %d' % self._fast_import_commits
+        self.__fastImportSend('checkpoint\n\nprogress %s\n\n' % mark)
+        line = process.stdout.readline()
+        if line.rstrip('\n') != 'progress ' + mark:
+            raise ChangesetApplicationFailure("git fast-import did not "
+                                              "confirm the checkpoint: %r"
+                                              % line)
+        self._fast_import_unchecked = 0
+
+    def _dismissChangeset(self, changeset):
+        """
+        With fast-import the commits become permanent only at the
+        checkpoints: until then the state file is asked to hold the
+        applied changesets, and to record them once confirmed.
+        """
+
+        from signal import signal, SIGINT, SIG_IGN
+
+        SynchronizableTargetWorkingDir._dismissChangeset(self, changeset)
+
+        if self._fast_import is None:
+            return
+
+        checkpoint = self.repository.fast_import_checkpoint
+        if checkpoint and self._fast_import_unchecked >= checkpoint:
+            previous = signal(SIGINT, SIG_IGN)
+            try:
+                self.__fastImportCheckpoint()
+            finally:
+                signal(SIGINT, previous)
+            self.state_file.release()
+        else:
+            self.state_file.hold()
+
+    def __fastImportSend(self, data):
+        """
+        Write `data` to the fast-import process, checking it's alive.
+        """
+
+        process = self._fast_import[0]
+        try:
+            process.stdin.write(data)
+            process.stdin.flush()
+        except IOError, e:
+            raise ChangesetApplicationFailure("git fast-import died: %s" % e)
+
+    def __fastImportTag(self, tag, date, author):
+        """
+        Send the tag to ``git fast-import``.
+        """
+
+        from vcpx.repository.git import GitExternalCommand
+
+        if self._fast_import is None:
+            self.__startFastImport()
+        refname = self._fast_import[1]
+
+        tag_git = self.__tagName(tag)
+        if not self.repository.overwrite_tags:
+            exists = tag_git in self._fast_import_tags
+            if not exists:
+                c = GitExternalCommand(self.repository,
+                                       cwd=self.repository.basedir,
+                                       command=self.repository.command(
+                    'rev-parse', '--verify', '-q', 'refs/tags/' + tag_git))
+                c.execute()
+                exists = not c.exit_status
+            if exists:
+                self.log.critical("Couldn't set tag '%s': it conflicts with "
+                                  "a previous tag, and overwrite-tags=True "
+                                  "may help" % tag_git)
+                raise ChangesetApplicationFailure("Tag %s already exists"
+                                                  % tag_git)
+        self._fast_import_tags.append(tag_git)
+
+        encode = self.repository.encode
+        (name, email) = self.__parse_author(author)
+        message = encode(tag) + '\n'
+        self.__fastImportSend('tag %s\nfrom %s\ntagger %s\ndata %d\n%s\n' % (
+            tag_git, refname, fast_import_identity(encode(name), email, date),
+            len(message), message))
+
+    def finalizeTargetRepository(self):
+        """
+        Terminate the ``git fast-import`` process, if any, and bring
+        the index in sync with the imported branch.
+        """
+
+        if self._fast_import is None:
+            return
+
+        process, refname, parent = self._fast_import
+        self._fast_import = None
+        try:
+            process.stdin.write('done\n')
+            process.stdin.close()
+        except IOError:
+            pass
+        status = process.wait()
+        if status:
+            # The branch is still at the last checkpoint
+            self.state_file.release(False)
+            raise ChangesetApplicationFailure("git fast-import returned "
+                                              "status %d" % status)
+        self.state_file.release()
+        self.log.info("git fast-import completed %d commits",
+                      self._fast_import_commits)
+        if self._fast_import_commits:
+            self.repository.runCommand(['read-tree', refname],
+                                       ChangesetApplicationFailure)
+
+    def __tagName(self, tag):
+        """
+        Escape the tag name for git.
+        """
+
+        import re
+        return re.sub('_*$', '', re.sub('__', '_', re.sub('[^A-Za-z0-9_-]', '_', tag)))
+
     def _tag(self, tag, date, author):
 
+        if self.repository.fast_import:
+            self.__fastImportTag(tag, date, author)
+            return
+
         # in single-repository mode, only update the relevant branch
         if self.repository.branch_name:
             refname = self.repository.branch_name
@@ -173,9 +551,7 @@ class GitTargetWorkingDir(SynchronizableTargetWorkingDir):
         if self.repository.overwrite_tags:
             args.append("-f")
 
-        # Escape the tag name for git
-        import re
-        tag_git = re.sub('_*$', '', re.sub('__', '_', re.sub('[^A-Za-z0-9_-]', '_', tag)))
+        tag_git = self.__tagName(tag)
 
         args += ["-m", tag, tag_git, refname]
         cmd = self.repository.command(*args)
@@ -209,7 +585,21 @@ class GitTargetWorkingDir(SynchronizableTargetWorkingDir):
         Remove some filesystem object.
         """
 
-        from os.path import exists, isdir, join
+        from os.path import exists, isdir, islink, join
+
+        if self.repository.fast_import:
+            from os import remove
+            from shutil import rmtree
+
+            # Do what "git rm" would do on the working directory
+            for name in names:
+                fname = join(self.repository.basedir, name)
+                if isdir(fname) and not islink(fname):
+                    rmtree(fname)
+                elif exists(fname) or islink(fname):
+                    remove(fname)
+            self._touchPathnames(names)
+            return
 
         # Currently git does not handle directories at all, so filter
         # them out.
@@ -242,6 +632,16 @@ class GitTargetWorkingDir(SynchronizableTargetWorkingDir):
         oldpath = join(self.repository.basedir, oldname)
         newpath = join(self.repository.basedir, newname)
 
+        if self.repository.fast_import:
+            from os import renames
+
+            # Do what "git mv" would do on the working directory
+            if exists(oldpath) and not exists(newpath):
+                renames(oldpath, newpath)
+            self._touchPathnames([oldname])
+            self._touchPathnames([newname], subtree=True)
+            return
+
         # These are used with disjunct directories.
         newpathtmp = newpath + '-TAILOR-HACKED-TEMP-NAME'
         newnametmp = newname + '-TAILOR-HACKED-TEMP-NAME'
@@ -330,6 +730,10 @@ class GitTargetWorkingDir(SynchronizableTargetWorkingDir):
             ignore.write('\n')
             ignore.write(sfrelname+'.journal')
             ignore.write('\n')
+            ignore.write(sfrelname+'-journal')
+            ignore.write('\n')
+            ignore.write(sfrelname+'-wal')
+            ignore.write('\n')
         ignore.close()
 
     def importFirstRevision(self, source_repo, changeset, initial):
@@ -625,6 +625,12 @@ class HgWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
             ignore.write('^')
             ignore.write(sfrelname+'.journal')
             ignore.write('$\n')
+            ignore.write('^')
+            ignore.write(sfrelname+'-journal')
+            ignore.write('$\n')
+            ignore.write('^')
+            ignore.write(sfrelname+'-wal')
+            ignore.write('$\n')
         ignore.close()
         self._hg.add(['.hgignore'])
         self._hgCommand('commit', '.hgignore',
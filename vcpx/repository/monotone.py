@@ -18,7 +18,8 @@ from os import getenv
 from string import whitespace
 
 from vcpx.repository import Repository
-from vcpx.shwrap import ExternalCommand, PIPE, ReopenableNamedTemporaryFile
+from vcpx.shwrap import ExternalCommand, ExternalPipeline, PIPE, \
+     ReopenableNamedTemporaryFile
 from vcpx.source import UpdatableSourceWorkingDir, InvocationError, \
                         ChangesetApplicationFailure, GetUpstreamChangesetsFailure
 from vcpx.target import SynchronizableTargetWorkingDir, TargetInitializationFailure
@@ -50,6 +51,25 @@ class MonotoneRepository(Repository):
                            # for backward compatibility
                            cget(self.name, 'custom_lua') or
                            cget(self.name, '%s-custom_lua' % self.which))
+        self.certs_cache = {}
+        self.__stdio = None
+
+    def automate(self, command, args=(), options=()):
+        """
+        Execute ``mtn automate command`` on the database, thru a single
+        ``mtn automate stdio`` process shared by all the queries.
+
+        Return the output of the command.
+        """
+
+        if self.__stdio is None or self.__stdio.process is None:
+            cwd = self.rootdir
+            if not isdir(cwd):
+                cwd = None
+            self.__stdio = MonotoneStdio(self.command("automate", "stdio",
+                                                      "--db", self.repository),
+                                         cwd)
+        return self.__stdio.run(command, args, options)
 
     def create(self):
         """
@@ -98,34 +118,134 @@ class MonotoneRepository(Repository):
 
 
 
-class ExternalCommandChain:
+class MonotoneStdio:
     """
-    This class implements command piping, i.e. a chain of
-    ExternalCommand, each feeding its stdout to the stdin of next
-    command in the chain. If a command fails, the chain breaks and
-    returns error.
+    A ``mtn automate stdio`` process, executing automate commands
+    without paying the startup cost of monotone, and the opening of
+    the database, for each of them.
 
-    Note:
-    This class implements only a subset of ExternalCommand functionality
+    Both the original output format and the ``format-version: 2``
+    one are understood.
     """
+
     def __init__(self, command, cwd=None):
-        self.commandchain =command
-        self.cwd = cwd
-        self.exit_status = 0
-
-    def execute(self):
-        outstr = None
-        for cmd in self.commandchain:
-            input = outstr
-            exc = ExternalCommand(cwd=self.cwd, command=cmd)
-            out, err = exc.execute(input=input, stdout=PIPE, stderr=PIPE)
-            self.exit_status = exc.exit_status
-            if self.exit_status:
-                break
-            outstr = out.getvalue()
-            if len(outstr) <= 0:
-                break
-        return out, err
+        from os import environ
+        from tempfile import TemporaryFile
+        from vcpx.shwrap import Popen
+
+        env = environ.copy()
+        env['LANG'] = 'POSIX'
+        self.errors = TemporaryFile()
+        self.process = Popen(command, cwd=cwd, env=env, bufsize=-1,
+                             stdin=PIPE, stdout=PIPE, stderr=self.errors)
+        self.version = None
+
+    def close(self):
+        """Terminate the monotone process."""
+
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+    def run(self, command, args=(), options=()):
+        """
+        Execute the automate `command` with the given `args` and
+        `options`, a sequence of (name, value) tuples.
+        """
+
+        request = []
+        if options:
+            request.append('o')
+            for name, value in options:
+                request.append('%d:%s%d:%s' % (len(name), name,
+                                               len(value), value))
+            request.append('e')
+        request.append('l')
+        for word in [command] + list(args):
+            request.append('%d:%s' % (len(word), word))
+        request.append('e')
+
+        try:
+            self.process.stdin.write(''.join(request))
+            self.process.stdin.flush()
+        except IOError, e:
+            self.process = None
+            raise GetUpstreamChangesetsFailure("mtn automate stdio died: %s"
+                                               % e)
+
+        status, output, errors = self.__response()
+        if status:
+            raise GetUpstreamChangesetsFailure(
+                "mtn automate %s returned status %d: %s" % (
+                command, status, errors.strip()))
+        return output
+
+    def __read(self, size):
+        """Read exactly `size` bytes."""
+
+        chunks = []
+        while size > 0:
+            chunk = self.process.stdout.read(size)
+            if not chunk:
+                self.process = None
+                raise GetUpstreamChangesetsFailure("mtn automate stdio "
+                                                   "terminated unexpectedly")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return ''.join(chunks)
+
+    def __field(self):
+        """Read a packet header field, up to the colon."""
+
+        chars = []
+        while True:
+            ch = self.__read(1)
+            if ch == ':':
+                return ''.join(chars)
+            chars.append(ch)
+
+    def __response(self):
+        """
+        Read the packets of a response, returning its status, its main
+        output and its error messages.
+        """
+
+        field = self.__field()
+        if self.version is None:
+            if field == 'format-version':
+                # "format-version: 2" followed by an empty line
+                self.version = int(self.process.stdout.readline())
+                self.process.stdout.readline()
+                field = self.__field()
+            else:
+                self.version = 1
+
+        output = []
+        errors = []
+        while True:
+            # field is the command number, useless as there is a
+            # single command at a time
+            if self.version == 1:
+                error = int(self.__field())
+                last = self.__field()
+                payload = self.__read(int(self.__field()))
+                if error:
+                    errors.append(payload)
+                else:
+                    output.append(payload)
+                if last == 'l':
+                    return error, ''.join(output), ''.join(errors)
+            else:
+                stream = self.__field()
+                payload = self.__read(int(self.__field()))
+                if stream == 'm':
+                    output.append(payload)
+                elif stream == 'e':
+                    errors.append(payload)
+                elif stream == 'l':
+                    return int(payload), ''.join(output), ''.join(errors)
+            field = self.__field()
 
 
 class MonotoneChangeset(Changeset):
@@ -220,6 +340,29 @@ class MonotoneCertsParser:
         self.repository = repository
 
     def parse(self, revision):
+        """
+        Collect the information about the `revision`, that is cached
+        until `forget()`.
+        """
+
+        cached = self.repository.certs_cache.get(revision)
+        if cached is None:
+            self.__parse(revision)
+            cached = (self.ancestors, self.authors, self.dates,
+                      self.changelog, self.branches, self.tags)
+            self.repository.certs_cache[revision] = cached
+        else:
+            (self.ancestors, self.authors, self.dates,
+             self.changelog, self.branches, self.tags) = cached
+
+    def forget(self, revision):
+        """
+        Drop the cached information about the `revision`.
+        """
+
+        self.repository.certs_cache.pop(revision, None)
+
+    def __parse(self, revision):
         from datetime import datetime
 
         self.revision=""
@@ -231,30 +374,18 @@ class MonotoneCertsParser:
         self.tags=[]
 
         # Get ancestors from automate parents
-        cmd = self.repository.command("automate", "parents", revision,
-                                      "--db", self.repository.repository)
-        mtl = ExternalCommand(cwd=self.working_dir, command=cmd)
-        outstr = mtl.execute(stdout=PIPE, stderr=PIPE)
-        if mtl.exit_status:
-            raise GetUpstreamChangesetsFailure("mtn automate parents returned "
-                                               "status %d" % mtl.exit_status)
-        self.ancestors = outstr[0].getvalue().splitlines()
+        self.ancestors = self.repository.automate("parents",
+                                                  [revision]).splitlines()
 
         # Get informations about revision from list certs
-        cmd = self.repository.command("automate", "certs", revision,
-                                      "--db", self.repository.repository)
-        mtl = ExternalCommand(cwd=self.working_dir, command=cmd)
-        outstr = mtl.execute(stdout=PIPE, stderr=PIPE)
-        if mtl.exit_status:
-            raise GetUpstreamChangesetsFailure("mtn automate certs returned "
-                                               "status %d" % mtl.exit_status)
+        certs = self.repository.automate("certs", [revision])
 
         testresults = ""
         logs = ""
         comments = ""
         state = self.DUMMY
         line_continues = False
-        loglines = outstr[0].getvalue().splitlines()
+        loglines = certs.splitlines()
         for curline in loglines:
 
             if line_continues:
@@ -379,6 +510,7 @@ class MonotoneCertsParser:
 
     def convertLog(self, chset):
         self.parse(chset.revision)
+        self.forget(chset.revision)
 
         chset.update(real_dates=self.dates,
                      authors=self.authors,
@@ -490,24 +622,37 @@ class MonotoneDiffParser:
                 "with invalid parameters: lin_ancestor %s, revision %s" %
                 (chset.lin_ancestor, chset.revision))
 
-        # the order of revisions is very important. Monotone gives a
-        # diff from the first to the second
-        cmd = self.repository.command("diff",
-                                      "--db", self.repository.repository,
-                                      "--revision", chset.lin_ancestor,
-                                      "--revision", chset.revision)
+        if chset.real_ancestors and chset.lin_ancestor in chset.real_ancestors:
+            # The usual case, the linearized ancestor is a real one:
+            # the revision itself carries the changes against it, in
+            # the same format of the diff header, without the need of
+            # computing the textual diffs
+            changes = self.repository.automate("get_revision",
+                                               [chset.revision])
+            for section in changes.split('\nold_revision [')[1:]:
+                if section.startswith(chset.lin_ancestor + ']'):
+                    changes = section[len(chset.lin_ancestor)+1:]
+                    break
+        else:
+            # the order of revisions is very important. Monotone gives a
+            # diff from the first to the second
+            cmd = self.repository.command("diff",
+                                          "--db", self.repository.repository,
+                                          "--revision", chset.lin_ancestor,
+                                          "--revision", chset.revision)
 
-        mtl = ExternalCommand(cwd=self.working_dir, command=cmd)
-        outstr = mtl.execute(stdout=PIPE, stderr=PIPE, LANG='POSIX')
-        if mtl.exit_status:
-            raise GetUpstreamChangesetsFailure(
-                "mtn diff returned status %d" % mtl.exit_status)
+            mtl = ExternalCommand(cwd=self.working_dir, command=cmd)
+            outstr = mtl.execute(stdout=PIPE, stderr=PIPE, LANG='POSIX')
+            if mtl.exit_status:
+                raise GetUpstreamChangesetsFailure(
+                    "mtn diff returned status %d" % mtl.exit_status)
+            changes = outstr[0].getvalue()
 
         # monotone diffs are prefixed by a section containing
         # metainformations about files
         # The section terminates with the first file diff, and each
         # line is prepended by the patch comment char (#).
-        tk = self.BasicIOTokenizer(outstr[0].getvalue())
+        tk = self.BasicIOTokenizer(changes)
         tkiter = iter(tk)
         in_item = False
         try:
@@ -664,6 +809,13 @@ class MonotoneRevToCset:
       linearized ancestor (i.e. previous revision in the linearized history)
     """
 
+    CACHED_CERTS = 100
+    """
+    How many of the revisions selected by getCset() keep their certs
+    cached, to be applied without asking them again: the others are
+    forgotten, to keep the memory bounded on a long history.
+    """
+
     def __init__(self, repository, working_dir, branch):
         self.working_dir = working_dir
         self.repository = repository
@@ -695,9 +847,13 @@ class MonotoneRevToCset:
         else:
             start_index = 1
         for r in revlist[start_index:]:
-            chtmp = MonotoneChangeset(anc, r)
-            self.logparser.convertLog(chtmp)
-            if self.branch in chtmp.branches:
+            # The certs of the first revisions stay cached until the
+            # changeset gets applied
+            self.logparser.parse(r)
+            if (self.branch not in self.logparser.branches or
+                len(cslist) >= self.CACHED_CERTS):
+                self.logparser.forget(r)
+            if self.branch in self.logparser.branches:
                 cslist.append(MonotoneChangeset(anc, r)) # using a new, unfilled changeset
                 anc=r
                 if onlyFirst:
@@ -744,12 +900,12 @@ class MonotoneWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingD
                                                 "--db",dbrepo, "-@-")
                         ]
                 cmd[0].extend(revision)
-                cld = ExternalCommandChain(cwd=working_dir, command=cmd)
-                outstr = cld.execute()
+                cld = ExternalPipeline(cmd, cwd=working_dir)
+                out = cld.execute(stdout=PIPE, stderr=PIPE, stream=True)[0]
+                revlist = [rev.strip() for rev in out]
                 if cld.exit_status:
                     raise InvocationError("Ancestor reading returned "
                                           "status %d" % cld.exit_status)
-                revlist = outstr[0].getvalue().split()
                 if len(revlist)>1:
                     mtr = MonotoneRevToCset(repository=self.repository,
                                             working_dir=working_dir,
@@ -779,8 +935,9 @@ class MonotoneWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingD
                                         "--db", self.repository.repository,
                                         "-@-")
                 ]
-        cld = ExternalCommandChain(cwd=self.repository.rootdir, command=cmd)
-        outstr = cld.execute()
+        cld = ExternalPipeline(cmd, cwd=self.repository.rootdir)
+        out = cld.execute(stdout=PIPE, stderr=PIPE, stream=True)[0]
+        childs = [sincerev] + [rev.strip() for rev in out]
         if cld.exit_status:
             raise InvocationError("mtn descendents returned "
                                   "status %d" % cld.exit_status)
@@ -791,7 +948,6 @@ class MonotoneWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingD
         # we need only to know WICH changesets must be applied to the
         # target repo, not WHAT are the changesets (apart for filtering
         # the outside-branch revs)
-        childs = [sincerev] +outstr[0].getvalue().split()
         mtr = MonotoneRevToCset(repository=self.repository,
                                 working_dir=self.repository.rootdir,
                                 branch=self.repository.module)
@@ -1050,6 +1206,8 @@ class MonotoneWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingD
             ignored.append('^%s$' % escape(sfrelname))
             ignored.append('^%s$' % escape(sfrelname + '.old'))
             ignored.append('^%s$' % escape(sfrelname + '.journal'))
+            ignored.append('^%s$' % escape(sfrelname + '-journal'))
+            ignored.append('^%s$' % escape(sfrelname + '-wal'))
 
         if len(ignored) > 0:
             mt_ignored = open(join(self.repository.basedir, '.mtn-ignore'), 'a')
@@ -161,38 +161,31 @@ def _joinArgv(argv):
     return cmdstr
 
 
-def _run(argv):
+def _run(argv, input=None):
     """Prepare and run the given arg vector, 'argv', and return the
     results.  Returns (<stdout lines>, <stderr lines>, <return value>).
-    Note: 'argv' may also just be the command string.
+    Note: 'argv' may also just be the command string, that is executed
+    thru the shell.
+    "input" is an optional string fed to the standard input.
     """
+    from vcpx.shwrap import Popen, PIPE
     if type(argv) in (types.ListType, types.TupleType):
         cmd = _joinArgv(argv)
+        shell = 0
     else:
         cmd = argv
+        shell = 1
     log.debug("Running '%s'..." % cmd)
-    if sys.platform.startswith('win'):
-        i, o, e = os.popen3(cmd)
-        output = o.read()
-        error = e.read()
-        i.close()
-        e.close()
-        retval = o.close()
+    if input is None:
+        stdin = None
     else:
-        import popen2
-        p = popen2.Popen3(cmd, 1)
-        i, o, e = p.tochild, p.fromchild, p.childerr
-        output = o.read()
-        error = e.read()
-        i.close()
-        o.close()
-        e.close()
-        rv = p.wait()
-        if os.WIFEXITED(rv):
-            retval = os.WEXITSTATUS(rv)
-        else:
-            raise P4LibError("Error running '%s', it did not exit "\
-                             "properly: rv=%d" % (cmd, rv))
+        stdin = PIPE
+    p = Popen(argv, shell=shell, stdin=stdin, stdout=PIPE, stderr=PIPE)
+    output, error = p.communicate(input)
+    retval = p.returncode
+    if retval < 0:
+        raise P4LibError("Error running '%s', it did not exit "\
+                         "properly: rv=%d" % (cmd, retval))
     if retval:
         raise P4LibError("Error running '%s': error='%s' retval='%s'"\
                          % (cmd, error, retval))
@@ -202,6 +195,102 @@ def _run(argv):
     return output, error, retval
 
 
+def _runMarshal(argv, input=None):
+    """Run the given arg vector, 'argv', of a p4 command with the '-G'
+    option, and return the results. Returns (<list of dicts>, <stderr>,
+    <return value>).
+    "input" is an optional string fed to the standard input, as needed
+        by the '-x -' option.
+
+    The records are unmarshalled one at a time straight from the pipe.
+    Error records are not returned: the errors raise a P4LibError, the
+    warnings (like "file(s) up-to-date.") are just logged.
+    """
+    from vcpx.shwrap import Popen, PIPE
+    cmd = _joinArgv(argv)
+    log.debug("Running '%s'..." % cmd)
+    # Temporary files cannot block the command while we are busy
+    # feeding or reading the other stream
+    if input is None:
+        stdin = None
+    else:
+        stdin = tempfile.TemporaryFile()
+        stdin.write(input)
+        stdin.seek(0)
+    stderr = tempfile.TemporaryFile()
+    p = Popen(argv, stdin=stdin, stdout=PIPE, stderr=stderr)
+    records = []
+    errors = []
+    try:
+        while 1:
+            record = marshal.load(p.stdout)
+            if record.get('code') == 'error':
+                if int(record.get('severity', 3)) >= 3:
+                    errors.append(record['data'].strip())
+                else:
+                    log.info(record['data'].strip())
+            else:
+                records.append(record)
+    except EOFError:
+        pass
+    p.stdout.close()
+    retval = p.wait()
+    stderr.seek(0)
+    error = stderr.read()
+    if retval < 0:
+        raise P4LibError("Error running '%s', it did not exit "\
+                         "properly: rv=%d" % (cmd, retval))
+    if retval or errors:
+        raise P4LibError("Error running '%s': error='%s' retval='%s'"\
+                         % (cmd, '\n'.join(errors) or error, retval))
+    log.debug("records=%r", records)
+    log.debug("error='%s'", error)
+    log.debug("retval='%s'", retval)
+    return records, error, retval
+
+
+def _formatTime(seconds, format='%Y/%m/%d %H:%M:%S'):
+    """Format the 'time' of a marshalled record like p4 does."""
+    import time
+    return time.strftime(format, time.localtime(int(seconds)))
+
+
+def _indexed(record, *keys):
+    """Return the list of the values with the given 'keys' suffixed by
+    an index, as the marshalled records contain, up to the first
+    missing one.
+        >>> _indexed({'rev0': '1', 'action0': 'add', 'rev1': '2'},
+        ...          'rev', 'action')
+        [{'rev': '1', 'action': 'add'}]
+    """
+    result = []
+    i = 0
+    while 1:
+        item = {}
+        for key in keys:
+            indexed = '%s%d' % (key, i)
+            if not record.has_key(indexed):
+                return result
+            item[key] = record[indexed]
+        result.append(item)
+        i += 1
+
+
+def _integrationNote(how, file, srev, erev):
+    """Format an integration record of 'p4 filelog' like its text
+    output does, as in "branch from //depot/foo#1,#3".
+    """
+    if srev == '#none':
+        start = 1
+    else:
+        start = int(srev[1:]) + 1
+    if erev == '#none' or str(start) == erev[1:]:
+        revs = erev
+    else:
+        revs = '#%d,%s' % (start, erev)
+    return '%s %s%s' % (how, file, revs)
+
+
 def _specialsLast(a, b, specials):
     """A cmp-like function, sorting in alphabetical order with
     'special's last.
@@ -464,6 +553,17 @@ class P4:
         self.optd = options
         self._optv = makeOptv(**self.optd)
 
+    def _p4optv(self, **p4options):
+        """Return the p4 option vector, with the instance's options
+        optionally overriden by **p4options.
+        """
+        if p4options:
+            d = self.optd
+            d.update(p4options)
+            return makeOptv(**d)
+        else:
+            return self._optv
+
     def _p4run(self, argv, **p4options):
         """Run the given p4 command.
         
@@ -471,15 +571,26 @@ class P4:
         **p4options) are used. The 3-tuple (<output>, <error>, <retval>) is
         returned.
         """
-        if p4options:
-            d = self.optd
-            d.update(p4options)
-            p4optv = makeOptv(**d)
-        else:
-            p4optv = self._optv
-        argv = [self.p4] + p4optv + argv
+        argv = [self.p4] + self._p4optv(**p4options) + argv
         return _run(argv)
 
+    def _p4runG(self, argv, batch=None, **p4options):
+        """Run the given p4 command with marshalled output (-G).
+
+        "batch" is an optional list of further arguments, passed thru
+            the standard input with '-x -': p4 executes the command
+            once for each of them, without limits on their number.
+
+        The 3-tuple (<list of dicts>, <error>, <retval>) is returned.
+        """
+        p4optv = [self.p4, '-G'] + self._p4optv(**p4options)
+        if batch is None:
+            input = None
+        else:
+            p4optv += ['-x', '-']
+            input = ''.join([str(arg) + '\n' for arg in batch])
+        return _runMarshal(p4optv + argv, input)
+
     def opened(self, files=[], allClients=0, change=None, _raw=0,
                **p4options):
         """Get a list of files opened in a pending changelist.
@@ -496,16 +607,10 @@ class P4:
         is used.
 
         If '_raw' is true then the return value is simply a dictionary
-        with the unprocessed results of calling p4:
-            {'stdout': <stdout>, 'stderr': <stderr>, 'retval': <retval>}
+        with the unprocessed results of calling p4 -G:
+            {'stdout': <list of dicts>, 'stderr': <stderr>,
+             'retval': <retval>}
         """
-        # Output examples:
-        # - normal:
-        #   //depot/apps/px/px.py#3 - edit default change (text)
-        # - with '-a':
-        #   //depot/foo.txt#1 - edit change 12345 (text+w) by trentm@trentm-pliers
-        # - none opened:
-        #   foo.txt - file(s) not opened on this client. 
         optv = []
         if allClients: optv += ['-a']
         if change: optv += ['-c', str(change)]
@@ -515,34 +620,25 @@ class P4:
         argv = ['opened'] + optv
         if files:
             argv += files
-        output, error, retval = self._p4run(argv, **p4options)
+        records, error, retval = self._p4runG(argv, **p4options)
         if _raw:
-            return {'stdout': output, 'stderr': error, 'retval': retval}
+            return {'stdout': records, 'stderr': error, 'retval': retval}
 
-        lineRe = re.compile('''^
-            (?P<depotFile>.*?)\#(?P<rev>\d+)    # //depot/foo.txt#1
-            \s-\s(?P<action>\w+)                # - edit
-            \s(default\schange|change\s(?P<change>\d+))  # change 12345
-            \s\((?P<type>[\w+]+)\)          # (text+w)
-            (\sby\s)?                           # by
-            ((?P<user>[^\s@]+)@(?P<client>[^\s@]+))?    # trentm@trentm-pliers
-            ''', re.VERBOSE)
         files = []
-        for line in output.splitlines(1):
-            match = lineRe.search(line)
-            if not match:
-                raise P4LibError("Internal error: 'p4 opened' regex did not "\
-                                 "match '%s'. Please report this to the "\
-                                 "author." % line)
-            file = match.groupdict()
-            file['rev'] = int(file['rev'])
-            if not file['change']:
+        for record in records:
+            if record.get('code') != 'stat':
+                continue
+            file = {'depotFile': record['depotFile'],
+                    'rev': int(record['rev']),
+                    'action': record['action'],
+                    'type': record['type']}
+            if record['change'] == 'default':
                 file['change'] = 'default'
             else:
-                file['change'] = int(file['change'])
-            for key in file.keys():
-                if file[key] is None:
-                    del file[key]
+                file['change'] = int(record['change'])
+            if allClients:
+                file['user'] = record['user']
+                file['client'] = record['client']
             files.append(file)
         return files
 
@@ -558,49 +654,29 @@ class P4:
         Exclusion.
 
         If '_raw' is true then the return value is simply a dictionary
-        with the unprocessed results of calling p4:
-            {'stdout': <stdout>, 'stderr': <stderr>, 'retval': <retval>}
+        with the unprocessed results of calling p4 -G:
+            {'stdout': <list of dicts>, 'stderr': <stderr>,
+             'retval': <retval>}
         """
-        # Output examples:
-        #  -//depot/foo/Py-2_1/... //trentm-ra/foo/Py-2_1/... c:\trentm\foo\Py-2_1\...
-        #  //depot/foo/win/... //trentm-ra/foo/win/... c:\trentm\foo\win\...
-        #  //depot/foo/Py Exts.dsw //trentm-ra/foo/Py Exts.dsw c:\trentm\foo\Py Exts.dsw
-        #  //depot/foo/%1 //trentm-ra/foo/%1 c:\trentm\foo\%1
-        # The last one is surprising. It comes from using '*' in the
-        # client spec. 
         if type(files) in types.StringTypes:
             files = [files]
 
         argv = ['where']
         if files:
             argv += files
-        output, error, retval = self._p4run(argv, **p4options)
+        records, error, retval = self._p4runG(argv, **p4options)
         if _raw:
-            return {'stdout': output, 'stderr': error, 'retval': retval}
+            return {'stdout': records, 'stderr': error, 'retval': retval}
 
         results = []
-        for line in output.splitlines(1):
-            file = {}
-            if line[-1] == '\n': line = line[:-1]
-            if line.startswith('-'):
-                file['minus'] = 1
-                line = line[1:]
-            else:
-                file['minus'] = 0
-            depotFileStart = line.find('//')
-            clientFileStart = line.find('//', depotFileStart+2)
-            file['depotFile'] = line[depotFileStart:clientFileStart-1]
-            if sys.platform.startswith('win'):
-                assert ':' not in file['depotFile'],\
-                       "Current parsing cannot handle this line '%s'." % line
-                localFileStart = line.find(':', clientFileStart+2) - 1
-            else:
-                assert file['depotFile'].find(' /') == -1,\
-                       "Current parsing cannot handle this line '%s'." % line
-                localFileStart = line.find(' /', clientFileStart+2) + 1
-            file['clientFile'] = line[clientFileStart:localFileStart-1]
-            file['localFile'] = line[localFileStart:]
-            results.append(file)
+        for record in records:
+            if record.get('code') != 'stat':
+                continue
+            # Exclusions are marked by an 'unmap' key
+            results.append({'depotFile': record['depotFile'],
+                            'clientFile': record['clientFile'],
+                            'localFile': record['path'],
+                            'minus': record.has_key('unmap') and 1 or 0})
         return results
 
     def have(self, files=[], _raw=0, **p4options):
@@ -616,8 +692,9 @@ class P4:
         includes 'depotFile', 'rev', and 'localFile' keys.
 
         If '_raw' is true then the return value is simply a dictionary
-        with the unprocessed results of calling p4:
-            {'stdout': <stdout>, 'stderr': <stderr>, 'retval': <retval>}
+        with the unprocessed results of calling p4 -G:
+            {'stdout': <list of dicts>, 'stderr': <stderr>,
+             'retval': <retval>}
         """
         if type(files) in types.StringTypes:
             files = [files]
@@ -625,26 +702,25 @@ class P4:
         argv = ['have']
         if files:
             argv += files
-        output, error, retval = self._p4run(argv, **p4options)
+        records, error, retval = self._p4runG(argv, **p4options)
         if _raw:
-            return {'stdout': output, 'stderr': error, 'retval': retval}
+            return {'stdout': records, 'stderr': error, 'retval': retval}
 
-        # Output format is 'depot-file#revision - client-file'
         hits = []
-        for line in output.splitlines(1):
-            if line[-1] == '\n': line = line[:-1]
-            hit = {}
-            hit['depotFile'], line = line.split('#')
-            hit['rev'], hit['localFile'] = line.split(' - ', 1)
-            hit['rev'] = int(hit['rev'])
-            hits.append(hit)
+        for record in records:
+            if record.get('code') != 'stat':
+                continue
+            hits.append({'depotFile': record['depotFile'],
+                         'rev': int(record['haveRev']),
+                         'localFile': record['path']})
         return hits
 
     def describe(self, change, diffFormat='', shortForm=0, _raw=0,
                  **p4options):
         """Get a description of the given changelist.
 
-        "change" is the changelist number to describe.
+        "change" is the changelist number to describe, or a list of
+            changelist numbers: then a list of descriptions is returned.
         "diffFormat" (-d<flag>) is a flag to pass to the built-in diff
             routine to control the output format. Valid values are ''
             (plain, default), 'n' (RCS), 'c' (context), 's' (summary),
@@ -656,17 +732,53 @@ class P4:
         'change', 'date', 'client', 'user', 'description', 'files', 'diff'
         (the latter is not included iff 'shortForm').
 
+        The short form comes from the marshalled output (-G), and all
+        the changelists of a list are described by a single p4 command.
+
         If '_raw' is true then the return value is simply a dictionary
-        with the unprocessed results of calling p4:
+        with the unprocessed results of calling p4 (p4 -G with
+        'shortForm'):
             {'stdout': <stdout>, 'stderr': <stderr>, 'retval': <retval>}
         """
         if diffFormat not in ('', 'n', 'c', 's', 'u'):
             raise P4LibError("Incorrect diff format flag: '%s'" % diffFormat)
+        batch = type(change) in (types.ListType, types.TupleType)
+
+        if shortForm:
+            if batch:
+                changes = change
+            else:
+                changes = [change]
+            records, error, retval = self._p4runG(['describe', '-s'],
+                                                  batch=changes, **p4options)
+            if _raw:
+                return {'stdout': records, 'stderr': error, 'retval': retval}
+
+            descs = []
+            for record in records:
+                if record.get('code') != 'stat':
+                    continue
+                desc = {'change': int(record['change']),
+                        'date': _formatTime(record['time']),
+                        'client': record['client'],
+                        'user': record['user'],
+                        'description': record['desc'],
+                        'files': []}
+                for file in _indexed(record, 'depotFile', 'rev', 'action'):
+                    file['rev'] = int(file['rev'])
+                    desc['files'].append(file)
+                descs.append(desc)
+            if batch:
+                return descs
+            return descs[0]
+
+        if batch:
+            return [self.describe(c, diffFormat, shortForm, _raw, **p4options)
+                    for c in change]
+
         optv = []
         if diffFormat:
             optv.append('-d%s' % diffFormat)
-        if shortForm:
-            optv.append('-s')
         argv = ['describe'] + optv + [str(change)]
         output, error, retval = self._p4run(argv, **p4options)
         if _raw:
@@ -683,10 +795,7 @@ class P4:
         desc['description'] = ""
         for line in lines[2:filesIdx-1]:
             desc['description'] += line[1:] # drop the leading \t
-        if shortForm:
-            diffsIdx = len(lines)
-        else:
-            diffsIdx = lines.index("Differences ...\n")
+        diffsIdx = lines.index("Differences ...\n")
         desc['files'] = []
         fileRe = re.compile('^... (?P<depotFile>.+?)#(?P<rev>\d+) '\
                             '(?P<action>\w+)$')
@@ -694,8 +803,7 @@ class P4:
             file = fileRe.match(line).groupdict()
             file['rev'] = int(file['rev'])
             desc['files'].append(file)
-        if not shortForm:
-            desc['diff'] = self._parseDiffOutput(lines[diffsIdx+2:])
+        desc['diff'] = self._parseDiffOutput(lines[diffsIdx+2:])
         return desc
 
     def change(self, files=None, description=None, change=None, delete=0,
@@ -854,8 +962,9 @@ class P4:
         are: 'change', 'date', 'client', 'user', 'description'.
 
         If '_raw' is true then the return value is simply a dictionary
-        with the unprocessed results of calling p4:
-            {'stdout': <stdout>, 'stderr': <stderr>, 'retval': <retval>}
+        with the unprocessed results of calling p4 -G:
+            {'stdout': <list of dicts>, 'stderr': <stderr>,
+             'retval': <retval>}
         """
         if max is not None and type(max) != types.IntType:
             raise P4LibError("Incorrect 'max' value. It must be an integer: "\
@@ -878,40 +987,24 @@ class P4:
         argv = ['changes'] + optv
         if files:
             argv += files
-        output, error, retval = self._p4run(argv, **p4options)
+        records, error, retval = self._p4runG(argv, **p4options)
         if _raw:
-            return {'stdout': output, 'stderr': error, 'retval': retval}
+            return {'stdout': records, 'stderr': error, 'retval': retval}
 
         changes = []
-        if longOutput:
-            changeRe = re.compile("^Change (?P<change>\d+) on "\
-                                  "(?P<date>[\d/]+) by (?P<user>[^\s@]+)@"\
-                                  "(?P<client>[^\s@]+)$")
-            for line in output.splitlines(1):
-                if not line.strip(): continue  # skip blank lines
-                if line.startswith('\t'):
-                    # Append this line (minus leading tab) to last
-                    # change's description.
-                    changes[-1]['description'] += line[1:]
-                else:
-                    change = changeRe.match(line).groupdict()
-                    change['change'] = int(change['change'])
-                    change['description'] = ''
-                    changes.append(change)
-        else:
-            changeRe = re.compile("^Change (?P<change>\d+) on "\
-                                  "(?P<date>[\d/]+) by (?P<user>[^\s@]+)@"\
-                                  "(?P<client>[^\s@]+) (\*pending\* )?"\
-                                  "'(?P<description>.*?)'$")
-            for line in output.splitlines(1):
-                match = changeRe.match(line)
-                if match:
-                    change = match.groupdict()
-                    change['change'] = int(change['change'])
-                    changes.append(change)
-                else:
-                    raise P4LibError("Internal error: could not parse "\
-                                     "'p4 changes' output line: '%s'" % line)
+        for record in records:
+            if record.get('code') != 'stat':
+                continue
+            description = record['desc']
+            if not longOutput:
+                # The text output shows the truncated description on
+                # the same line
+                description = description.replace('\n', ' ').rstrip()
+            changes.append({'change': int(record['change']),
+                            'date': _formatTime(record['time'], '%Y/%m/%d'),
+                            'user': record['user'],
+                            'client': record['client'],
+                            'description': description})
         return changes
 
     def sync(self, files=[], force=0, dryrun=0, _raw=0, **p4options):
@@ -928,8 +1021,9 @@ class P4:
         'depotFile', 'rev', 'comment', and possibly 'notes'.
 
         If '_raw' is true then the return value is simply a dictionary
-        with the unprocessed results of calling p4:
-            {'stdout': <stdout>, 'stderr': <stderr>, 'retval': <retval>}
+        with the unprocessed results of calling p4 -G:
+            {'stdout': <list of dicts>, 'stderr': <stderr>,
+             'retval': <retval>}
         """
         if type(files) in types.StringTypes:
             files = [files]
@@ -942,34 +1036,29 @@ class P4:
         argv = ['sync'] + optv
         if files:
             argv += files
-        output, error, retval = self._p4run(argv, **p4options)
+        records, error, retval = self._p4runG(argv, **p4options)
         if _raw:
-            return {'stdout': output, 'stderr': error, 'retval': retval}
+            return {'stdout': records, 'stderr': error, 'retval': retval}
 
-        # Forms of output:
+        # The comment is rebuilt from the action, as in the text output:
         #    //depot/foo#1 - updating C:\foo
-        #    //depot/foo#1 - is opened and not being changed
-        #    //depot/foo#1 - is opened at a later revision - not changed
         #    //depot/foo#1 - deleted as C:\foo
-        #    ... //depot/foo - must resolve #2 before submitting
-        # There are probably others forms.
+        comments = {'updated': 'updating',
+                    'refreshed': 'refreshing',
+                    'added': 'added as',
+                    'deleted': 'deleted as'}
         hits = []
-        lineRe = re.compile('^(?P<depotFile>.+?)#(?P<rev>\d+) - '\
-                            '(?P<comment>.+?)$')
-        for line in output.splitlines(1):
-            if line.startswith('... '):
-                note = line.split(' - ')[-1].strip()
-                hits[-1]['notes'].append(note)
+        for record in records:
+            if record.get('code') != 'stat':
                 continue
-            match = lineRe.match(line)
-            if match:
-                hit = match.groupdict()
-                hit['rev'] = int(hit['rev'])
-                hit['notes'] = []
-                hits.append(hit)
-                continue
-            raise P4LibError("Internal error: could not parse 'p4 sync'"\
-                             "output line: '%s'" % line)
+            action = record.get('action', '')
+            comment = comments.get(action, action)
+            if record.has_key('clientFile'):
+                comment += ' ' + record['clientFile']
+            hits.append({'depotFile': record['depotFile'],
+                         'rev': int(record['rev']),
+                         'comment': comment,
+                         'notes': []})
         return hits
 
     def edit(self, files, change=None, filetype=None, _raw=0, **p4options):
@@ -1094,8 +1183,9 @@ class P4:
         are: 'depotFile', 'rev', 'type', 'change', 'action'.
 
         If '_raw' is true then the return value is simply a dictionary
-        with the unprocessed results of calling p4:
-            {'stdout': <stdout>, 'stderr': <stderr>, 'retval': <retval>}
+        with the unprocessed results of calling p4 -G:
+            {'stdout': <list of dicts>, 'stderr': <stderr>,
+             'retval': <retval>}
         """
         if type(files) in types.StringTypes:
             files = [files]
@@ -1103,20 +1193,19 @@ class P4:
             raise P4LibError("Missing/wrong number of arguments.")
 
         argv = ['files'] + files
-        output, error, retval = self._p4run(argv, **p4options)
+        records, error, retval = self._p4runG(argv, **p4options)
         if _raw:
-            return {'stdout': output, 'stderr': error, 'retval': retval}
+            return {'stdout': records, 'stderr': error, 'retval': retval}
 
         hits = []
-        fileRe = re.compile("^(?P<depotFile>//.*?)#(?P<rev>\d+) - "\
-                            "(?P<action>\w+) change (?P<change>\d+) "\
-                            "\((?P<type>[\w+]+)\)$")
-        for line in output.splitlines(1):
-            match = fileRe.match(line)
-            hit = match.groupdict()
-            hit['rev'] = int(hit['rev'])
-            hit['change'] = int(hit['change'])
-            hits.append(hit)
+        for record in records:
+            if record.get('code') != 'stat':
+                continue
+            hits.append({'depotFile': record['depotFile'],
+                         'rev': int(record['rev']),
+                         'type': record['type'],
+                         'change': int(record['change']),
+                         'action': record['action']})
         return hits
 
     def filelog(self, files, followIntegrations=0, longOutput=0, maxRevs=None,
@@ -1136,8 +1225,9 @@ class P4:
         'date', 'type', 'notes', 'rev', 'user'.
 
         If '_raw' is true then the return value is simply a dictionary
-        with the unprocessed results of calling p4:
-            {'stdout': <stdout>, 'stderr': <stderr>, 'retval': <retval>}
+        with the unprocessed results of calling p4 -G:
+            {'stdout': <list of dicts>, 'stderr': <stderr>,
+             'retval': <retval>}
         """
         if maxRevs is not None and type(maxRevs) != types.IntType:
             raise P4LibError("Incorrect 'maxRevs' value. It must be an "\
@@ -1156,41 +1246,40 @@ class P4:
             optv.append('-l')
         if maxRevs is not None:
             optv += ['-m', str(maxRevs)]
-        argv = ['filelog'] + optv + files
-        output, error, retval = self._p4run(argv, **p4options)
+        argv = ['filelog'] + optv
+        records, error, retval = self._p4runG(argv, batch=files, **p4options)
         if _raw:
-            return {'stdout': output, 'stderr': error, 'retval': retval}
+            return {'stdout': records, 'stderr': error, 'retval': retval}
 
         hits = []
-        revRe = re.compile("^... #(?P<rev>\d+) change (?P<change>\d+) "\
-                           "(?P<action>\w+) on (?P<date>[\d/]+) by "\
-                           "(?P<user>[^\s@]+)@(?P<client>[^\s@]+) "\
-                           "\((?P<type>[\w+]+)\)( '(?P<description>.*?)')?$")
-        for line in output.splitlines(1):
-            if longOutput and not line.strip():
-                continue  # skip blank lines
-            elif line.startswith('//'):
-                hit = {'depotFile': line.strip(), 'revs': []}
-                hits.append(hit)
-            elif line.startswith('... ... '):
-                hits[-1]['revs'][-1]['notes'].append(line[8:].strip())
-            elif line.startswith('... '):
-                match = revRe.match(line)
-                if match:
-                    d = match.groupdict('')
-                    d['change'] = int(d['change'])
-                    d['rev'] = int(d['rev'])
-                    hits[-1]['revs'].append(d)
-                    hits[-1]['revs'][-1]['notes'] = []
-                else:
-                    raise P4LibError("Internal parsing error: '%s'" % line)
-            elif longOutput and line.startswith('\t'):
-                # Append this line (minus leading tab) to last hit's
-                # last rev's description.
-                hits[-1]['revs'][-1]['description'] += line[1:]
-            else:
-                raise P4LibError("Unexpected 'p4 filelog' output: '%s'"\
-                                 % line)
+        for record in records:
+            if record.get('code') != 'stat':
+                continue
+            hit = {'depotFile': record['depotFile'], 'revs': []}
+            revs = _indexed(record, 'rev', 'change', 'action', 'time', 'user',
+                            'client', 'type', 'desc')
+            for i in range(len(revs)):
+                rev = revs[i]
+                rev['rev'] = int(rev['rev'])
+                rev['change'] = int(rev['change'])
+                rev['date'] = _formatTime(rev['time'], '%Y/%m/%d')
+                del rev['time']
+                rev['description'] = rev['desc']
+                del rev['desc']
+                if not longOutput:
+                    rev['description'] = rev['description'].replace('\n',
+                                                                    ' ').rstrip()
+                # The integration records are indexed by revision and
+                # by integration, as in 'how0,1'
+                rev['notes'] = []
+                j = 0
+                while record.has_key('how%d,%d' % (i, j)):
+                    rev['notes'].append(_integrationNote(
+                        *[record['%s%d,%d' % (key, i, j)]
+                          for key in ('how', 'file', 'srev', 'erev')]))
+                    j += 1
+                hit['revs'].append(rev)
+            hits.append(hit)
         return hits
 
     def print_(self, files, localFile=None, quiet=0, **p4options):
@@ -1219,45 +1308,33 @@ class P4:
             optv.append('-q')
         # There is *no* way to properly and reliably parse out multiple file
         # output without using -s or -G. Use the latter.
-        if p4options:
-            d = self.optd
-            d.update(p4options)
-            p4optv = makeOptv(**d)
-        else:
-            p4optv = self._optv
-        argv = [self.p4, '-G'] + p4optv + ['print'] + optv + files
-        cmd = _joinArgv(argv)
-        log.debug("popen3 '%s'..." % cmd)
-        i, o, e = os.popen3(cmd)
+        argv = ['print'] + optv + files
+        records = self._p4runG(argv, **p4options)[0]
         hits = []
         fileRe = re.compile("^(?P<depotFile>//.*?)#(?P<rev>\d+) - "\
                             "(?P<action>\w+) change (?P<change>\d+) "\
                             "\((?P<type>[\w+]+)\)$")
-        try:
-            startHitWithNextNode = 1
-            while 1:
-                node = marshal.load(o)
-                if node['code'] == 'info':
-                    # Always start a new hit with an 'info' node.
-                    match = fileRe.match(node['data'])
-                    hit = match.groupdict()
-                    hit['change'] = int(hit['change'])
-                    hit['rev'] = int(hit['rev'])
+        startHitWithNextNode = 1
+        for node in records:
+            if node['code'] == 'info':
+                # Always start a new hit with an 'info' node.
+                match = fileRe.match(node['data'])
+                hit = match.groupdict()
+                hit['change'] = int(hit['change'])
+                hit['rev'] = int(hit['rev'])
+                hits.append(hit)
+                startHitWithNextNode = 0
+            elif node['code'] == 'text':
+                if startHitWithNextNode:
+                    hit = {'text': node['data']}
                     hits.append(hit)
-                    startHitWithNextNode = 0
-                elif node['code'] == 'text':
-                    if startHitWithNextNode:
-                        hit = {'text': node['data']}
-                        hits.append(hit)
+                else:
+                    if not hits[-1].has_key('text')\
+                       or hits[-1]['text'] is None:
+                        hits[-1]['text'] = node['data']
                     else:
-                        if not hits[-1].has_key('text')\
-                           or hits[-1]['text'] is None:
-                            hits[-1]['text'] = node['data']
-                        else:
-                            hits[-1]['text'] += node['data']
-                    startHitWithNextNode = not node['data']
-        except EOFError:
-            pass
+                        hits[-1]['text'] += node['data']
+                startHitWithNextNode = not node['data']
         return hits
 
     def diff(self, files=[], diffFormat='', force=0, satisfying=None,
@@ -1398,43 +1475,32 @@ class P4:
 
         # There is *no* way to properly and reliably parse out multiple
         # file output without using -s or -G. Use the latter.
-        if p4options:
-            d = self.optd
-            d.update(p4options)
-            p4optv = makeOptv(**d)
-        else:
-            p4optv = self._optv
-        argv = [self.p4, '-G'] + p4optv + ['diff2'] + optv + [file1, file2]
-        cmd = _joinArgv(argv)
-        i, o, e = os.popen3(cmd)
+        argv = ['diff2'] + optv + [file1, file2]
+        records = self._p4runG(argv, **p4options)[0]
         diff = {}
         infoRe = re.compile("^==== (?P<depotFile1>.+?)#(?P<rev1>\d+) "\
                             "\((?P<type1>[\w+]+)\) - "\
                             "(?P<depotFile2>.+?)#(?P<rev2>\d+) "\
                             "\((?P<type2>[\w+]+)\) "\
                             "==== (?P<summary>\w+)$")
-        try:
-            while 1:
-                node = marshal.load(o)
-                if node['code'] == 'info'\
-                   and node['data'] == '(... files differ ...)':
-                    if diff.has_key('notes'):
-                        diff['notes'].append(node['data'])
-                    else:
-                        diff['notes'] = [ node['data'] ]
-                elif node['code'] == 'info':
-                    match = infoRe.match(node['data'])
-                    d = match.groupdict()
-                    d['rev1'] = int(d['rev1'])
-                    d['rev2'] = int(d['rev2'])
-                    diff.update( match.groupdict() )
-                elif node['code'] == 'text':
-                    if not diff.has_key('text') or diff['text'] is None:
-                        diff['text'] = node['data']
-                    else:
-                        diff['text'] += node['data']
-        except EOFError:
-            pass
+        for node in records:
+            if node['code'] == 'info'\
+               and node['data'] == '(... files differ ...)':
+                if diff.has_key('notes'):
+                    diff['notes'].append(node['data'])
+                else:
+                    diff['notes'] = [ node['data'] ]
+            elif node['code'] == 'info':
+                match = infoRe.match(node['data'])
+                d = match.groupdict()
+                d['rev1'] = int(d['rev1'])
+                d['rev2'] = int(d['rev2'])
+                diff.update( match.groupdict() )
+            elif node['code'] == 'text':
+                if not diff.has_key('text') or diff['text'] is None:
+                    diff['text'] = node['data']
+                else:
+                    diff['text'] += node['data']
         return diff
 
     def revert(self, files=[], change=None, unchangedOnly=0, _raw=0,
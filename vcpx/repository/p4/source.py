@@ -32,6 +32,14 @@ P4_DATE_FMT="%Y/%m/%d %H:%M:%S"
 class P4SourceWorkingDir(UpdatableSourceWorkingDir):
     branchRE = re.compile(r'^branch from (?P<path>//.*?)#')
 
+    DESCRIBE_BATCH = 100
+    """Number of the upcoming changes described by a single p4 command."""
+
+    def __init__(self, repository):
+        UpdatableSourceWorkingDir.__init__(self, repository)
+        self.__upcoming = []
+        self.__descriptions = {}
+
     def __getP4(self):
         p4=self.repository.EXECUTABLE
         args={}
@@ -42,13 +50,30 @@ class P4SourceWorkingDir(UpdatableSourceWorkingDir):
         return p4lib.P4(p4=p4, **args)
 
     def __getNativeChanges(self, sincerev):
-        changes=self.__getP4().changes(self.repository.depot_path + "...")
-        changes.reverse()
-        # Get rid of changes that are too low
+        path = self.repository.depot_path + "..."
         sincerev = int(sincerev)
-        changes = [c for c in changes if int(c['change']) > sincerev]
+        if sincerev >= 0:
+            # Let the server select the changes after sincerev
+            path += "@>%d" % sincerev
+        changes=self.__getP4().changes(path)
+        changes.reverse()
         return changes
 
+    def __describe(self, p4, revision):
+        """
+        Return the description of the change `revision`, asking in the
+        same command also for the ones of the next pending changes.
+        """
+
+        desc = self.__descriptions.pop(revision, None)
+        if desc is not None:
+            return desc
+
+        batch = [revision] + [r for r in self.__upcoming if r <> revision]
+        for desc in p4.describe(batch, shortForm=True):
+            self.__descriptions[str(desc['change'])] = desc
+        return self.__descriptions.pop(revision)
+
     def __parseDate(self, d):
         return datetime.fromtimestamp(time.mktime(
             time.strptime(d, P4_DATE_FMT)), UTC)
@@ -59,7 +84,25 @@ class P4SourceWorkingDir(UpdatableSourceWorkingDir):
                 for c in changes]
 
     def _getUpstreamChangesets(self, sincerev):
-        return self.__adaptChanges(self.__getNativeChanges(sincerev))
+        changesets = self.__adaptChanges(self.__getNativeChanges(sincerev))
+        self.__descriptions = {}
+        return changesets
+
+    def _willApplyChangeset(self, changeset, applyable=None):
+        """
+        When the changeset has not been described yet, peek at the
+        next pending changesets in the state file, to describe them in
+        the same batch.
+
+        This happens here, in the main thread, because the state file
+        must not be used by the one applying the changesets.
+        """
+
+        if changeset.revision not in self.__descriptions:
+            upcoming = self.state_file.upcoming(self.DESCRIBE_BATCH-1)
+            self.__upcoming = [cs.revision for cs in upcoming]
+        return UpdatableSourceWorkingDir._willApplyChangeset(self, changeset,
+                                                            applyable)
 
     def _localFilename(self, f, dp=None):
         if dp is None:
@@ -76,7 +119,7 @@ class P4SourceWorkingDir(UpdatableSourceWorkingDir):
 
     def _applyChangeset(self, changeset):
         p4 = self.__getP4()
-        desc = p4.describe(changeset.revision, shortForm=True)
+        desc = self.__describe(p4, changeset.revision)
 
         changeset.author = desc['user']
         changeset.date = self.__parseDate(desc['date'])
@@ -93,27 +136,31 @@ class P4SourceWorkingDir(UpdatableSourceWorkingDir):
 
         p4.sync(self.repository.depot_path + '...@' + str(changeset.revision))
 
+        # The sources of all the branched files, with a single filelog
+        branches = [f for f in desc['files'] if f['action'] == 'branch']
+        notes = {}
+        if branches:
+            for log in p4.filelog([f['depotFile']+'#'+str(f['rev'])
+                                   for f in branches], maxRevs=1):
+                notes[log['depotFile']] = log['revs'][0]['notes']
+
         # dict of {path:str -> e:ChangesetEntry}
         branched = dict()
-        for f in desc['files']:
+        for f in branches:
             name = self._localFilename(f)
             path = f['depotFile']
-            act = f['action']
 
-            if act == 'branch':
-                e = changeset.addEntry(name, changeset.revision)
-                e.action_kind = e.ADDED
-
-                log = p4.filelog(path+'#'+str(f['rev']), maxRevs=1)
-
-                # rev['notes'] may be empty
-                notes = log[0]['revs'][0]['notes']
-                if len(notes) > 0:
-                    m = self.branchRE.match(notes[0])
-                    if m:
-                        old = m.group('path')
-                        branched[old] = e
-                        self.log.info('Branch %r to %r' % (old, name))
+            e = changeset.addEntry(name, changeset.revision)
+            e.action_kind = e.ADDED
+
+            # the notes may be empty
+            fnotes = notes.get(path)
+            if fnotes:
+                m = self.branchRE.match(fnotes[0])
+                if m:
+                    old = m.group('path')
+                    branched[old] = e
+                    self.log.info('Branch %r to %r' % (old, name))
 
         for f in desc['files']:
             name = self._localFilename(f)
@@ -11,11 +11,13 @@ This module contains supporting classes for Subversion.
 
 __docformat__ = 'reStructuredText'
 
-from vcpx.changes import ChangesetEntry
+from datetime import datetime
+from vcpx.changes import ChangesetEntry, Changeset
 from vcpx.config import ConfigurationError
 from vcpx.repository import Repository
 from vcpx.shwrap import ExternalCommand, PIPE, STDOUT, ReopenableNamedTemporaryFile
-from vcpx.source import UpdatableSourceWorkingDir, ChangesetApplicationFailure
+from vcpx.source import UpdatableSourceWorkingDir, ChangesetApplicationFailure, \
+                        GetUpstreamChangesetsFailure
 from vcpx.target import SynchronizableTargetWorkingDir, TargetInitializationFailure, \
                         PostCommitCheckFailure
 from vcpx.tzinfo import UTC
@@ -38,9 +40,16 @@ class SvnRepository(Repository):
         self.propset_date = cget(self.name, 'propset-date', True)
         self.filter_badchars = cget(self.name, 'filter-badchars', False)
         self.use_limit = cget(self.name, 'use-limit', True)
+        self.log_page_size = int(cget(self.name, 'log-page-size', 0))
+        self.use_dump = cget(self.name, 'use-dump', False)
+        self.dump_file = cget(self.name, 'dump-file', None)
         self.trust_root = cget(self.name, 'trust-root', False)
         self.ignore_externals = cget(self.name, 'ignore-externals', True)
         self.commit_all_files = cget(self.name, 'commit-all-files', True)
+        self.fast_commit = cget(self.name, 'fast-commit', False)
+        self.post_commit_check_interval = int(cget(self.name,
+                                                   'post-commit-check-interval',
+                                                   1))
         self.tags_path = cget(self.name, 'svn-tags', '/tags')
         self.branches_path = cget(self.name, 'svn-branches', '/branches')
         self._setupTagsDirectory = None
@@ -104,6 +113,10 @@ class SvnRepository(Repository):
                            self.module, self.name)
             self.module = '/' + self.module
 
+        if self.use_dump and not self.repository.startswith('file:///'):
+            raise ConfigurationError("The option 'use-dump' requires a local "
+                                     "(file:///) repository in %r" % self.name)
+
         if not self.tags_path.startswith('/'):
             self.log.debug("Prepending '/' to svn-tags %r in %r",
                            self.tags_path, self.name)
@@ -114,6 +127,18 @@ class SvnRepository(Repository):
                            self.branches_path, self.name)
             self.branches_path = '/' + self.branches_path
 
+    def localPath(self):
+        """
+        Return the filesystem path of a local (file:///) repository.
+        """
+
+        from sys import platform
+
+        if platform != 'win32':
+            return self.repository[7:]
+        else:
+            return self.repository[8:]
+
     def create(self):
         """
         Create a local SVN repository, if it does not exist, and configure it.
@@ -197,11 +222,41 @@ class SvnRepository(Repository):
                     raise TargetInitializationFailure("Was not able to create the "
                                                       "module %r" % self.module)
 
-def changesets_from_svnlog(log, repository, chunksize=2**15):
-    from xml.sax import make_parser
-    from xml.sax.handler import ContentHandler, ErrorHandler
-    from datetime import datetime
-    from vcpx.changes import ChangesetEntry, Changeset
+def svn_date(svndate):
+    """
+    Convert a date like "2004-04-16T17:12:48.000000Z" to a datetime.
+    """
+
+    return datetime(int(svndate[:4]), int(svndate[5:7]), int(svndate[8:10]),
+                    int(svndate[11:13]), int(svndate[14:16]),
+                    int(svndate[17:19]), int(svndate[20:-1]), UTC)
+
+
+class SvnChangeset(Changeset):
+    """
+    A changeset read from the svn log, that may know the kind of its
+    entries and which of them are copies.
+    """
+
+    kinds_known = False
+    """Whether the log stated the kind of each entry, as svn 1.6 does."""
+
+    copies = None
+    """The names of the entries copied from somewhere else, if known."""
+
+
+def changesets_from_svnlog(log, repository, chunksize=2**15, progress=None):
+    """
+    Parse the XML output of ``svn log``, yielding the ``SvnChangeset``
+    instances.
+
+    When given, the `progress` dictionary gets updated with the
+    ``revision`` of the last log entry parsed and the ``count`` of
+    the entries, including the ones that do not produce a changeset.
+    """
+
+    from operator import attrgetter
+    from xml.parsers.expat import ParserCreate
 
     def get_entry_from_path(path, module=repository.module):
         # Given the repository url of this wc, say
@@ -222,7 +277,7 @@ def changesets_from_svnlog(log, repository, chunksize=2**15):
                              path, module)
         return None
 
-    class SvnXMLLogHandler(ContentHandler):
+    class SvnXMLLogHandler(object):
         # Map between svn action and tailor's.
         # NB: 'R', in svn parlance, means REPLACED, something other
         # system may view as a simpler ADD, taking the following as
@@ -255,12 +310,21 @@ def changesets_from_svnlog(log, repository, chunksize=2**15):
             if name == 'logentry':
                 self.current = {}
                 self.current['revision'] = attributes['revision']
+                if progress is not None:
+                    progress['revision'] = attributes['revision']
+                    progress['count'] = progress.get('count', 0) + 1
                 self.current['entries'] = []
                 self.copies = []
+                self.kinds_known = True
             elif name in ['author', 'date', 'msg']:
                 self.current_field = []
             elif name == 'path':
                 self.current_field = []
+                # Since 1.6 svn states the kind of each path, but
+                # it may be empty when the server does not know it
+                self.current_kind = attributes.get('kind')
+                if self.current_kind not in ('dir', 'file'):
+                    self.kinds_known = False
                 if attributes.has_key('copyfrom-path'):
                     self.current_path_action = (
                         attributes['action'],
@@ -281,7 +345,7 @@ def changesets_from_svnlog(log, repository, chunksize=2**15):
                     return
 
                 # Sort the paths to make tests easier
-                self.current['entries'].sort(lambda a,b: cmp(a.name, b.name))
+                self.current['entries'].sort(key=attrgetter('name'))
 
                 # Eliminate "useless" entries: SVN does not have atomic
                 # renames, but rather uses a ADD+RM duo.
@@ -368,18 +432,13 @@ def changesets_from_svnlog(log, repository, chunksize=2**15):
                 for e in entries2:
                     entries.append(e)
 
-                svndate = self.current['date']
-                # 2004-04-16T17:12:48.000000Z
-                y,m,d = map(int, svndate[:10].split('-'))
-                hh,mm,ss = map(int, svndate[11:19].split(':'))
-                ms = int(svndate[20:-1])
-                timestamp = datetime(y, m, d, hh, mm, ss, ms, UTC)
-
-                changeset = Changeset(self.current['revision'],
-                                      timestamp,
-                                      self.current.get('author'),
-                                      self.current['msg'],
-                                      entries)
+                changeset = SvnChangeset(self.current['revision'],
+                                         svn_date(self.current['date']),
+                                         self.current.get('author'),
+                                         self.current['msg'],
+                                         entries)
+                changeset.kinds_known = self.kinds_known
+                changeset.copies = self.copies
                 self.changesets.append(changeset)
                 self.current = None
             elif name in ['author', 'date', 'msg']:
@@ -389,6 +448,7 @@ def changesets_from_svnlog(log, repository, chunksize=2**15):
                 entrypath = get_entry_from_path(path)
                 if entrypath:
                     entry = ChangesetEntry(entrypath)
+                    entry.is_directory = self.current_kind == 'dir'
                     if type(self.current_path_action) == type( () ):
                         self.copies.append(entry.name)
                         old = get_entry_from_path(self.current_path_action[1])
@@ -406,25 +466,184 @@ def changesets_from_svnlog(log, repository, chunksize=2**15):
         def characters(self, data):
             self.current_field.append(data)
 
-    parser = make_parser()
+    # Use expat directly, without the overhead of the SAX layer,
+    # collecting the text of each element in a single chunk
+    parser = ParserCreate()
+    parser.buffer_text = True
     handler = SvnXMLLogHandler()
-    parser.setContentHandler(handler)
-    parser.setErrorHandler(ErrorHandler())
+    parser.StartElementHandler = handler.startElement
+    parser.EndElementHandler = handler.endElement
+    parser.CharacterDataHandler = handler.characters
 
     chunk = log.read(chunksize)
     while chunk:
-        parser.feed(chunk)
+        parser.Parse(chunk)
         for cs in handler.changesets:
             yield cs
         handler.changesets = []
         chunk = log.read(chunksize)
-    parser.close()
+    parser.Parse('', True)
     for cs in handler.changesets:
         yield cs
 
 
+class SvnDumpChangesetEntry(ChangesetEntry):
+    """
+    An entry read from a dump, carrying what is needed to apply it
+    without the help of ``svn update``.
+    """
+
+    def __init__(self, name):
+        super(SvnDumpChangesetEntry, self).__init__(name)
+
+        self.contents = None
+        """The full text of the file, None when unchanged."""
+
+        self.properties = None
+        """The whole set of properties, None when unchanged."""
+
+        self.copyfrom = None
+        """The (path, revision) origin of a copy, within the repository."""
+
+        self.replaced = False
+        """Whether this replaces an existing entry with the same name."""
+
+        self.excluded = []
+        """Entries of a copied directory deleted within the same revision."""
+
+
+def changesets_from_svndump(dump, repository, progress=None, limit=None):
+    """
+    Parse the output of ``svnadmin dump``, yielding a ``Changeset`` for
+    each revision that touches the tracked module, whose entries carry
+    the full content of the changed files.
+
+    The entries are massaged as done by `changesets_from_svnlog`, that
+    is with copies followed by the deletion of their origin turned
+    into renames, and the deletions sorted after the other changes.
+
+    When `limit` is given, stop after that many revisions.  The
+    `progress` dictionary, if any, receives the ``count`` of the
+    revisions read and the last ``revision`` number.
+    """
+
+    from vcpx.svndump import read_dump
+
+    prefix = repository.module.strip('/')
+    if prefix:
+        prefix += '/'
+
+    def get_entry_from_path(path):
+        path = path.decode('utf-8').strip('/')
+        if not prefix:
+            return path
+        if path.startswith(prefix):
+            return path[len(prefix):]
+        return None
+
+    count = 0
+    for revision in read_dump(dump):
+        if limit and count >= limit:
+            break
+        count += 1
+        if progress is not None:
+            progress['count'] = count
+            progress['revision'] = revision.number
+
+        entries = []
+        deleted = []
+        copies = {}
+        copied_dirs = []
+        for node in revision.nodes:
+            name = get_entry_from_path(node.path)
+            if not name:
+                continue
+            if node.action == 'change' and node.kind == 'dir':
+                # Only its properties changed
+                continue
+
+            parent = None
+            for dir in copied_dirs:
+                if name.startswith(dir.name + '/'):
+                    parent = dir
+
+            entry = SvnDumpChangesetEntry(name)
+            entry.new_revision = str(revision.number)
+            entry.is_directory = node.kind == 'dir'
+            entry.contents = node.text
+            entry.properties = node.properties
+            if node.action == 'delete':
+                if parent is not None:
+                    parent.excluded.append(name)
+                    continue
+                entry.action_kind = entry.DELETED
+                deleted.append(entry)
+                continue
+            elif node.action == 'change' and parent is None:
+                entry.action_kind = entry.UPDATED
+            else:
+                entry.action_kind = entry.ADDED
+                entry.replaced = node.action == 'replace'
+                if node.copyfrom_path is not None:
+                    entry.copyfrom = (node.copyfrom_path.decode('utf-8')
+                                      .strip('/'), node.copyfrom_rev)
+                    entry.old_name = get_entry_from_path(node.copyfrom_path)
+                    if entry.old_name:
+                        copies[entry.old_name] = entry
+                    if entry.is_directory:
+                        copied_dirs.append(entry)
+            entries.append(entry)
+
+        if not entries and not deleted:
+            continue
+
+        # A copy whose origin is removed, or replaced, is a rename
+        for e in entries + deleted:
+            if e.action_kind == e.DELETED or e.replaced:
+                if copies.has_key(e.name):
+                    copies[e.name].action_kind = e.RENAMED
+                else:
+                    for c in copies.values():
+                        if c.old_name.startswith(e.name + '/'):
+                            c.action_kind = c.RENAMED
+
+        entries.extend([e for e in deleted if not copies.has_key(e.name)])
+
+        properties = revision.properties
+        svndate = properties.get('svn:date')
+        if svndate:
+            timestamp = svn_date(svndate)
+        else:
+            timestamp = None
+
+        author = properties.get('svn:author')
+        if author is not None:
+            author = author.decode('utf-8')
+        yield Changeset(str(revision.number), timestamp, author,
+                        properties.get('svn:log', '').decode('utf-8'),
+                        entries)
+
+
 class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
 
+    _last_page_full = True
+    """Whether the last page of the log was full, so that more may follow."""
+
+    _last_page_end = None
+    """The revision of the last entry in the last page of the log."""
+
+    __dump = None
+    """The writer of the ``dump-file``, when the target is a dump."""
+
+    __dump_changes = None
+    """The changes recorded for the next revision of the dump."""
+
+    __commits = 0
+    """The number of commits done in this session."""
+
+    __touched = None
+    """The directories touched by the last commit, in fast-commit mode."""
+
     ## UpdatableSourceWorkingDir
 
     def _getUpstreamChangesets(self, sincerev=None):
@@ -433,17 +652,26 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         else:
             sincerev = 0
 
+        if self.repository.use_dump:
+            for cs in self._getUpstreamDumpChangesets(sincerev):
+                yield cs
+            return
+
         cmd = self.repository.command("log", "--verbose", "--xml", "--non-interactive",
                                       "--revision", "%d:HEAD" % (sincerev+1))
+        page_size = self.repository.log_page_size
+        if page_size:
+            # The next pages are fetched while the working copy gets
+            # updated, so ask the repository directly
+            cmd.extend(["--limit", str(page_size)])
+            target = self.repository.repository + self.repository.module
+        else:
+            target = '.'
         svnlog = ExternalCommand(cwd=self.repository.basedir, command=cmd)
-        log = svnlog.execute('.', stdout=PIPE, TZ='UTC0')[0]
-
-        if svnlog.exit_status:
-            return []
+        log = svnlog.execute(target, stdout=PIPE, TZ='UTC0', stream=True)[0]
 
         if self.repository.filter_badchars:
             from string import maketrans
-            from cStringIO import StringIO
 
             # Apparently some (SVN repo contains)/(SVN server dumps) some
             # characters that are illegal in an XML stream. This was the case
@@ -458,20 +686,113 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
                               "\x16\x17\x18\x19\x1A\x1B\x1C\x1D\x1E\x1F\x7f"
 
             tt = maketrans(allbadchars, "?"*len(allbadchars))
-            log = StringIO(log.read().translate(tt))
 
-        return changesets_from_svnlog(log, self.repository)
+            class FilteredLog(object):
+                def read(self, size=-1, log=log):
+                    return log.read(size).translate(tt)
+
+                def close(self, log=log):
+                    log.close()
+
+            log = FilteredLog()
+
+        # The log is parsed while svn is still producing it: a failure
+        # shows up as an invalid XML stream, and as usual it means there
+        # is nothing new upstream.
+        from xml.parsers.expat import ExpatError
+
+        progress = {}
+        self._last_page_full = False
+        try:
+            for cs in changesets_from_svnlog(log, self.repository,
+                                             progress=progress):
+                yield cs
+        except ExpatError:
+            log.close()
+            if not svnlog.exit_status:
+                raise
+        else:
+            self._last_page_full = (page_size and
+                                    progress.get('count', 0) >= page_size)
+            self._last_page_end = progress.get('revision')
+
+    def _getUpstreamDumpChangesets(self, sincerev):
+        """
+        Read the changesets from an incremental dump of the local
+        repository, with the full content of the changed files.
+        """
+
+        from vcpx.svndump import SvnDumpError
+
+        self._last_page_full = False
+        page_size = self.repository.log_page_size
+        cmd = self.repository.command("dump", "--incremental", "--quiet",
+                                      "--revision", "%d:HEAD" % (sincerev+1),
+                                      svnadmin=True)
+        svnadmin = ExternalCommand(command=cmd)
+        dump, error = svnadmin.execute(self.repository.localPath(),
+                                       stdout=PIPE, stderr=PIPE,
+                                       stream=True, binary=True)
+
+        progress = {}
+        try:
+            for cs in changesets_from_svndump(dump, self.repository,
+                                              progress=progress,
+                                              limit=page_size):
+                yield cs
+        except SvnDumpError:
+            dump.close()
+            if not svnadmin.exit_status:
+                raise
+
+        if page_size and progress.get('count', 0) >= page_size:
+            # Closing the stream kills svnadmin, that was going on
+            # with the next page: its exit status does not matter
+            dump.close()
+            self._last_page_full = True
+            self._last_page_end = progress['revision']
+            return
+
+        dump.close()
+        if svnadmin.exit_status:
+            message = error.read()
+            # Asking for the revisions after the youngest one means
+            # there is nothing new upstream
+            if ('greater than the youngest revision' in message or
+                'No such revision' in message):
+                return
+            raise GetUpstreamChangesetsFailure(
+                "%s returned status %d saying\n%s" %
+                (str(svnadmin), svnadmin.exit_status, message))
+
+    def _getNextUpstreamPage(self, sincerev):
+        """
+        With a ``log-page-size`` the log is fetched in pages: return
+        the next one, unless the last was not full.
+        """
+
+        if self.repository.log_page_size and self._last_page_full:
+            # Entries hidden by a restricted view do not produce a
+            # changeset, but still count in the page
+            if self._last_page_end is not None:
+                sincerev = self._last_page_end
+            return self._getUpstreamChangesets(sincerev)
 
     def _applyChangeset(self, changeset):
-        from os import walk
         from os.path import join, isdir
         from time import sleep
 
+        if self.repository.use_dump:
+            return self._applyDumpChangeset(changeset)
+
         # Complete changeset information, determining the is_directory
-        # flag of the removed entries, before updating to the given revision
-        for entry in changeset.entries:
-            if entry.action_kind == entry.DELETED:
-                entry.is_directory = isdir(join(self.repository.basedir, entry.name))
+        # flag of the removed entries, before updating to the given revision,
+        # unless the log already stated the kind of each entry
+        kinds_known = getattr(changeset, 'kinds_known', False)
+        if not kinds_known:
+            for entry in changeset.entries:
+                if entry.action_kind == entry.DELETED:
+                    entry.is_directory = isdir(join(self.repository.basedir, entry.name))
 
         cmd = self.repository.command("update")
         if self.repository.ignore_externals:
@@ -507,30 +828,24 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
 
         # Complete changeset information, determining the is_directory
         # flag of the added entries
+        copies = getattr(changeset, 'copies', None)
+        subtrees = getattr(self, 'subtree_entries', True)
         implicitly_added_entries = []
         known_added_entries = set()
         for entry in changeset.entries:
             if entry.action_kind == entry.ADDED:
                 known_added_entries.add(entry.name)
-                fullname = join(self.repository.basedir, entry.name)
-                entry.is_directory = isdir(fullname)
-                # If it is a directory, extend the entries of the
-                # changeset with all its contents, if not already there.
-                if entry.is_directory:
-                    for root, subdirs, files in walk(fullname):
-                        if '.svn' in subdirs:
-                            subdirs.remove('.svn')
-                        for f in files:
-                            name = join(root, f)[len(self.repository.basedir)+1:]
-                            newe = ChangesetEntry(name)
-                            newe.action_kind = newe.ADDED
-                            implicitly_added_entries.append(newe)
-                        for d in subdirs:
-                            name = join(root, d)[len(self.repository.basedir)+1:]
-                            newe = ChangesetEntry(name)
-                            newe.action_kind = newe.ADDED
-                            newe.is_directory = True
-                            implicitly_added_entries.append(newe)
+                if not kinds_known:
+                    entry.is_directory = isdir(join(self.repository.basedir,
+                                                    entry.name))
+                # If it is a copied directory, extend the entries of
+                # the changeset with all its contents, if not already
+                # there and if the target needs them: the log lists
+                # the contents of the others.
+                if subtrees and entry.is_directory and (copies is None or
+                                                        entry.name in copies):
+                    implicitly_added_entries.extend(
+                        self.__subtreeEntries(entry.name, changeset.revision))
 
         for e in implicitly_added_entries:
             if not e.name in known_added_entries:
@@ -544,6 +859,167 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
 
         return result
 
+    def __subtreeEntries(self, name, revision):
+        """
+        Return the ADDED entries for the whole content of the directory
+        `name` at the given `revision`, as listed by ``svn ls``: this
+        is way cheaper than walking a big copied tree on disk.
+        """
+
+        from xml.parsers.expat import ParserCreate
+
+        url = '%s%s/%s@%s' % (self.repository.repository,
+                              self.repository.module.rstrip('/'),
+                              name, revision)
+        cmd = self.repository.command("ls", "--recursive", "--xml",
+                                      "--non-interactive")
+        svnls = ExternalCommand(command=cmd)
+        out, err = svnls.execute(self.repository.encode(url),
+                                 stdout=PIPE, stderr=PIPE)
+        if svnls.exit_status:
+            raise ChangesetApplicationFailure(
+                "%s returned status %s saying\n%s" % (str(svnls),
+                                                     svnls.exit_status,
+                                                     err.read()))
+
+        entries = []
+        current = {}
+
+        def start_element(tag, attributes):
+            if tag == 'entry':
+                current['kind'] = attributes.get('kind')
+            elif tag == 'name':
+                current['name'] = []
+
+        def character_data(data):
+            if current.has_key('name'):
+                current['name'].append(data)
+
+        def end_element(tag):
+            if tag == 'entry':
+                entry = ChangesetEntry(name + '/' + ''.join(current.pop('name')))
+                entry.action_kind = entry.ADDED
+                entry.is_directory = current['kind'] == 'dir'
+                entries.append(entry)
+
+        parser = ParserCreate()
+        parser.StartElementHandler = start_element
+        parser.CharacterDataHandler = character_data
+        parser.EndElementHandler = end_element
+        parser.ParseFile(out)
+        return entries
+
+    def _applyDumpChangeset(self, changeset):
+        """
+        Apply a changeset read from a dump directly on the filesystem,
+        fetching from the repository only the unchanged copies.
+        """
+
+        from os import makedirs, remove, walk, symlink, chmod, stat
+        from os.path import join, exists, isdir, islink, dirname
+        from shutil import rmtree
+
+        basedir = self.repository.basedir
+
+        def clear(path):
+            if islink(path) or (exists(path) and not isdir(path)):
+                remove(path)
+            elif isdir(path):
+                rmtree(path)
+
+        for entry in changeset.entries:
+            if entry.action_kind == entry.DELETED:
+                path = join(basedir, entry.name)
+                entry.is_directory = isdir(path)
+                clear(path)
+            elif entry.action_kind == entry.RENAMED:
+                clear(join(basedir, entry.old_name))
+
+        known_entries = {}
+        implicitly_added_entries = []
+        for entry in changeset.entries:
+            known_entries[entry.name] = True
+            if entry.action_kind == entry.DELETED:
+                continue
+
+            path = join(basedir, entry.name)
+            if entry.replaced:
+                clear(path)
+            if not exists(dirname(path)):
+                makedirs(dirname(path))
+
+            if entry.copyfrom is not None and (entry.is_directory or
+                                               entry.contents is None):
+                url = '%s/%s@%d' % (self.repository.repository,
+                                    entry.copyfrom[0], entry.copyfrom[1])
+                if entry.is_directory:
+                    cmd = self.repository.command("export", "--quiet",
+                                                  "--force", "--non-interactive")
+                    if self.repository.ignore_externals:
+                        cmd.append("--ignore-externals")
+                    svnexport = ExternalCommand(command=cmd)
+                    err = svnexport.execute(url, path, stderr=PIPE)[1]
+                    failed = svnexport
+                else:
+                    cmd = self.repository.command("cat", "--non-interactive")
+                    svncat = ExternalCommand(command=cmd)
+                    f = open(path, 'wb')
+                    err = svncat.execute(url, stdout=f, stderr=PIPE)[1]
+                    f.close()
+                    failed = svncat
+                if failed.exit_status:
+                    raise ChangesetApplicationFailure(
+                        "%s returned status %s saying\n%s" %
+                        (str(failed), failed.exit_status, err.read()))
+                for name in entry.excluded:
+                    clear(join(basedir, name))
+            elif entry.is_directory:
+                if not exists(path):
+                    makedirs(path)
+
+            properties = entry.properties or {}
+            if entry.contents is not None:
+                clear(path)
+                if (properties.has_key('svn:special') and
+                    entry.contents.startswith('link ')):
+                    symlink(entry.contents[5:], path)
+                    entry.is_symlink = True
+                else:
+                    f = open(path, 'wb')
+                    f.write(entry.contents)
+                    f.close()
+                # Not needed anymore: keep it out of the applied
+                # changeset recorded in the state file
+                entry.contents = None
+            if entry.properties is not None and not entry.is_directory \
+                   and not islink(path):
+                mode = stat(path).st_mode
+                if properties.has_key('svn:executable'):
+                    chmod(path, mode | 0111)
+                else:
+                    chmod(path, mode & ~0111)
+
+            # Extend the changeset with the contents of the copied
+            # directories, as done above for svn update
+            if entry.action_kind == entry.ADDED and entry.is_directory \
+                   and entry.copyfrom is not None:
+                for root, subdirs, files in walk(path):
+                    for f in files:
+                        newe = ChangesetEntry(join(root, f)[len(basedir)+1:])
+                        newe.action_kind = newe.ADDED
+                        implicitly_added_entries.append(newe)
+                    for d in subdirs:
+                        newe = ChangesetEntry(join(root, d)[len(basedir)+1:])
+                        newe.action_kind = newe.ADDED
+                        newe.is_directory = True
+                        implicitly_added_entries.append(newe)
+
+        for e in implicitly_added_entries:
+            if not known_entries.has_key(e.name):
+                changeset.entries.append(e)
+
+        return []
+
     def _checkoutUpstreamRevision(self, revision):
         """
         Concretely do the checkout of the upstream revision.
@@ -670,6 +1146,10 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         Add some new filesystem objects.
         """
 
+        if self.repository.dump_file:
+            self.__recordDumpChanges('add', names)
+            return
+
         cmd = self.repository.command("add", "--quiet", "--no-auto-props",
                                       "--non-recursive")
         ExternalCommand(cwd=self.repository.basedir, command=cmd).execute(names)
@@ -716,6 +1196,10 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         """
         TAG current revision.
         """
+        if self.repository.dump_file:
+            self.__dumpTag(tag, date, author)
+            return
+
         if self.repository.setupTagsDirectory():
             src = self.repository.repository + self.repository.module
             dest = self.repository.repository + self.repository.tags_path \
@@ -747,6 +1231,12 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         if changelog:
             logmessage.append(changelog)
 
+        # A dump carries the author and the date as revision properties
+        if self.repository.dump_file:
+            self.__dumpRevision(date, author, '\n'.join(logmessage),
+                                isinitialcommit)
+            return
+
         # If we cannot use propset, fall back to old behaviour of
         # appending these info to the changelog
 
@@ -766,38 +1256,99 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         cmd = self.repository.command("commit", "--file", rontf.name)
         commit = ExternalCommand(cwd=self.repository.basedir, command=cmd)
 
+        if self.repository.fast_commit and entries:
+            self.__touched = self.__touchedDirectories(entries)
+        else:
+            self.__touched = None
+
         if not entries or self.repository.commit_all_files:
             entries = ['.']
 
         out, err = commit.execute(entries, stdout=PIPE, stderr=PIPE)
 
         if commit.exit_status:
-            raise ChangesetApplicationFailure("%s returned status %d saying\n%s"
-                                              % (str(commit),
-                                                 commit.exit_status,
-                                                 err.read()))
+            message = "%s returned status %d saying\n%s" % (str(commit),
+                                                            commit.exit_status,
+                                                            err.read())
+            if (self.repository.post_commit_check and
+                not self.repository.post_commit_check_interval):
+                # The check is done only on failure: report what's left
+                unknown = self.__unversionedEntries(self.__touched)
+                if unknown:
+                    message += ("\nUnversioned entries in working dir:\n%s" %
+                                ''.join(unknown))
+            raise ChangesetApplicationFailure(message)
 
         revision = self._propsetRevision(out, commit, date, author)
         if not revision:
             # svn did not find anything to commit
             return
+        self.__commits += 1
 
+        # In fast-commit mode bump the revision of the touched
+        # directories only, so that the following changesets may
+        # operate on them, instead of walking the whole tree
         cmd = self.repository.command("update", "--quiet")
         if self.repository.ignore_externals:
             cmd.append("--ignore-externals")
         cmd.extend(["--revision", revision])
+        if self.__touched is not None:
+            cmd.append("--non-recursive")
 
-        ExternalCommand(cwd=self.repository.basedir, command=cmd).execute()
+        ExternalCommand(cwd=self.repository.basedir,
+                        command=cmd).execute(self.__touched or [])
 
-    def _postCommitCheck(self):
+    def __touchedDirectories(self, names):
         """
-        Assert that all the entries in the working dir are versioned.
+        Return the existing directories touched by the entries `names`,
+        that is the directories themselves and all their ancestors up
+        to the root of the working copy: a commit bumps the last changed
+        revision of each of them, and svn refuses to remove, move or set
+        properties on a directory whose working revision is older.
+        """
+
+        from os.path import dirname, isdir, join
+
+        dirs = {'.': True}
+        for name in names:
+            if isdir(join(self.repository.basedir, name)):
+                dirs[name] = True
+            dir = dirname(name)
+            while dir and not dirs.has_key(dir):
+                if isdir(join(self.repository.basedir, dir)):
+                    dirs[dir] = True
+                dir = dirname(dir)
+        dirs = dirs.keys()
+        dirs.sort()
+        return dirs
+
+    def __unversionedEntries(self, dirs=None):
+        """
+        Return the ``svn status`` lines of the unversioned entries,
+        within the given directories only if `dirs` is not None.
         """
 
         cmd = self.repository.command("status")
+        if dirs is not None:
+            cmd.append("--non-recursive")
         whatsnew = ExternalCommand(cwd=self.repository.basedir, command=cmd)
-        output = whatsnew.execute(stdout=PIPE, stderr=STDOUT)[0]
-        unknown = [l for l in output.readlines() if l.startswith('?')]
+        output = whatsnew.execute(dirs or [], stdout=PIPE, stderr=STDOUT)[0]
+        return [l for l in output.readlines() if l.startswith('?')]
+
+    def _postCommitCheck(self):
+        """
+        Assert that all the entries in the working dir are versioned.
+        """
+
+        if self.repository.dump_file:
+            return
+
+        # Check only every Nth commit, when asked to
+        interval = self.repository.post_commit_check_interval
+        if not interval or self.__commits % interval:
+            return
+
+        unknown = self.__unversionedEntries(self.__touched)
         if unknown:
             raise PostCommitCheckFailure(
                 "Changes left in working dir after commit:\n%s" % ''.join(unknown))
@@ -807,6 +1358,10 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         Remove some filesystem objects.
         """
 
+        if self.repository.dump_file:
+            self.__recordDumpChanges('delete', names)
+            return
+
         cmd = self.repository.command("remove", "--quiet", "--force")
         remove = ExternalCommand(cwd=self.repository.basedir, command=cmd)
         remove.execute(names)
@@ -821,6 +1376,10 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         from time import sleep
         from datetime import datetime
 
+        if self.repository.dump_file:
+            self.__recordDumpChanges('rename', [newname], oldname)
+            return
+
         # --force in case the file has been changed and moved in one revision
         cmd = self.repository.command("mv", "--quiet", "--force")
         # Subversion does not seem to allow
@@ -862,12 +1421,174 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
                                               % (str(move), move.exit_status,
                                                  err.read()))
 
+    def _editPathnames(self, names):
+        """
+        Records a sequence of filesystem objects as updated.
+        """
+
+        if self.repository.dump_file:
+            self.__recordDumpChanges('change', names)
+
+    def __recordDumpChanges(self, action, names, oldname=None):
+        """
+        Remember the changes to be written in the next revision of the dump.
+        """
+
+        if self.__dump_changes is None:
+            self.__dump_changes = []
+        self.__dump_changes.extend([(action, name, oldname) for name in names])
+
+    def __dumpPath(self, name):
+        """
+        Return the path of the entry `name` within the dumped repository.
+        """
+
+        from posixpath import join
+
+        module = self.repository.module.strip('/')
+        if module and name:
+            return join(module, name)
+        else:
+            return module or name
+
+    def __dumpNode(self, action, path, name, copyfrom=None):
+        """
+        Write the node for the entry `name`, with its current content.
+        """
+
+        from os import readlink, stat
+        from os.path import join, isdir, islink
+
+        fullname = join(self.repository.basedir, name)
+        if isdir(fullname) and not islink(fullname):
+            self.__dump.writeNode(path, action, 'dir', copyfrom=copyfrom,
+                                  properties=copyfrom is None and {} or None)
+            return
+
+        if islink(fullname):
+            text = 'link ' + readlink(fullname)
+            properties = {'svn:special': '*'}
+        else:
+            f = open(fullname, 'rb')
+            text = f.read()
+            f.close()
+            properties = {}
+            if stat(fullname).st_mode & 0111:
+                properties['svn:executable'] = '*'
+        self.__dump.writeNode(path, action, 'file', text, properties, copyfrom)
+
+    def __dumpRevision(self, date, author, logmessage, isinitialcommit):
+        """
+        Write the recorded changes as a new revision of the dump.
+        """
+
+        from os.path import join, lexists
+        from vcpx.svndump import append_to_dump
+
+        changes = self.__dump_changes or []
+        self.__dump_changes = None
+        if not changes and not isinitialcommit:
+            self.log.warning('Nothing to dump')
+            return
+
+        if self.__dump is None:
+            self.__dump = append_to_dump(self.repository.dump_file)
+        dump = self.__dump
+
+        encode = self.repository.encode
+        date = date.astimezone(UTC).replace(microsecond=0, tzinfo=None)
+        previous = dump.writeRevision({'svn:log': encode(logmessage),
+                                       'svn:author': encode(author),
+                                       'svn:date': date.isoformat() +
+                                                   '.000000Z'}) - 1
+
+        # Create the module and the tags directory with the first revision
+        if not dump.paths:
+            dirs = [self.__dumpPath('')]
+            if self.repository.module.strip('/'):
+                dirs.append(self.repository.tags_path.strip('/'))
+            for dir in dirs:
+                if not dir:
+                    continue
+                parents = dir.split('/')
+                for i in range(1, len(parents)+1):
+                    parent = '/'.join(parents[:i])
+                    if not dump.paths.has_key(parent):
+                        dump.writeNode(parent, 'add', 'dir', properties={})
+
+        written = {}
+        for action, name, oldname in changes:
+            path = encode(self.__dumpPath(name))
+            if written.has_key((action, path)):
+                continue
+            written[(action, path)] = True
+
+            known = dump.paths.has_key(path)
+            present = lexists(join(self.repository.basedir, name))
+            if action == 'delete':
+                if known:
+                    dump.writeNode(path, 'delete')
+            elif action == 'rename' and present:
+                oldpath = encode(self.__dumpPath(oldname))
+                if dump.paths.has_key(oldpath):
+                    if known:
+                        dump.writeNode(path, 'delete')
+                    self.__dumpNode('add', path, name, (oldpath, previous))
+                    dump.writeNode(oldpath, 'delete')
+                elif not known:
+                    self.__dumpNode('add', path, name)
+            elif present:
+                if not known:
+                    self.__dumpNode('add', path, name)
+                elif dump.paths[path] == 'file':
+                    self.__dumpNode('change', path, name)
+        dump.stream.flush()
+
+    def __dumpTag(self, tag, date, author):
+        """
+        Write a revision copying the module under the tags directory.
+        """
+
+        from os.path import join
+        from vcpx.svndump import append_to_dump
+
+        module = self.__dumpPath('')
+        if not module:
+            self.log.debug("Tags needs module setup other than '/'")
+            return
+
+        if self.__dump is None:
+            self.__dump = append_to_dump(self.repository.dump_file)
+        dump = self.__dump
+
+        encode = self.repository.encode
+        date = date.astimezone(UTC).replace(microsecond=0, tzinfo=None)
+        previous = dump.writeRevision({'svn:log': encode(tag),
+                                       'svn:author': encode(author),
+                                       'svn:date': date.isoformat() +
+                                                   '.000000Z'}) - 1
+        path = encode(join(self.repository.tags_path.strip('/'),
+                           tag.replace('/', '_')))
+        if dump.paths.has_key(path):
+            dump.writeNode(path, 'delete')
+        dump.writeNode(path, 'add', 'dir', copyfrom=(encode(module), previous))
+        dump.stream.flush()
+
+    def finalizeTargetRepository(self):
+        """
+        Close the dump file, if any.
+        """
+
+        if self.__dump is not None:
+            self.__dump.stream.close()
+            self.__dump = None
+
     def _prepareTargetRepository(self):
         """
         Check for target repository existence, eventually create it.
         """
 
-        if not self.repository.repository:
+        if not self.repository.repository or self.repository.dump_file:
             return
 
         self.repository.create()
@@ -883,6 +1604,9 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
         if not self.repository.repository or exists(join(self.repository.basedir, self.repository.METADIR)):
             return
 
+        if self.repository.dump_file:
+            return
+
         cmd = self.repository.command("co", "--quiet")
         if self.repository.ignore_externals:
             cmd.append("--ignore-externals")
@@ -900,6 +1624,8 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
             ignore.append(sfrelname)
             ignore.append(sfrelname+'.old')
             ignore.append(sfrelname+'.journal')
+            ignore.append(sfrelname+'-journal')
+            ignore.append(sfrelname+'-wal')
 
         cmd = self.repository.command("propset", "%(propname)s", "--quiet")
         pset = ExternalCommand(cwd=self.repository.basedir, command=cmd)
@@ -912,7 +1638,8 @@ class SvnWorkingDir(UpdatableSourceWorkingDir, SynchronizableTargetWorkingDir):
 
         from os.path import exists, join
 
-        if not exists(join(self.repository.basedir, self.repository.METADIR)):
+        if (not self.repository.dump_file and
+            not exists(join(self.repository.basedir, self.repository.METADIR))):
             raise TargetInitializationFailure("'%s' needs to be an SVN working copy already under SVN" % self.repository.basedir)
 
         SynchronizableTargetWorkingDir._initializeWorkingDir(self)
@@ -14,6 +14,46 @@ except ImportError:
     # Older snakes
     from _process import Popen, PIPE, STDOUT
 
+from sys import platform
+
+if platform == 'win32':
+    restore_sigint = None
+else:
+    def restore_sigint():
+        """
+        Reset the SIGINT handler of a child process to the default:
+        tailor ignores it while writing its state, and the children
+        would inherit that, becoming uninterruptible.
+        """
+
+        from signal import signal, SIGINT, SIG_DFL
+
+        signal(SIGINT, SIG_DFL)
+
+def setup_environment(kwargs):
+    """
+    Compute the environment of a command, unless explicitly given with
+    an ``env`` keyword, overriding the ``LANG``, ``TZ`` and ``PATH``
+    variables with the keywords of the same name.
+    """
+
+    from os import environ
+
+    if not kwargs.has_key('env'):
+        env = kwargs['env'] = {}
+        env.update(environ)
+
+        for v in ['LANG', 'TZ', 'PATH']:
+            if kwargs.has_key(v):
+                env[v] = kwargs[v]
+        # Override also LC_ALL that has a higher priority over LANG,
+        # and LC_MESSAGES as well.
+        if kwargs.has_key('LANG'):
+            env['LC_ALL'] = kwargs['LANG']
+            env['LC_MESSAGES'] = kwargs['LANG']
+    return kwargs['env']
+
+
 class ReopenableNamedTemporaryFile:
     """
     This uses tempfile.mkstemp() to generate a secure temp file.  It
@@ -40,6 +80,78 @@ class ReopenableNamedTemporaryFile:
         remove(self.name)
 
 
+class StreamedOutput(object):
+    """
+    File-like iterator over the output of a still running command.
+
+    This is what ``ExternalCommand.execute()`` returns as the output
+    stream when called with ``stream=True``: the data is read straight
+    from the pipe, so the caller may start its work before the command
+    is finished and without holding its whole output in memory.
+
+    When the end of the stream is reached, or when it gets explicitly
+    closed, the command is waited for and its ``exit_status`` is set.
+    """
+
+    def __init__(self, command, process, error=None):
+        self.command = command
+        """The ExternalCommand that started the process."""
+
+        self.process = process
+        """The running process."""
+
+        self.error = error
+        """Temporary file collecting the error stream, if requested."""
+
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def read(self, size=-1):
+        """Read at most `size` bytes, or everything when negative."""
+
+        if self.closed:
+            return ''
+        data = self.process.stdout.read(size)
+        if not data or size < 0:
+            self.close()
+        return data
+
+    def readline(self):
+        """Read the next line."""
+
+        if self.closed:
+            return ''
+        line = self.process.stdout.readline()
+        if not line:
+            self.close()
+        return line
+
+    def close(self):
+        """
+        Close the pipe and wait the end of the command.
+
+        Closing the stream before its end usually kills the command
+        with a broken pipe, so the exit status will reflect that.
+        """
+
+        if self.closed:
+            return
+        self.closed = True
+        self.process.stdout.close()
+        self.process.wait()
+        if self.error is not None:
+            self.error.seek(0)
+        self.command._setExitStatus(self.process.returncode)
+
+
 class ExternalCommand:
     """Wrap a single command to be executed by the shell."""
 
@@ -140,7 +252,19 @@ class ExternalCommand:
         return ''.join(result)
 
     def execute(self, *args, **kwargs):
-        """Execute the command, avoiding too long command line."""
+        """
+        Execute the command, avoiding too long command line.
+
+        Passing ``stream=True`` together with ``stdout=PIPE`` the output
+        is returned as a ``StreamedOutput`` that reads it as the command
+        produces it: in this case the command line is never split, and
+        the ``exit_status`` is known only after the output has been
+        consumed or the stream closed.  Likewise, a requested error
+        stream is complete only at that point.
+
+        Passing ``binary=True`` the output is returned as is, without
+        the translation of the line endings.
+        """
 
         from cStringIO import StringIO
 
@@ -155,7 +279,7 @@ class ExternalCommand:
             allargs = list(args)
 
         maxlen = self.MAX_CMDLINE_LENGTH
-        if maxlen is None or len(allargs) < 2:
+        if maxlen is None or len(allargs) < 2 or kwargs.get('stream'):
             return self._execute(allargs, **kwargs)
 
         startlen = len(' '.join(self.command))
@@ -192,7 +316,7 @@ class ExternalCommand:
 
         from sys import stderr
         from locale import getpreferredencoding
-        from os import environ, getcwd
+        from os import getcwd
         from os.path import isdir
         from cStringIO import StringIO
         from errno import ENOENT
@@ -216,22 +340,20 @@ class ExternalCommand:
 
         if self.log: self.log.debug("Executing %r (%r)", self, cwd)
 
-        if not kwargs.has_key('env'):
-            env = kwargs['env'] = {}
-            env.update(environ)
-
-            for v in ['LANG', 'TZ', 'PATH']:
-                if kwargs.has_key(v):
-                    env[v] = kwargs[v]
-            # Override also LC_ALL that has a higher priority over LANG,
-            # and LC_MESSAGES as well.
-            if kwargs.has_key('LANG'):
-                env['LC_ALL'] = kwargs['LANG']
-                env['LC_MESSAGES'] = kwargs['LANG']
+        setup_environment(kwargs)
 
         input = kwargs.get('input')
         output = kwargs.get('stdout')
         error = kwargs.get('stderr')
+        stream = kwargs.get('stream') and output == PIPE
+        errors = None
+
+        if stream and error == PIPE:
+            # Collecting the error stream in a pipe could block the
+            # command while we are waiting for its output
+            from tempfile import TemporaryFile
+
+            error = errors = TemporaryFile()
 
         # When not in debug, redirect stderr and stdout to /dev/null
         # when the caller didn't ask for them.
@@ -251,7 +373,8 @@ class ExternalCommand:
                             stderr=error,
                             env=kwargs.get('env'),
                             cwd=cwd,
-                            universal_newlines=True)
+                            preexec_fn=restore_sigint,
+                            universal_newlines=not kwargs.get('binary'))
         except OSError, e:
             if e.errno == ENOENT:
                 raise OSError("%r does not exist!" % self._last_command[0])
@@ -266,13 +389,23 @@ class ExternalCommand:
                                  "pass an already encoded input" % encoding)
             input = input.encode(encoding, 'ignore')
 
+        if stream:
+            if input:
+                from threading import Thread
+
+                def feed(pipe=process.stdin, input=input):
+                    pipe.write(input)
+                    pipe.close()
+
+                feeder = Thread(target=feed)
+                feeder.setDaemon(True)
+                feeder.start()
+
+            return StreamedOutput(self, process, errors), errors
+
         out, err = process.communicate(input=input)
 
-        self.exit_status = process.returncode
-        if self.exit_status in self.ok_status:
-            if self.log: self.log.info("[Ok]")
-        else:
-            if self.log: self.log.warning("[Status %s]", self.exit_status)
+        self._setExitStatus(process.returncode)
 
         # For debug purposes, copy the output to our stderr when hidden above
         if self.DEBUG:
@@ -289,3 +422,209 @@ class ExternalCommand:
             err = StringIO(err)
 
         return out, err
+
+    def _setExitStatus(self, exit_status):
+        """Record the exit status of the command and log it."""
+
+        self.exit_status = exit_status
+        if self.exit_status in self.ok_status:
+            if self.log: self.log.info("[Ok]")
+        else:
+            if self.log: self.log.warning("[Status %s]", self.exit_status)
+
+
+class PipelineProcesses(object):
+    """
+    The running processes of an ``ExternalPipeline``, looking like a
+    single one to ``StreamedOutput``: the output is the one of the
+    last process, and waiting means waiting for all of them.
+    """
+
+    def __init__(self, pipeline, processes):
+        self.pipeline = pipeline
+        self.processes = processes
+        self.stdout = processes[-1].stdout
+        self.returncode = None
+
+    def wait(self):
+        """Wait for all the processes, returning the pipeline status."""
+
+        for stage, process in zip(self.pipeline.stages, self.processes):
+            process.wait()
+            stage._setExitStatus(process.returncode)
+        self.pipeline.exit_statuses = [stage.exit_status
+                                       for stage in self.pipeline.stages]
+        self.returncode = 0
+        for status in self.pipeline.exit_statuses:
+            if status:
+                self.returncode = status
+                break
+        return self.returncode
+
+
+class ExternalPipeline:
+    """
+    Wrap a chain of commands, each feeding its output to the input of
+    the next one thru an OS pipe, like a shell pipeline does.
+
+    The commands run concurrently and the intermediate data is never
+    held by tailor. The ``exit_status`` of the pipeline is the first
+    non zero one of its commands, each of them available in the
+    ``exit_statuses`` list.
+    """
+
+    def __init__(self, commands, cwd=None, nolog=False):
+        """
+        Initialize the pipeline of `commands`, a sequence of lists of
+        arguments, executed in the working directory `cwd`.
+        """
+
+        self.stages = [ExternalCommand(command, cwd=cwd, nolog=True)
+                       for command in commands]
+        """An ExternalCommand for each command in the pipeline."""
+
+        self.cwd = cwd
+        """The working directory, go there before execution."""
+
+        self.exit_status = None
+        """Once the pipeline has been executed, this is its exit status."""
+
+        self.exit_statuses = None
+        """Once the pipeline has been executed, the status of each command."""
+
+        if nolog:
+            self.log = False
+        else:
+            from logging import getLogger
+            self.log = getLogger('tailor.shell')
+
+    def __str__(self):
+        r = '$' + ' |'.join([repr(stage) for stage in self.stages])
+        if self.cwd:
+            r = self.cwd + ' ' + r
+        return r
+
+    def execute(self, input=None, stdout=None, stderr=None, stream=False,
+                **kwargs):
+        """
+        Execute the pipeline, feeding `input` to the first command.
+
+        The `stdout` and `stderr` arguments have the same meaning they
+        have for ``ExternalCommand.execute()``; the error stream is
+        shared by all the commands. With ``stream=True`` and
+        ``stdout=PIPE`` the output is returned as a ``StreamedOutput``,
+        and the exit statuses are known only after it has been consumed
+        or closed.
+        """
+
+        from os import getcwd
+        from os.path import isdir
+        from cStringIO import StringIO
+        from errno import ENOENT
+        from tempfile import TemporaryFile
+
+        self.exit_status = self.exit_statuses = None
+
+        for stage in self.stages:
+            stage._last_command = stage.command
+        if self.log: self.log.info(self)
+
+        if ExternalCommand.DRY_RUN:
+            return
+
+        cwd = self.cwd or getcwd()
+        if not isdir(cwd):
+            raise OSError(ENOENT, "Working directory does not exist", cwd)
+
+        env = setup_environment(kwargs)
+
+        try:
+            from os import devnull
+        except ImportError:
+            devnull = '/dev/null'
+
+        errors = None
+        if stderr == PIPE:
+            # A pipe for the error stream could block the commands,
+            # and it should be read while they are running
+            stderr = errors = TemporaryFile()
+        elif stderr is None and not ExternalCommand.DEBUG:
+            stderr = open(devnull, 'w')
+        if stdout is None and not ExternalCommand.DEBUG:
+            stdout = open(devnull, 'w')
+
+        processes = []
+        try:
+            for stage in self.stages:
+                last = stage is self.stages[-1]
+                if processes:
+                    stdin = processes[-1].stdout
+                else:
+                    stdin = input and PIPE or None
+                if last:
+                    output = stdout
+                else:
+                    output = PIPE
+                try:
+                    process = Popen(stage.command,
+                                    stdin=stdin,
+                                    stdout=output,
+                                    stderr=stderr,
+                                    env=env,
+                                    cwd=cwd,
+                                    preexec_fn=restore_sigint,
+                                    universal_newlines=last)
+                except OSError, e:
+                    if e.errno == ENOENT:
+                        raise OSError("%r does not exist!" % stage.command[0])
+                    else:
+                        raise
+                if processes:
+                    # Only the next command should read from the pipe,
+                    # so that the writer sees when the reader exits
+                    processes[-1].stdout.close()
+                processes.append(process)
+        except:
+            for process in processes:
+                for pipe in (process.stdin, process.stdout):
+                    if pipe is not None and not pipe.closed:
+                        pipe.close()
+                process.wait()
+            raise
+
+        if input:
+            from threading import Thread
+
+            def feed(pipe=processes[0].stdin, input=input):
+                try:
+                    pipe.write(input)
+                finally:
+                    pipe.close()
+
+            feeder = Thread(target=feed)
+            feeder.setDaemon(True)
+            feeder.start()
+
+        running = PipelineProcesses(self, processes)
+        if stream and stdout == PIPE:
+            return StreamedOutput(self, running, errors), errors
+
+        out = None
+        if stdout == PIPE:
+            out = StringIO(running.stdout.read())
+            running.stdout.close()
+        self._setExitStatus(running.wait())
+
+        if errors is not None:
+            errors.seek(0)
+            errors = StringIO(errors.read())
+        return out, errors
+
+    def _setExitStatus(self, exit_status):
+        """Record the exit status of the pipeline and log it."""
+
+        self.exit_status = exit_status
+        if self.exit_status:
+            if self.log: self.log.warning("[Status %s]", self.exit_statuses)
+        else:
+            if self.log: self.log.info("[Ok]")
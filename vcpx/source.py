@@ -12,6 +12,7 @@ directory under some kind of version control system.
 
 __docformat__ = 'reStructuredText'
 
+from threading import Thread
 from vcpx import TailorBug, TailorException
 from vcpx.workdir import WorkingDir
 
@@ -49,6 +50,79 @@ class InvocationError(TailorException):
     "Bad invocation, use --help for details"
 
 
+class ChangesetApplier(Thread):
+    """
+    Apply a single changeset in the background, keeping either the
+    result of the application or the exception it raised.
+    """
+
+    def __init__(self, workingdir, changeset):
+        Thread.__init__(self, name='apply %s' % changeset.revision)
+        self.workingdir = workingdir
+        self.changeset = changeset
+        self.result = None
+        self.error = None
+
+    def run(self):
+        from sys import exc_info
+        from time import sleep
+
+        try:
+            if self.workingdir.repository.delay_before_apply:
+                sleep(self.workingdir.repository.delay_before_apply)
+            self.result = self.workingdir._applyChangeset(self.changeset)
+        except:
+            self.error = exc_info()
+
+    def wait(self):
+        """
+        Wait the end of the application and return its result,
+        reraising the exception if it failed.
+        """
+
+        self.join()
+        if self.error is not None:
+            exc_type, exc_value, traceback = self.error
+            self.error = None
+            raise exc_type, exc_value, traceback
+        return self.result
+
+
+class UpstreamPageFetcher(Thread):
+    """
+    Fetch a page of upstream changesets in the background, keeping
+    either the changesets or the exception it raised.
+    """
+
+    def __init__(self, page):
+        Thread.__init__(self, name='fetch upstream changesets')
+        self.setDaemon(True)
+        self.page = page
+        self.changesets = None
+        self.error = None
+
+    def run(self):
+        from sys import exc_info
+
+        try:
+            self.changesets = list(self.page)
+        except:
+            self.error = exc_info()
+
+    def wait(self):
+        """
+        Wait the end of the fetch and return the changesets,
+        reraising the exception if it failed.
+        """
+
+        self.join()
+        if self.error is not None:
+            exc_type, exc_value, traceback = self.error
+            self.error = None
+            raise exc_type, exc_value, traceback
+        return self.changesets
+
+
 class UpdatableSourceWorkingDir(WorkingDir):
     """
     This is an abstract working dir able to follow an upstream
@@ -69,8 +143,11 @@ class UpdatableSourceWorkingDir(WorkingDir):
     Subclasses MUST override at least the _underscoredMethods.
     """
 
+    __last_queued = None
+    """The last changeset written in the state file by this session."""
+
     def applyPendingChangesets(self, applyable=None, replayable=None,
-                               replay=None, applied=None):
+                               replay=None, applied=None, stage=None):
         """
         Apply the collected upstream changes.
 
@@ -79,6 +156,12 @@ class UpdatableSourceWorkingDir(WorkingDir):
         not raise conflicts call the `replay` function to mirror the
         changes on the target.
 
+        When `stage` is given the process is *pipelined*: it's called
+        with each applied changeset and must copy whatever `replay`
+        needs out of this working dir, returning False to stop the
+        process. Then the next changeset gets applied in background
+        while `replay` commits the current one.
+
         Return a tuple of two elements:
 
         - the last applied changeset, if any
@@ -87,13 +170,17 @@ class UpdatableSourceWorkingDir(WorkingDir):
 
         from time import sleep
 
+        if stage is not None:
+            return self.__applyPipelined(applyable, replayable, replay,
+                                         applied, stage)
+
         c = None
         last = None
         conflicts = []
 
         try:
             i = 0
-            for c in self.state_file:
+            for c in self.__pendingChangesets():
                 i += 1
                 self.log.info('Changeset #%d', i)
                 # Give the opportunity to subclasses to stop the application
@@ -152,6 +239,86 @@ class UpdatableSourceWorkingDir(WorkingDir):
 
         return last, conflicts
 
+    def __applyPipelined(self, applyable, replayable, replay, applied, stage):
+        """
+        Pipelined variant of applyPendingChangesets().
+
+        The commit on the target happens in the main thread, the only
+        one allowed to mask SIGINT, and the state file is notified
+        about each changeset, in order, only after its replay: an
+        interruption leaves the changeset being applied in background
+        pending, and it will be applied again by next run.
+        """
+
+        last = None
+        conflicts = []
+        changesets = self.__pendingChangesets()
+
+        def start():
+            try:
+                changeset = changesets.next()
+            except StopIteration:
+                return None
+            if not self._willApplyChangeset(changeset, applyable):
+                self.log.info('Stopping application, %r remains pending',
+                              changeset.revision)
+                return None
+            worker = ChangesetApplier(self, changeset)
+            worker.start()
+            return worker
+
+        worker = None
+        try:
+            i = 0
+            worker = start()
+            while worker is not None:
+                c = worker.changeset
+                i += 1
+                self.log.info('Changeset #%d', i)
+
+                try:
+                    res = worker.wait()
+                except TailorException, e:
+                    self.log.critical("Couldn't apply changeset:\n%s", c)
+                    raise
+                worker = None
+
+                if res:
+                    try:
+                        self._handleConflict(c, conflicts, res)
+                    except KeyboardInterrupt:
+                        self.log.warning("INTERRUPTED BY THE USER!")
+                        break
+
+                replaying = self._didApplyChangeset(c, replayable)
+                if replaying and not stage(c):
+                    self.log.info('Stopping application, %r remains pending',
+                                  c.revision)
+                    break
+
+                # The working dir is free again: start applying the next
+                # changeset while the current one gets committed.
+                worker = start()
+
+                if replaying and replay:
+                    try:
+                        replay(c)
+                    except Exception, e:
+                        self.log.critical("Couldn't replay changeset:\n%s", c)
+                        raise
+
+                last = c
+                self.state_file.applied(c)
+
+                if applied:
+                    applied(last)
+        finally:
+            if worker is not None:
+                worker.join()
+            self.state_file.finalize()
+
+        return last, conflicts
+
     def _willApplyChangeset(self, changeset, applyable=None):
         """
         This gets called just before applying each changeset.  The whole
@@ -207,9 +374,53 @@ class UpdatableSourceWorkingDir(WorkingDir):
             else:
                 revision = sincerev
             changesets = self._getUpstreamChangesets(revision)
-            self.state_file.setPendingChangesets(changesets)
+            self.state_file.setPendingChangesets(self.__queued(changesets))
         return self.state_file
 
+    def __queued(self, changesets):
+        """
+        Remember the last of the `changesets` written in the state file.
+        """
+
+        for cs in changesets:
+            self.__last_queued = cs
+            yield cs
+
+    def __pendingChangesets(self):
+        """
+        Iterate over the pending changesets in the state file.
+
+        When the backend collects the upstream changesets in pages, the
+        next page is fetched in background while the current one gets
+        applied, and appended to the state file when it runs out.
+        """
+
+        while True:
+            fetcher = None
+            if self.__last_queued is not None:
+                page = self._getNextUpstreamPage(self.__last_queued.revision)
+                if page is not None:
+                    fetcher = UpstreamPageFetcher(page)
+                    fetcher.start()
+
+            for c in self.state_file:
+                yield c
+
+            if fetcher is not None:
+                changesets = fetcher.wait()
+            elif (self.__last_queued is None and
+                  self.state_file.current is not None):
+                # Pending changesets left by a previous session
+                changesets = self._getNextUpstreamPage(
+                    self.state_file.current.revision)
+            else:
+                changesets = None
+            if changesets is None:
+                break
+
+            self.__last_queued = None
+            self.state_file.appendPendingChangesets(self.__queued(changesets))
+
     def _getUpstreamChangesets(self, sincerev):
         """
         Query the upstream repository about what happened on the
@@ -221,6 +432,20 @@ class UpdatableSourceWorkingDir(WorkingDir):
 
         raise TailorBug("%s should override this method!" % self.__class__)
 
+    def _getNextUpstreamPage(self, sincerev):
+        """
+        Return the upstream changesets following `sincerev`, when the
+        backend fetches them in pages and the last page may not be the
+        final one, None otherwise.
+
+        The changesets are consumed in a separate thread, concurrently
+        with the application of the ones already pending: this is
+        possible only when collecting them does not touch the working
+        directory.
+        """
+
+        return None
+
     def _applyChangeset(self, changeset):
         """
         Do the actual work of applying the changeset to the working copy.
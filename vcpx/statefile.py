@@ -18,25 +18,60 @@ file helps keeping a cache of pending changes.
 
 __docformat__ = 'reStructuredText'
 
-from cPickle import load, dump
+from cPickle import load, loads, dumps, HIGHEST_PROTOCOL
 from signal import signal, SIGINT, SIG_IGN
+from struct import pack, unpack, calcsize, error as StructError
+
+LOG_MAGIC = 'TAILORSF'
+LOG_HEADER = '>8sI'         # magic, generation
+INDEX_MAGIC = 'TAILORIX'
+INDEX_HEADER = '>8sIQQQQ'   # magic, generation, last, next, count, size
+RECORD_HEADER = '>cI'       # kind, length of the pickle
+
+PENDING = 'P'
+APPLIED = 'A'
+CONSUMED = 'C'
+
+
+def _uninterruptibly(function, *args):
+    """
+    Call `function` with SIGINT ignored, so that the user cannot
+    leave the state file half written.  Keep it short: the commands
+    executed meanwhile cannot be interrupted either.
+    """
+
+    previous = signal(SIGINT, SIG_IGN)
+    try:
+        return function(*args)
+    finally:
+        signal(SIGINT, previous)
+
 
 class StateFile(object):
     """
     State file that stores current revision and pending changesets.
 
     It behaves as an iterator, and source backends loop over not yet
-    applied changesets, calling .applied() after each one: that writes
-    the applied changeset in a *journal* file, much more atomic than
-    rewriting the whole archive each time.
-
-    When the source backend finishes it's job, either because there
-    are no more pending changeset or stopped by an error, it calls
-    .finalize(), that in presence of a journal file adjust the
-    archive filtering out already applied changesets.
-
-    Should an hard error prevent .finalize() call, it will happen
-    automatically next time the state file is loaded.
+    applied changesets, calling .applied() after each one.
+
+    The state file is an append-only log of pickled records, each
+    prefixed by its kind and length: pending changesets, applied ones
+    and consumption marks.  A small fixed size *index*, kept in the
+    ``.journal`` file, tells where the last applied changeset is, where
+    the next pending one starts and how many are left.  Marking a
+    pending changeset as applied appends just the offset of its record
+    to the log and rewrites the index in place, while checking for
+    pending changesets reads just the index.  A full copy of the
+    applied changeset is written only when it does not come from the
+    queue, as it happens at bootstrap, and at the start of each log.
+
+    When the source backends fetch a new queue of changesets, the log
+    gets rewritten from scratch, with a new *generation* number, that
+    allows detecting an index not matching the log.
+
+    State files written by older versions of tailor, a plain stream of
+    pickles, are converted automatically the first time they are
+    loaded, keeping the original as ``.old``.
     """
 
     def __init__(self, fname, config):
@@ -50,43 +85,270 @@ class StateFile(object):
         self.archive = None
         self.last_applied = None
         self.current = None
+        self._read = []
+        self._held = None
+        self._closing = False
         self.log = getLogger('tailor.statefile')
 
+    def _readIndex(self):
+        """
+        Read the index, returning a tuple ``(generation, last, next,
+        count, size)`` or None if it does not exist.
+        """
+
+        try:
+            index = open(self.filename + '.journal', 'rb')
+        except IOError:
+            return None
+        header = index.read(calcsize(INDEX_HEADER))
+        index.close()
+        if len(header) < calcsize(INDEX_HEADER):
+            return None
+        fields = unpack(INDEX_HEADER, header)
+        if fields[0] <> INDEX_MAGIC:
+            return None
+        return fields[1:]
+
+    def _writeIndex(self):
+        """
+        Rewrite the index, in place when it already exists.
+        """
+
+        from os.path import exists
+
+        iname = self.filename + '.journal'
+        index = open(iname, exists(iname) and 'r+b' or 'wb')
+        index.write(pack(INDEX_HEADER, INDEX_MAGIC, self._generation,
+                         self._last, self._next, self._count, self._size))
+        index.close()
+
+    def _skipRecord(self, log, offset):
+        """
+        Return kind and total length of the record at `offset`,
+        leaving the file positioned on its pickle.
+        """
+
+        log.seek(offset)
+        kind, length = unpack(RECORD_HEADER,
+                              log.read(calcsize(RECORD_HEADER)))
+        return kind, calcsize(RECORD_HEADER) + length
+
+    def _readRecord(self, log, offset):
+        """
+        Unpickle the object stored in the record at `offset`.
+        """
+
+        kind, length = self._skipRecord(log, offset)
+        return loads(log.read(length - calcsize(RECORD_HEADER)))
+
+    def _appendRecord(self, log, kind, obj):
+        """
+        Append a record at the end of the log, returning its offset.
+        """
+
+        offset = self._size
+        data = dumps(obj, HIGHEST_PROTOCOL)
+        log.seek(offset)
+        # Get rid of possible garbage left by an interrupted append
+        log.truncate()
+        log.write(pack(RECORD_HEADER, kind, len(data)))
+        log.write(data)
+        log.flush()
+        self._size = log.tell()
+        return offset
+
+    def _isLegacy(self):
+        """
+        Tell whether the state file is in the old plain pickle format.
+        """
+
+        try:
+            log = open(self.filename, 'rb')
+        except IOError:
+            return False
+        magic = log.read(len(LOG_MAGIC))
+        log.close()
+        return bool(magic) and magic <> LOG_MAGIC
+
+    def _recoverIndex(self, log, generation):
+        """
+        Rebuild the index scanning the whole log: this happens only
+        when the index is missing or belongs to a previous generation,
+        that is when tailor got killed while writing a new log.
+
+        Each consumption mark tells which pending changeset got
+        applied; the queue restarts after the last one.
+        """
+
+        self.log.warning('Rebuilding the index of the state file %s',
+                         self.filename)
+
+        self._generation = generation
+        self._last = 0
+        offset = calcsize(LOG_HEADER)
+        log.seek(0, 2)
+        self._size = end = log.tell()
+        pendings = []
+        self._next = offset
+        while offset < end:
+            try:
+                kind, length = self._skipRecord(log, offset)
+            except StructError:
+                length = end
+            if offset + length > end:
+                # Truncated record
+                self._size = offset
+                break
+            if kind == APPLIED:
+                self._last = offset
+            elif kind == CONSUMED:
+                self._last = self._readRecord(log, offset)
+                self._next = self._last + self._skipRecord(log, self._last)[1]
+            else:
+                pendings.append(offset)
+            offset += length
+        self._count = len([p for p in pendings if p >= self._next])
+        self._writeIndex()
+
     def _load(self):
         """
-        Open the pickle file and load the last applied changeset.
-        The second pickled object is ignored for backward compatibility.
+        Open the log and load the last applied changeset.
         """
 
-        # Take care of the journal file, if present.
-        self.finalize()
+        # Close the archive, if needed
+        self._close()
+
+        if self._isLegacy():
+            self._convert()
 
         self.current = None
+        self._read = []
         try:
-            self.archive = open(self.filename)
-            self.last_applied = load(self.archive)
-            # compatibility dummity: there was the queuelen here
-            load(self.archive)
+            self.archive = open(self.filename, 'r+b')
         except IOError:
             self.archive = None
             self.last_applied = None
+            return
 
-    def _write(self, changesets):
+        header = self.archive.read(calcsize(LOG_HEADER))
+        if len(header) < calcsize(LOG_HEADER):
+            # Empty file, as if it did not exist
+            self.archive.close()
+            self.archive = None
+            self.last_applied = None
+            return
+
+        magic, generation = unpack(LOG_HEADER, header)
+        index = self._readIndex()
+        if index is None or index[0] <> generation:
+            self._recoverIndex(self.archive, generation)
+        else:
+            (self._generation, self._last, self._next,
+             self._count, self._size) = index
+        self._pos = self._next
+
+        if self._last:
+            self.last_applied = self._readRecord(self.archive, self._last)
+        else:
+            self.last_applied = None
+
+    def _convert(self):
         """
-        Write the state file, that is dump last applied changeset,
-        a dummy None, then one changeset at a time.
+        Convert a state file written by an older version of tailor,
+        taking into account its journal, if present.
         """
 
+        from os.path import exists
+        from os import unlink, rename
+
+        self.log.info('Converting state file %s to the indexed format',
+                      self.filename)
+
+        old = open(self.filename, 'rb')
+        last_applied = load(old)
+        load(old) # dummy queuelen
+
+        jname = self.filename + '.journal'
+        if exists(jname):
+            journal = open(jname, 'rb')
+            last_applied = load(journal)
+            journal.close()
+
+        def pending():
+            try:
+                cs = load(old)
+                if exists(jname):
+                    # Skip already applied changesets
+                    while cs <> last_applied:
+                        cs = load(old)
+                    cs = load(old)
+                while True:
+                    yield cs
+                    cs = load(old)
+            except EOFError:
+                pass
+
+        previous = signal(SIGINT, SIG_IGN)
+        try:
+            self.last_applied = last_applied
+            self._create(self.filename + '.new', pending(), 1)
+            old.close()
+
+            oldname = self.filename + '.old'
+            if exists(oldname):
+                unlink(oldname)
+            rename(self.filename, oldname)
+            rename(self.filename + '.new', self.filename)
+            if exists(jname):
+                unlink(jname)
+            self._writeIndex()
+        finally:
+            signal(SIGINT, previous)
+
+    def _create(self, fname, changesets, generation):
+        """
+        Write a new log in `fname`: the last applied changeset,
+        if any, followed by the pending ones. Return the number of
+        pending changesets.
+        """
+
+        self._generation = generation
+        self._size = 0
+        log = open(fname, 'w+b')
+        log.write(pack(LOG_HEADER, LOG_MAGIC, generation))
+        self._size = log.tell()
+        if self.last_applied is not None:
+            self._last = _uninterruptibly(self._appendRecord, log, APPLIED,
+                                          self.last_applied)
+        else:
+            self._last = 0
+        self._next = self._size
         count = 0
+        # The changesets may be streamed by an upstream command: let
+        # the user stop it, SIGINT is ignored only while writing
+        for cs in changesets:
+            _uninterruptibly(self._appendRecord, log, PENDING, cs)
+            count += 1
+        log.close()
+        self._count = count
+        return count
+
+    def _write(self, changesets):
+        """
+        Write a new state file, with the last applied changeset and the
+        pending ones, bumping its generation.
+        """
+
+        from os import rename
+
+        index = self._readIndex()
+        generation = index and index[0]+1 or 1
+
+        count = self._create(self.filename + '.new', changesets, generation)
         previous = signal(SIGINT, SIG_IGN)
         try:
-            sf = open(self.filename, 'w')
-            dump(self.last_applied, sf)
-            dump(None, sf)
-            for cs in changesets:
-                dump(cs, sf)
-                count += 1
-            sf.close()
+            rename(self.filename + '.new', self.filename)
+            self._writeIndex()
         finally:
             signal(SIGINT, previous)
         self.log.info('Cached information about %d pending changesets', count)
@@ -100,13 +362,39 @@ class StateFile(object):
     def next(self):
         if not self.archive:
             raise StopIteration
-        try:
-            self.current = load(self.archive)
-        except EOFError:
-            self.archive.close()
-            self.archive = None
-            raise StopIteration
-        return self.current
+
+        while self._pos < self._size:
+            kind, length = self._skipRecord(self.archive, self._pos)
+            if kind == PENDING:
+                cs = self._readRecord(self.archive, self._pos)
+                # Remember where it is, for .applied()
+                self._read.append((cs, self._pos, self._pos + length))
+                self._pos += length
+                self.current = cs
+                return cs
+            self._pos += length
+
+        # Keep the archive open: the changesets just read may still
+        # be marked as applied
+        raise StopIteration
+
+    def upcoming(self, count):
+        """
+        Return the next `count` pending changesets, following the one
+        just read, without consuming them.
+        """
+
+        upcoming = []
+        if not self.archive:
+            return upcoming
+
+        pos = self._pos
+        while pos < self._size and len(upcoming) < count:
+            kind, length = self._skipRecord(self.archive, pos)
+            if kind == PENDING:
+                upcoming.append(self._readRecord(self.archive, pos))
+            pos += length
+        return upcoming
 
     def pending(self):
         """
@@ -118,97 +406,113 @@ class StateFile(object):
         if self.archive is None:
             return False
 
-        pos = self.archive.tell()
-        try:
-            next = load(self.archive)
-        except EOFError:
-            next = None
-        self.archive.seek(pos)
-        return next is not None
+        return self._count > len(self._read)
 
     def applied(self, current=None):
         """
-        Write the applied changeset to the journal file.
+        Mark the changeset as applied, or keep it in memory when the
+        state file is being held.
         """
 
-        previous = signal(SIGINT, SIG_IGN)
-        try:
-            self.last_applied = current or self.current
-            journal = open(self.filename + '.journal', 'w')
-            dump(self.last_applied, journal)
-            journal.close()
-        finally:
-            signal(SIGINT, previous)
+        applied = current or self.current
+        if self._held is not None:
+            self._held.append(applied)
+        else:
+            self._applied(applied)
+
+    def hold(self):
+        """
+        Keep the changesets notified to .applied() in memory, without
+        recording them, until .release() is called.
+
+        This is used by the targets that make their commits permanent
+        only from time to time: should the process die in between, the
+        changesets will be applied again by next run.
+        """
+
+        if self._held is None:
+            self._held = []
+
+    def release(self, confirmed=True):
+        """
+        Stop holding the applied changesets, recording them when the
+        target `confirmed` their commits, forgetting them otherwise.
+        """
+
+        held = self._held
+        self._held = None
+        if held and confirmed:
+            for applied in held:
+                self._applied(applied)
+        if self._closing:
+            self._closing = False
+            self._close()
 
     def finalize(self):
         """
-        If there is a journal file, adjust the archive accordingly,
-        dropping already applied changesets.
+        Close the state file, or postpone that to .release() when
+        some applied changeset is being held.
         """
 
-        from os.path import exists
-        from os import unlink, rename
+        if self._held:
+            self._closing = True
+        else:
+            self._close()
+
+    def _applied(self, applied):
+        """
+        Mark the applied changeset in the log and advance the index.
+        """
 
         previous = signal(SIGINT, SIG_IGN)
         try:
-            if self.archive is not None:
-                self.archive.close()
-                self.archive = None
-
-            if exists(self.filename + '.journal'):
-                self.log.debug('Adjusting the state accordingly to journal')
-                # Load last applied changeset from the journal
-                journal = open(self.filename + '.journal')
-                last_applied = load(journal)
-                journal.close()
-
-                # If there is an actual archive (ie, this is not
-                # bootstrap time) load the changesets from there,
-                # skipping the changesets until the last_applied one,
-                # then transfer the remaining to the new archive.
-                if exists(self.filename):
-                    old = open(self.filename)
-                    load(old) # last applied
-                    load(old) # dummy queuelen
-                    try:
-                        cs = load(old)
-                        # Skip already applied changesets
-                        while cs <> last_applied:
-                            cs = load(old)
-                    except EOFError:
-                        cs = None
-                    sf = open(self.filename + '.new', 'w')
-                    dump(last_applied, sf)
-                    dump(None, sf)
-                    if cs is not None:
-                        count = 0
-                        while True:
-                            try:
-                                cs = load(old)
-                            except EOFError:
-                                break
-                            dump(cs, sf)
-                            count += 1
-                        self.log.info('%d pending changesets in state file',
-                                       count)
-                    sf.close()
-                    old.close()
-
-                    oldname = self.filename + '.old'
-                    if exists(oldname):
-                        unlink(oldname)
-                    rename(self.filename, oldname)
-                    rename(sf.name, self.filename)
-                else:
-                    sf = open(self.filename, 'w')
-                    dump(last_applied, sf)
-                    dump(None, sf)
-                    sf.close()
-
-                unlink(journal.name)
+            if self.archive is None:
+                self._load()
+            self.last_applied = applied
+
+            if self.archive is None:
+                # Bootstrap time: start a new log
+                self._write([])
+                self._load()
+                return
+
+            consumed = 0
+            for i, (cs, start, end) in enumerate(self._read):
+                if cs is applied:
+                    consumed = i+1
+                    break
+            else:
+                for i, (cs, start, end) in enumerate(self._read):
+                    if cs == applied:
+                        consumed = i+1
+                        break
+
+            if consumed:
+                # The changeset is already in the log: just mark its
+                # record as consumed
+                cs, start, end = self._read[consumed-1]
+                self._appendRecord(self.archive, CONSUMED, start)
+                self._last = start
+                self._next = end
+                del self._read[:consumed]
+                self._count -= consumed
+            else:
+                self._last = self._appendRecord(self.archive, APPLIED,
+                                                self.last_applied)
+            self._writeIndex()
         finally:
             signal(SIGINT, previous)
 
+    def _close(self):
+        """
+        Close the log: since the index is kept up to date by .applied()
+        there is nothing else to do.
+        """
+
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
     def lastAppliedChangeset(self):
         """
         Return the last applied changeset, if any, None otherwise.
@@ -223,9 +527,257 @@ class StateFile(object):
         Write pending changesets to the state file.
         """
 
+        if self.archive is None:
+            # Load the last applied changeset, to carry it over
+            self._load()
         if self.archive is not None:
             self.archive.close()
             self.archive = None
 
         self._write(changesets)
         self._load()
+
+    def appendPendingChangesets(self, changesets):
+        """
+        Append more pending changesets to the state file, after the
+        ones already there, without disturbing the iteration.
+        """
+
+        if self.archive is None:
+            self._load()
+        if self.archive is None:
+            self.setPendingChangesets(changesets)
+            return
+
+        count = 0
+        for cs in changesets:
+            _uninterruptibly(self._appendRecord, self.archive, PENDING, cs)
+            count += 1
+        self._count += count
+        _uninterruptibly(self._writeIndex)
+        self.log.info('Cached information about %d more pending changesets',
+                      count)
+
+    def pendingCount(self):
+        """
+        Return the number of changesets not yet applied.
+        """
+
+        if self.archive is None:
+            self._load()
+        if self.archive is None:
+            return 0
+        return self._count
+
+
+class SQLiteStateFile(StateFile):
+    """
+    State file stored in a SQLite database.
+
+    The pending changesets are kept in the ``changesets`` table, keyed
+    by their position in the queue and indexed on their revision; a
+    single row in the ``state`` table holds the position of the last
+    applied one along with its pickle.  Marking a changeset as applied
+    is a single transaction, and tools may count the pending
+    changesets with a query, without unpickling anything.
+    """
+
+    SCHEMA = """\
+CREATE TABLE IF NOT EXISTS changesets (
+  seq INTEGER PRIMARY KEY,
+  revision TEXT,
+  data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changesets_revision ON changesets (revision);
+CREATE TABLE IF NOT EXISTS state (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  applied_seq INTEGER NOT NULL,
+  last_applied BLOB
+);
+"""
+
+    def _load(self):
+        """
+        Connect to the database, creating the schema when needed, and
+        load the last applied changeset.
+        """
+
+        try:
+            from sqlite3 import connect
+        except ImportError:
+            from pysqlite2.dbapi2 import connect
+
+        self._close()
+
+        self.current = None
+        self._read = []
+        self.archive = connect(self.filename)
+        self.archive.executescript(self.SCHEMA)
+
+        row = self.archive.execute('SELECT applied_seq, last_applied '
+                                   'FROM state').fetchone()
+        if row is None:
+            self._pos = 0
+            self.last_applied = None
+        else:
+            self._pos = row[0]
+            self.last_applied = row[1] and loads(str(row[1])) or None
+
+    def _dumps(self, changeset):
+        return buffer(dumps(changeset, HIGHEST_PROTOCOL))
+
+    def _insert(self, seq, changeset):
+        revision = getattr(changeset, 'revision', None)
+        self.archive.execute('INSERT INTO changesets (seq, revision, data) '
+                             'VALUES (?, ?, ?)',
+                             (seq, revision is not None and str(revision)
+                              or None, self._dumps(changeset)))
+
+    def _write(self, changesets):
+        """
+        Replace the pending changesets, in a single transaction.
+        """
+
+        count = 0
+        db = self.archive
+        db.execute('DELETE FROM changesets')
+        db.execute('INSERT OR REPLACE INTO state (id, applied_seq, '
+                   'last_applied) VALUES (1, 0, ?)',
+                   (self.last_applied is not None
+                    and self._dumps(self.last_applied) or None,))
+        for cs in changesets:
+            count += 1
+            self._insert(count, cs)
+        db.commit()
+        self.log.info('Cached information about %d pending changesets', count)
+
+    def next(self):
+        if not self.archive:
+            raise StopIteration
+
+        row = self.archive.execute('SELECT seq, data FROM changesets '
+                                   'WHERE seq > ? ORDER BY seq LIMIT 1',
+                                   (self._pos,)).fetchone()
+        if row is None:
+            raise StopIteration
+        self._pos = row[0]
+        self.current = loads(str(row[1]))
+        self._read.append((self.current, self._pos))
+        return self.current
+
+    def upcoming(self, count):
+        """
+        Return the next `count` pending changesets, following the one
+        just read, without consuming them.
+        """
+
+        if not self.archive:
+            return []
+
+        rows = self.archive.execute('SELECT data FROM changesets '
+                                    'WHERE seq > ? ORDER BY seq LIMIT ?',
+                                    (self._pos, count))
+        return [loads(str(row[0])) for row in rows]
+
+    def pending(self):
+        """
+        Verify if there's at least one changeset still pending.
+        """
+
+        if self.archive is None:
+            self._load()
+        return self.archive.execute('SELECT 1 FROM changesets WHERE seq > ? '
+                                    'LIMIT 1', (self._pos,)).fetchone() \
+                                    is not None
+
+    def pendingCount(self):
+        """
+        Return the number of changesets not yet applied.
+        """
+
+        if self.archive is None:
+            self._load()
+        return self.archive.execute('SELECT COUNT(*) FROM changesets, state '
+                                    'WHERE seq > applied_seq').fetchone()[0]
+
+    def lookup(self, revision):
+        """
+        Return the pending changeset with the given `revision`, if any.
+        """
+
+        if self.archive is None:
+            self._load()
+        row = self.archive.execute('SELECT data FROM changesets, state '
+                                   'WHERE revision = ? AND seq > applied_seq',
+                                   (str(revision),)).fetchone()
+        return row and loads(str(row[0])) or None
+
+    def _applied(self, applied):
+        """
+        Record the applied changeset, in a single transaction.
+        """
+
+        if self.archive is None:
+            self._load()
+        self.last_applied = applied
+
+        seq = None
+        for i, (cs, pos) in enumerate(self._read):
+            if cs is applied or cs == applied:
+                seq = pos
+                del self._read[:i+1]
+                break
+
+        db = self.archive
+        if seq is None:
+            db.execute('INSERT OR IGNORE INTO state (id, applied_seq) '
+                       'VALUES (1, 0)')
+            db.execute('UPDATE state SET last_applied = ?',
+                       (self._dumps(applied),))
+        else:
+            db.execute('UPDATE state SET applied_seq = ?, last_applied = ?',
+                       (seq, self._dumps(applied)))
+        db.commit()
+
+    def _close(self):
+        """
+        Close the connection to the database.
+        """
+
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+    def setPendingChangesets(self, changesets):
+        """
+        Write pending changesets to the state file.
+        """
+
+        if self.archive is None:
+            self._load()
+        self._write(changesets)
+        self._load()
+
+    def appendPendingChangesets(self, changesets):
+        """
+        Append more pending changesets, in a single transaction.
+        """
+
+        if self.archive is None:
+            self._load()
+        db = self.archive
+        seq = db.execute('SELECT MAX(seq) FROM changesets').fetchone()[0] or 0
+        count = 0
+        for cs in changesets:
+            count += 1
+            self._insert(seq + count, cs)
+        db.commit()
+        self.log.info('Cached information about %d more pending changesets',
+                      count)
+
+
+STATE_FILE_FORMATS = {
+    'indexed': StateFile,
+    'sqlite': SQLiteStateFile,
+    }
+"""The recognized values of the ``state-file-format`` option."""
@@ -0,0 +1,323 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Subversion dump stream reader and writer
+# :Creato:   sab 17 ott 2026 16:08:51 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+"""
+Read and write the Subversion dump streams, as produced by ``svnadmin
+dump`` and consumed by ``svnadmin load``.
+
+A dump carries the full content of each revision, so that a bulk
+migration may proceed reading a stream instead of updating a working
+copy, and write another one instead of committing thru it.  Only the
+full text dumps are understood, not the ones made with ``--deltas``.
+"""
+
+__docformat__ = 'reStructuredText'
+
+from vcpx import TailorException
+
+
+class SvnDumpError(TailorException):
+    "Malformed or unsupported Subversion dump stream"
+
+
+class DumpNode(object):
+    """
+    A change to a single path within a revision.
+    """
+
+    def __init__(self, path, action, kind=None):
+        self.path = path
+        """The path of the node, relative to the root of the repository."""
+
+        self.action = action
+        """Either 'add', 'delete', 'change' or 'replace'."""
+
+        self.kind = kind
+        """Either 'file' or 'dir', None when not stated."""
+
+        self.copyfrom_path = None
+        self.copyfrom_rev = None
+
+        self.properties = None
+        """The whole set of properties, None when unchanged."""
+
+        self.text = None
+        """The full text of the file, None when unchanged."""
+
+
+class DumpRevision(object):
+    """
+    A revision, with its properties and the changed nodes.
+    """
+
+    def __init__(self, number, properties):
+        self.number = number
+        self.properties = properties
+        self.nodes = []
+
+
+def parse_properties(data):
+    """
+    Parse a property block into a dictionary.
+    """
+
+    properties = {}
+    pos = 0
+    while True:
+        end = data.index('\n', pos)
+        line = data[pos:end]
+        pos = end + 1
+        if line == 'PROPS-END':
+            return properties
+        kind, size = line.split(' ')
+        if kind not in ('K', 'V'):
+            raise SvnDumpError("Property deltas are not supported")
+        size = int(size)
+        key = data[pos:pos+size]
+        pos += size + 1
+        line = data[pos:data.index('\n', pos)]
+        pos += len(line) + 1
+        size = int(line.split(' ')[1])
+        properties[key] = data[pos:pos+size]
+        pos += size + 1
+
+
+def format_properties(properties):
+    """
+    Format a dictionary of properties as a property block.
+    """
+
+    block = []
+    keys = properties.keys()
+    keys.sort()
+    for key in keys:
+        value = properties[key]
+        block.append('K %d\n%s\nV %d\n%s\n' % (len(key), key,
+                                               len(value), value))
+    block.append('PROPS-END\n')
+    return ''.join(block)
+
+
+def read_headers(stream):
+    """
+    Read the headers of the next record, returning them in a
+    dictionary, or None at the end of the stream.
+    """
+
+    line = stream.readline()
+    while line == '\n':
+        line = stream.readline()
+    if not line:
+        return None
+
+    headers = {}
+    while line and line != '\n':
+        try:
+            key, value = line[:-1].split(': ', 1)
+        except ValueError:
+            raise SvnDumpError("Bad header line: %r" % line)
+        headers[key] = value
+        line = stream.readline()
+    return headers
+
+
+def read_exactly(stream, size):
+    """
+    Read `size` bytes from the stream.
+    """
+
+    chunks = []
+    while size > 0:
+        chunk = stream.read(size)
+        if not chunk:
+            raise SvnDumpError("Truncated dump stream")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def read_dump(stream):
+    """
+    Parse the dump `stream`, yielding a `DumpRevision` instance for
+    each revision, as soon as it is complete.
+    """
+
+    revision = None
+    while True:
+        headers = read_headers(stream)
+        if headers is None:
+            break
+
+        propslen = int(headers.get('Prop-content-length', 0))
+        textlen = int(headers.get('Text-content-length', 0))
+        contentlen = int(headers.get('Content-length', propslen + textlen))
+        properties = None
+        if propslen:
+            if headers.get('Prop-delta') == 'true':
+                raise SvnDumpError("Property deltas are not supported")
+            properties = parse_properties(read_exactly(stream, propslen))
+        if headers.get('Text-delta') == 'true':
+            raise SvnDumpError("Text deltas are not supported: dump the "
+                               "repository without --deltas")
+        text = read_exactly(stream, textlen)
+        if contentlen > propslen + textlen:
+            read_exactly(stream, contentlen - propslen - textlen)
+
+        if headers.has_key('Revision-number'):
+            if revision is not None:
+                yield revision
+            revision = DumpRevision(int(headers['Revision-number']),
+                                    properties or {})
+        elif headers.has_key('Node-path'):
+            if revision is None:
+                raise SvnDumpError("Node %r outside of a revision" %
+                                   headers['Node-path'])
+            node = DumpNode(headers['Node-path'], headers['Node-action'],
+                            headers.get('Node-kind'))
+            if headers.has_key('Node-copyfrom-path'):
+                node.copyfrom_path = headers['Node-copyfrom-path']
+                node.copyfrom_rev = int(headers['Node-copyfrom-rev'])
+            node.properties = properties
+            if headers.has_key('Text-content-length'):
+                node.text = text
+            revision.nodes.append(node)
+        elif headers.has_key('SVN-fs-dump-format-version'):
+            version = headers['SVN-fs-dump-format-version']
+            if version not in ('1', '2', '3'):
+                raise SvnDumpError("Unknown dump format version %s" % version)
+
+    if revision is not None:
+        yield revision
+
+
+class DumpWriter(object):
+    """
+    Write a dump stream, to be loaded with ``svnadmin load``.
+
+    The writer numbers the revisions and keeps track of the paths
+    present in the last one, so that the caller may check whether a
+    path needs to be added or changed.
+    """
+
+    def __init__(self, stream, revision=0):
+        self.stream = stream
+
+        self.revision = revision
+        """The number of the last revision written."""
+
+        self.paths = {}
+        """The kind of each path present in the last revision."""
+
+    def writeHeader(self):
+        """
+        Write the format version, at the start of the stream.
+        """
+
+        self.stream.write('SVN-fs-dump-format-version: 2\n\n')
+
+    def writeRevision(self, properties):
+        """
+        Start a new revision, returning its number.
+        """
+
+        self.revision += 1
+        props = format_properties(properties)
+        self.stream.write('Revision-number: %d\n'
+                          'Prop-content-length: %d\n'
+                          'Content-length: %d\n\n' % (self.revision,
+                                                      len(props), len(props)))
+        self.stream.write(props)
+        self.stream.write('\n')
+        return self.revision
+
+    def writeNode(self, path, action, kind=None, text=None, properties=None,
+                  copyfrom=None):
+        """
+        Write a change to `path` in the current revision.
+
+        The `text` is the full content of the file, `properties` the
+        whole set of its properties and `copyfrom` a tuple with the
+        path and the revision of the origin of a copy: each of them
+        is omitted when None.
+        """
+
+        from md5 import new
+
+        headers = ['Node-path: %s' % path]
+        if kind is not None:
+            headers.append('Node-kind: %s' % kind)
+        headers.append('Node-action: %s' % action)
+        if copyfrom is not None:
+            headers.append('Node-copyfrom-rev: %d' % copyfrom[1])
+            headers.append('Node-copyfrom-path: %s' % copyfrom[0])
+        content = []
+        if properties is not None:
+            props = format_properties(properties)
+            headers.append('Prop-content-length: %d' % len(props))
+            content.append(props)
+        if text is not None:
+            headers.append('Text-content-length: %d' % len(text))
+            headers.append('Text-content-md5: %s' % new(text).hexdigest())
+            content.append(text)
+        if content:
+            headers.append('Content-length: %d' %
+                           sum([len(c) for c in content]))
+        self.stream.write('\n'.join(headers) + '\n\n')
+        for c in content:
+            self.stream.write(c)
+        self.stream.write('\n\n')
+
+        self.track(path, action, kind, copyfrom and copyfrom[0])
+
+    def track(self, path, action, kind=None, copyfrom_path=None):
+        """
+        Update the known `paths` after a change to `path`.
+
+        Copies are assumed to come from the previous revision.
+        """
+
+        if action in ('delete', 'replace'):
+            prefix = path + '/'
+            for p in self.paths.keys():
+                if p == path or p.startswith(prefix):
+                    del self.paths[p]
+        if action in ('add', 'replace'):
+            self.paths[path] = kind
+            if copyfrom_path is not None:
+                prefix = copyfrom_path + '/'
+                for p, k in self.paths.items():
+                    if p.startswith(prefix):
+                        self.paths[path + p[len(copyfrom_path):]] = k
+
+
+def append_to_dump(filename):
+    """
+    Return a `DumpWriter` appending to the dump in `filename`, that
+    gets created if it does not exist, continuing the numbering of
+    its revisions.
+    """
+
+    from os.path import exists, getsize
+
+    if exists(filename) and getsize(filename):
+        revision = 0
+        paths = DumpWriter(None)
+        dump = open(filename, 'rb')
+        try:
+            for rev in read_dump(dump):
+                revision = rev.number
+                for node in rev.nodes:
+                    paths.track(node.path, node.action, node.kind,
+                                node.copyfrom_path)
+        finally:
+            dump.close()
+        writer = DumpWriter(open(filename, 'ab'), revision)
+        writer.paths = paths.paths
+    else:
+        writer = DumpWriter(open(filename, 'wb'))
+        writer.writeHeader()
+    return writer
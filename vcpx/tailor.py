@@ -135,7 +135,7 @@ class Tailorizer(Project):
     def __call__(self):
         from shwrap import ExternalCommand
         from target import SynchronizableTargetWorkingDir
-        from changes import Changeset
+        from changes import Changeset, forget_interned_strings
 
         def pconfig(option, raw=False):
             return self.config.get(self.name, option, raw=raw)
@@ -149,30 +149,33 @@ class Tailorizer(Project):
         Changeset.REFILL_MESSAGE = pconfig('refill-changelogs')
 
         try:
-            if not self.exists():
-                self.bootstrap()
-                if pconfig('start-revision') == 'HEAD':
-                    return
-            self.update()
-        except (UnicodeDecodeError, UnicodeEncodeError), exc:
-            raise ConfigurationError('%s: it seems that the encoding '
-                                     'used by either the source ("%s") or the '
-                                     'target ("%s") repository '
-                                     'cannot properly represent at least one '
-                                     'of the characters in the upstream '
-                                     'changelog. You need to use a wider '
-                                     'character set, using "encoding" option, '
-                                     'or even "encoding-errors-policy".'
-                                     % (exc, self.source.encoding,
-                                        self.target.encoding))
-        except TailorBug, e:
-            self.log.fatal("Unexpected internal error, please report", exc_info=e)
-        except EmptySourceRepository, e:
-            self.log.warning("Source repository seems empty: %s", e)
-        except TailorException:
-            raise
-        except Exception, e:
-            self.log.fatal("Something unexpected!", exc_info=e)
+            try:
+                if not self.exists():
+                    self.bootstrap()
+                    if pconfig('start-revision') == 'HEAD':
+                        return
+                self.update()
+            except (UnicodeDecodeError, UnicodeEncodeError), exc:
+                raise ConfigurationError('%s: it seems that the encoding '
+                                         'used by either the source ("%s") or the '
+                                         'target ("%s") repository '
+                                         'cannot properly represent at least one '
+                                         'of the characters in the upstream '
+                                         'changelog. You need to use a wider '
+                                         'character set, using "encoding" option, '
+                                         'or even "encoding-errors-policy".'
+                                         % (exc, self.source.encoding,
+                                            self.target.encoding))
+            except TailorBug, e:
+                self.log.fatal("Unexpected internal error, please report", exc_info=e)
+            except EmptySourceRepository, e:
+                self.log.warning("Source repository seems empty: %s", e)
+            except TailorException:
+                raise
+            except Exception, e:
+                self.log.fatal("Something unexpected!", exc_info=e)
+        finally:
+            forget_interned_strings()
 
 class RecogOption(Option):
     """
@@ -203,6 +206,10 @@ GENERAL_OPTIONS = [
                 help="Force the output encoding to given CHARSET, rather "
                      "then using the user's default settings specified "
                      "in the environment."),
+    RecogOption("-j", "--jobs", metavar="N", type="int", default=1,
+                help="Update up to N projects of the config file at the "
+                     "same time, each in its own process. Projects sharing "
+                     "their root directory are never run concurrently."),
 ]
 
 UPDATE_OPTIONS = [
@@ -298,6 +305,160 @@ class ProjectNotTailored(TailorException):
     "Not a tailored project"
 
 
+class ProjectsFailure(TailorException):
+    "Some projects failed"
+
+
+class Scheduler(object):
+    """
+    Run a set of projects using a pool of worker processes.
+
+    Each project is tailorized by a forked child, so that its own
+    settings and log handlers do not interfere with the other
+    projects. Two projects whose root directories overlap are never
+    executed at the same time, and are started in config order.
+    """
+
+    OK = 0
+    FAILED = 1
+    UPSTREAM_FAILURE = 2
+
+    OUTCOMES = {
+        OK: 'ok',
+        FAILED: 'FAILED',
+        UPSTREAM_FAILURE: 'cannot get upstream changes',
+        }
+
+    def __init__(self, config, projects, jobs):
+        from os.path import abspath, expanduser
+
+        self.config = config
+        self.projects = projects
+        self.jobs = max(1, jobs)
+        self.log = getLogger('tailor.scheduler')
+        self.rootdirs = {}
+        for projname in projects:
+            rootdir = config.get(projname, 'root-directory', '.')
+            self.rootdirs[projname] = abspath(expanduser(rootdir))
+
+    def _overlaps(self, rootdir, busy):
+        """
+        Tell whether `rootdir` is either equal to, or contains or is
+        contained by one of the `busy` directories.
+        """
+
+        from os.path import sep
+
+        rootdir = rootdir.rstrip(sep) + sep
+        for other in busy:
+            other = other.rstrip(sep) + sep
+            if rootdir.startswith(other) or other.startswith(rootdir):
+                return True
+        return False
+
+    def _tailorize(self, projname):
+        """
+        Child side: tailorize the project, returning the outcome.
+        """
+
+        try:
+            tailorizer = Tailorizer(projname, self.config)
+            tailorizer()
+        except GetUpstreamChangesetsFailure:
+            return self.UPSTREAM_FAILURE
+        except TailorException, exc:
+            self.log.critical('%s: %s: %s', projname, exc.__doc__, exc)
+            return self.FAILED
+        except KeyboardInterrupt:
+            self.log.warning('%s: stopped by user', projname)
+            return self.FAILED
+        except:
+            self.log.critical('%s: unexpected failure', projname,
+                              exc_info=True)
+            return self.FAILED
+        return self.OK
+
+    def _spawn(self, projname):
+        """
+        Fork a new child to tailorize `projname`, returning its pid.
+        """
+
+        from os import fork, _exit
+        from sys import stdout, stderr
+        from logging import shutdown
+
+        pid = fork()
+        if pid == 0:
+            outcome = self.FAILED
+            try:
+                outcome = self._tailorize(projname)
+            finally:
+                shutdown()
+                stdout.flush()
+                stderr.flush()
+                _exit(outcome)
+        return pid
+
+    def run(self):
+        """
+        Execute all the projects, then log a summary of what happened.
+
+        Raise ProjectsFailure if at least one project failed.
+        """
+
+        from os import wait, WIFEXITED, WEXITSTATUS
+        from time import time
+
+        pending = list(self.projects)
+        running = {}
+        outcomes = {}
+        started = time()
+
+        try:
+            while pending or running:
+                busy = [rootdir for name, rootdir, start in running.values()]
+                for projname in pending[:]:
+                    if len(running) >= self.jobs:
+                        break
+                    rootdir = self.rootdirs[projname]
+                    if self._overlaps(rootdir, busy):
+                        continue
+                    pending.remove(projname)
+                    busy.append(rootdir)
+                    self.log.info('Starting "%s"', projname)
+                    running[self._spawn(projname)] = (projname, rootdir, time())
+
+                pid, status = wait()
+                if not pid in running:
+                    continue
+                projname, rootdir, start = running.pop(pid)
+                if WIFEXITED(status) and WEXITSTATUS(status) in self.OUTCOMES:
+                    outcome = WEXITSTATUS(status)
+                else:
+                    outcome = self.FAILED
+                outcomes[projname] = (outcome, time()-start)
+                self.log.info('Finished "%s": %s', projname,
+                              self.OUTCOMES[outcome])
+        finally:
+            # Reap whatever is still running, for example when stopped
+            # by the user
+            while running:
+                pid, status = wait()
+                running.pop(pid, None)
+
+        self.log.info('Summary of %d projects, completed in %.1f seconds:',
+                      len(self.projects), time()-started)
+        failed = []
+        for projname in self.projects:
+            outcome, elapsed = outcomes[projname]
+            self.log.info('  %s: %s (%.1f seconds)', projname,
+                          self.OUTCOMES[outcome], elapsed)
+            if outcome == self.FAILED:
+                failed.append(projname)
+        if failed:
+            raise ProjectsFailure(', '.join(failed))
+
+
 def main():
     """
     Script entry point.
@@ -352,6 +513,11 @@ def main():
         if not args:
             args = config.projects()
 
+        jobs = int(config.get('DEFAULT', 'jobs', 1))
+        if jobs > 1 and len(args) > 1:
+            Scheduler(config, args, jobs).run()
+            return
+
         for projname in args:
             tailorizer = Tailorizer(projname, config)
             try:
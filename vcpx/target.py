@@ -108,9 +108,13 @@ class SynchronizableTargetWorkingDir(WorkingDir):
     def _prepareToReplayChangeset(self, changeset):
         """
         This is called **before** fetching and applying the source
-        changeset. This implementation does nothing more than
-        returning True. Subclasses may override it, for example to
-        preexecute some entries such as moves.
+        changeset, or, when the source and the target use distinct
+        working directories and the application is pipelined, after
+        the source applied it but before its tree gets mirrored over
+        the target one: in both cases the target working directory is
+        still at the previous changeset.  This implementation does
+        nothing more than returning True. Subclasses may override it,
+        for example to preexecute some entries such as moves.
 
         Returning False the changeset won't be applied and the
         process will stop.
@@ -339,6 +343,16 @@ class SynchronizableTargetWorkingDir(WorkingDir):
             if action is not None:
                 action(group)
 
+    def needsSubtreeEntries(self):
+        """
+        Tell whether the changesets must carry an entry for each item
+        within an added directory.  Backends that add a directory with
+        its whole content may return False, sparing the source the
+        work of listing it.
+        """
+
+        return True
+
     def _addEntries(self, entries):
         """
         Add a sequence of entries
@@ -377,6 +391,8 @@ class SynchronizableTargetWorkingDir(WorkingDir):
             exclude.append(sfrelname)
             exclude.append(sfrelname+'.old')
             exclude.append(sfrelname+'.journal')
+            exclude.append(sfrelname+'-journal')
+            exclude.append(sfrelname+'-wal')
 
         if self.logfile.startswith(self.repository.basedir):
             exclude.append(self.logfile[len(self.repository.basedir)+1:])
@@ -631,6 +647,15 @@ class SynchronizableTargetWorkingDir(WorkingDir):
 
         self._dismissChangeset(changeset)
 
+    def finalizeTargetRepository(self):
+        """
+        Called at the end of the session, after the last changeset has
+        been replayed or when the process has been interrupted.
+
+        This implementation does nothing, subclasses that keep some
+        resource open across the commits should release it here.
+        """
+
     def _initializeWorkingDir(self):
         """
         Assuming the ``basedir`` directory contains a working copy ``module``
@@ -13,10 +13,18 @@ DEBUG = False
 from shwrap import *
 from cvsps import *
 from cvs import *
+from cvsclient import *
+from monotone import *
+from p4 import *
+from rcs import *
 from darcs import *
 from svn import *
+from git import *
+from bzr import *
 from config import *
 from statefile import *
+from source import *
+from dualwd import *
 from tailor import *
 from fixed_bugs import *
 
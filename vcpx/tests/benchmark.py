@@ -0,0 +1,113 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Throughput of the log parsers
+# :Creato:   sab 17 ott 2026 19:37:12 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+"""
+Measure how many revisions per second the svn and darcs log parsers
+are able to digest, on synthetic logs shaped like real ones.
+
+This is not part of the test suite: execute it with::
+
+  python -m vcpx.tests.benchmark [revisions]
+"""
+
+__docformat__ = 'reStructuredText'
+
+
+def svn_log(revisions):
+    """Return the XML ``svn log --verbose`` of `revisions` revisions."""
+
+    chunks = ['<?xml version="1.0"?>\n<log>\n']
+    for rev in xrange(1, revisions+1):
+        chunks.append('<logentry\n   revision="%d">\n'
+                      '<author>lele</author>\n'
+                      '<date>2006-07-10T00:04:59.%06dZ</date>\n'
+                      '<paths>\n' % (rev, rev % 1000000))
+        for i in range(5):
+            chunks.append('<path\n   kind="file"\n   action="M">'
+                          '/trunk/src/module%d/file%d.py</path>\n' % (i, rev))
+        chunks.append('<path\n   kind="file"\n   copyfrom-path="/trunk/old%d"\n'
+                      '   copyfrom-rev="%d"\n   action="A">/trunk/new%d</path>\n'
+                      '<path\n   kind="file"\n   action="D">/trunk/old%d</path>\n'
+                      % (rev, rev-1, rev, rev))
+        chunks.append('</paths>\n<msg>Change number %d, fixing\n'
+                      'some &lt;stuff&gt; &amp; more</msg>\n</logentry>\n' % rev)
+    chunks.append('</log>\n')
+    return ''.join(chunks)
+
+
+def darcs_changes(revisions):
+    """Return the XML ``darcs changes --summary`` of `revisions` patches."""
+
+    chunks = ['<changelog>\n']
+    for rev in xrange(1, revisions+1):
+        chunks.append('<patch author="lele@nautilus.homeip.net" '
+                      'date="20060710%02d%02d%02d" local_date="whatever" '
+                      'inverted="False" hash="20060710000459-97f81-%040d.gz">\n'
+                      '\t<name>Change number %d</name>\n'
+                      '\t<comment>fixing some &lt;stuff&gt;</comment>\n'
+                      '    <summary>\n' % (rev / 3600 % 24, rev / 60 % 60,
+                                             rev % 60, rev, rev))
+        for i in range(5):
+            chunks.append('    <modify_file>\n    src/module%d/file%d.py'
+                          '<added_lines num="1"/>\n    </modify_file>\n'
+                          % (i, rev))
+        chunks.append('    <add_file>\n    new%d\n    </add_file>\n'
+                      '    <move from="old%d" to="moved%d"/>\n'
+                      '    </summary>\n</patch>\n' % (rev, rev, rev))
+    chunks.append('</changelog>\n')
+    return ''.join(chunks)
+
+
+def throughput(parse, log, revisions, repeat=3):
+    """
+    Return the best rate, in revisions per second, of the `parse`
+    function over the `log`.
+    """
+
+    from cStringIO import StringIO
+    from time import time
+
+    best = None
+    for i in range(repeat):
+        start = time()
+        count = 0
+        for cs in parse(StringIO(log)):
+            count += 1
+        elapsed = time() - start
+        assert count == revisions, "Parsed %d revisions out of %d" % (
+            count, revisions)
+        if best is None or elapsed < best:
+            best = elapsed
+    return revisions / best
+
+
+def main(revisions=20000):
+    from logging import getLogger
+    from vcpx.repository.svn import changesets_from_svnlog
+    from vcpx.repository.darcs.source import changesets_from_darcschanges
+
+    class FakeRepository:
+        repository = 'file:///tmp/repo'
+        module = '/trunk'
+        log = getLogger('tailor.benchmark')
+
+    repository = FakeRepository()
+    rate = throughput(lambda log: changesets_from_svnlog(log, repository),
+                      svn_log(revisions), revisions)
+    print "svn log:       %8d revisions/s" % rate
+    rate = throughput(changesets_from_darcschanges, darcs_changes(revisions),
+                      revisions)
+    print "darcs changes: %8d revisions/s" % rate
+
+
+if __name__ == '__main__':
+    from sys import argv
+
+    if len(argv) > 1:
+        main(int(argv[1]))
+    else:
+        main()
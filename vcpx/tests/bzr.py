@@ -0,0 +1,98 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Tests for the bzr backend
+# :Creato:   sab 17 ott 2026 18:12:40 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+from unittest import TestCase
+
+try:
+    import bzrlib
+except ImportError:
+    # The backend cannot even be imported without bzrlib
+    bzrlib = None
+
+
+class FakeRevision:
+    def __init__(self, revision_id, timestamp):
+        self.revision_id = revision_id
+        self.timestamp = timestamp
+        self.timezone = 3600
+        self.message = 'Log of %s' % revision_id
+
+    def get_apparent_authors(self):
+        return ['lele']
+
+
+class FakeDelta:
+    def __init__(self, n):
+        self.renamed = [('old%d' % n, 'new%d' % n, 'id', 'file')]
+        self.added = [('dir%d' % n, 'id', 'directory'),
+                      ('dir%d/added' % n, 'id', 'file')]
+        self.removed = [('gone%d' % n, 'id', 'file')]
+        self.modified = [('changed', 'id', 'file')]
+
+
+class FakeRepository:
+    """Stand-in for a bzrlib repository, recording the batches"""
+
+    def __init__(self, count):
+        self.revisions = {}
+        for n in range(count):
+            self.revisions['rev%d' % n] = n
+        self.batches = []
+
+    def get_revision(self, revision_id):
+        return FakeRevision(revision_id, 1160000000 + self.revisions[revision_id])
+
+    def get_revision_delta(self, revision_id):
+        return FakeDelta(self.revisions[revision_id])
+
+    def get_revisions(self, revision_ids):
+        self.batches.append(list(revision_ids))
+        return [self.get_revision(r) for r in revision_ids]
+
+    def get_deltas_for_revisions(self, revisions):
+        return [self.get_revision_delta(r.revision_id) for r in revisions]
+
+
+class FakeBranch:
+    def __init__(self, repository):
+        self.repository = repository
+
+
+if bzrlib is not None:
+    from vcpx.repository.bzr import BzrWorkingDir
+
+    class BatchingWorkingDir(BzrWorkingDir):
+        REVISIONS_BATCH = 3
+
+        def __init__(self):
+            pass
+
+
+    class BzrRevisionsBatch(TestCase):
+        """Ensure the changesets are collected in batches"""
+
+        def summary(self, changesets):
+            return [(cs.revision, cs.date, cs.author, cs.log,
+                     [(e.name, e.action_kind, e.old_name, e.is_directory)
+                      for e in cs.entries])
+                    for cs in changesets]
+
+        def testBatches(self):
+            """Verify the batches match the changesets of each revision"""
+
+            wd = BatchingWorkingDir()
+            for count in (0, 1, 3, 7):
+                repository = FakeRepository(count)
+                branch = FakeBranch(repository)
+                ids = ['rev%d' % n for n in range(count)]
+
+                batched = list(wd._changesetsFromRevisions(branch, ids))
+                single = [wd._changesetFromRevision(branch, r) for r in ids]
+                self.assertEqual(self.summary(batched), self.summary(single))
+                self.assertEqual([cs.revision for cs in batched], ids)
+                self.assertEqual(repository.batches,
+                                 [ids[i:i+3] for i in range(0, count, 3)])
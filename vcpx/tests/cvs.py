@@ -388,3 +388,220 @@ class CvsRevisions(TestCase):
         self.assertEqual(True, cvs_revs_same_branch(n('1.2.3.4'), n('1.2.3.4')))
         self.assertEqual(True, cvs_revs_same_branch(n('1.2'), n('1.2.3')))
         self.assertEqual(True, cvs_revs_same_branch(n('1.2.3'), n('1.2')))
+
+
+class CvsEntriesIndex(TestCase):
+    """Tests for the incremental CvsEntriesCache"""
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        from atexit import register
+        from shutil import rmtree
+
+        self.root = mkdtemp('', 'tailor')
+        register(rmtree, self.root)
+
+    def writeEntries(self, dir, lines):
+        from os import makedirs, rename
+        from os.path import join, exists
+
+        cvsdir = join(self.root, dir, 'CVS')
+        if not exists(cvsdir):
+            makedirs(cvsdir)
+        # Mimic CVS, that rewrites the whole file and renames it
+        backup = join(cvsdir, 'Entries.Backup')
+        f = open(backup, 'w')
+        for line in lines:
+            f.write(line + '\n')
+        f.close()
+        rename(backup, join(cvsdir, 'Entries'))
+
+    def testRefresh(self):
+        """Verify the entries index follows the working copy"""
+
+        from shutil import rmtree
+        from os.path import join
+        from vcpx.repository.cvs import CvsEntries, CvsEntriesCache
+
+        ts = 'Tue Jul 13 12:49:02 2004'
+        self.writeEntries('', ['/a/1.1/%s//' % ts, 'D/sub////'])
+        self.writeEntries('sub', ['/b/1.2/%s//' % ts, 'D/deep////'])
+        self.writeEntries('sub/deep', ['/c/1.3/%s//' % ts])
+
+        cache = CvsEntriesCache(self.root)
+        entries = CvsEntries(self.root)
+        for name in ('a', 'sub/b', 'sub/deep/c'):
+            self.assertEqual(cache.getFileInfo(name).cvs_version,
+                             entries.getFileInfo(name).cvs_version)
+        self.assertEqual(cache.getFileInfo('sub/c'), None)
+
+        self.writeEntries('sub', ['/b/1.3/%s//' % ts, '/d/1.1/%s//' % ts,
+                                  'D/deep////'])
+        self.writeEntries('new', ['/e/1.1/%s//' % ts])
+        rmtree(join(self.root, 'sub', 'deep'))
+        cache.refresh()
+
+        self.assertEqual(cache.getFileInfo('a').cvs_version, '1.1')
+        self.assertEqual(cache.getFileInfo('sub/b').cvs_version, '1.3')
+        self.assertEqual(cache.getFileInfo('sub/d').cvs_version, '1.1')
+        self.assertEqual(cache.getFileInfo('new/e').cvs_version, '1.1')
+        self.assertEqual(cache.getFileInfo('sub/deep/c'), None)
+        self.assertEqual(len(cache.files), 4)
+
+
+def synthetic_cvslog(files=120, seed=42):
+    """
+    Build the rlog of a big history: a vendor import of all the files
+    in a single commit, followed by many small commits of interleaved
+    authors and logs close in time, with some edits and deletions of
+    the same files, double deletions and revisions sharing the same
+    date, author and log.
+    """
+
+    from datetime import timedelta
+    from random import Random
+
+    rng = Random(seed)
+    start = datetime(2004, 1, 1, 0, 0, 0, 0, UTC)
+    logs = ['Fix', 'Refactor', 'Fix\nwith details', '*** empty log message ***']
+    out = []
+    for dir in range(files / 20):
+        out.append('cvs rlog: Logging proj/dir%d\n\n' % dir)
+        for i in range(20):
+            # Oldest first, reversed below as cvs does
+            revs = [(start + timedelta(seconds=i % 3), 'vendor',
+                     'Initial import', 'Exp', None)]
+            for slot in range(1, rng.randint(2, 8)):
+                date = start + timedelta(hours=slot,
+                                         seconds=rng.randint(0, 300))
+                author = rng.choice(['alice', 'bob'])
+                log = rng.choice(logs)
+                revs.append((date, author, log, 'Exp', '+1 -1'))
+                if rng.random() < 0.1:
+                    revs.append((date, author, log, 'Exp', '+1 -1'))
+            # A cleanup removes some files, after editing a few of them
+            # moments before: the edits and the removals are collected
+            # apart, and must stay separated when coalesced
+            dead = rng.random() < 0.3
+            if dead:
+                date = start + timedelta(hours=10,
+                                         seconds=rng.randint(0, 100))
+                if rng.random() < 0.5:
+                    revs.append((date, 'carol', 'Cleanup', 'Exp', '+1 -1'))
+                    date += timedelta(seconds=1)
+                revs.append((date, 'carol', 'Cleanup', 'dead', '+0 -0'))
+                if rng.random() < 0.5:
+                    revs.append((date + timedelta(seconds=1), 'carol',
+                                 'Cleanup', 'dead', '+0 -0'))
+            revs.reverse()
+
+            out.append('RCS file: /cvsroot/proj/dir%d/%sf%d.c,v\n'
+                       % (dir, dead and 'Attic/' or '', i))
+            out.append('head: 1.%d\nbranch:\nlocks: strict\naccess list:\n'
+                       'keyword substitution: kv\n' % len(revs))
+            out.append('total revisions: %d;     selected revisions: %d\n'
+                       'description:\n' % (len(revs), len(revs)))
+            for n, (date, author, log, state, lines) in enumerate(revs):
+                out.append('-' * 28 + '\n')
+                out.append('revision 1.%d\n' % (len(revs) - n))
+                info = 'date: %s;  author: %s;  state: %s;' % (
+                    date.strftime('%Y/%m/%d %H:%M:%S'), author, state)
+                if lines:
+                    info += '  lines: %s' % lines
+                out.append(info + '\n' + log + '\n')
+            out.append('=' * 77 + '\n\n')
+    return ''.join(out)
+
+
+class CvsCollectorRegression(TestCase):
+    """Ensure the indexed collector gives the same output of the original"""
+
+    def referenceChangesets(self, log, module, threshold=None):
+        """
+        Collect the changesets with the original algorithm, scanning
+        the entries over and over.
+        """
+
+        from datetime import timedelta
+        from vcpx.changes import Changeset
+        from vcpx.repository.cvs import ChangeSetCollector, \
+             _getGlobalCVSRevision
+
+        class ReferenceCollector(ChangeSetCollector):
+            def _ChangeSetCollector__collect(self, timestamp, author,
+                                             changelog, entry, revision):
+                key = (timestamp, author, changelog)
+                if self.changesets.has_key(key):
+                    cs = self.changesets[key]
+                    for e in cs.entries:
+                        if e.name == entry:
+                            return e
+                    return cs.addEntry(entry, revision)
+                else:
+                    cs = Changeset(_getGlobalCVSRevision(timestamp, author),
+                                   timestamp, author, changelog)
+                    self.changesets[key] = cs
+                    return cs.addEntry(entry, revision)
+
+        collected = ReferenceCollector(log, module, None, None, None)
+
+        if threshold is None:
+            threshold = timedelta(seconds=180)
+
+        last = None
+        for cs in collected:
+            if (last and last.author == cs.author and last.log == cs.log and
+                abs(lastts - cs.date) < threshold and
+                not last.tags and
+                not [e for e in cs.entries
+                     if e.name in [n.name for n in last.entries
+                                   if n.action_kind <> e.action_kind]]):
+                for e in cs.entries:
+                    if e.action_kind == e.DELETED:
+                        doubledelete = False
+                        for n in last.entries:
+                            if n.name == e.name and n.action_kind == n.DELETED:
+                                doubledelete = True
+                                n.new_revision = e.new_revision
+                                break
+                        if not doubledelete:
+                            last.entries.append(e)
+                    else:
+                        last.entries.append(e)
+                last.tags = cs.tags
+                if lastts < cs.date:
+                    lastts = cs.date
+            else:
+                if last:
+                    last.date = lastts
+                    yield last
+                last = cs
+                lastts = cs.date
+
+        if last:
+            yield last
+
+    def summary(self, csets):
+        return [(cs.revision, cs.date, cs.author, cs.log,
+                 [(e.name, e.action_kind, e.new_revision) for e in cs.entries])
+                for cs in csets]
+
+    def testSameOutput(self):
+        """Verify the changesets and their entries match the original"""
+
+        from datetime import timedelta
+
+        log = synthetic_cvslog()
+        for threshold in (None, timedelta(days=1)):
+            expected = self.summary(self.referenceChangesets(
+                StringIO(log), 'proj', threshold))
+            result = self.summary(changesets_from_cvslog(
+                StringIO(log), 'proj', threshold=threshold))
+            self.assertEqual(result, expected)
+
+        # The history exercises what the indexes replaced
+        entries = [e for cs in expected for e in cs[4]]
+        self.assert_(len(expected) > 10)
+        self.assert_(max([len(cs[4]) for cs in expected]) >= 120)
+        self.assert_([e for e in entries if e[1] == 'DEL'])
+        self.assert_(len(entries) > len(dict([(e[0], 1) for e in entries])))
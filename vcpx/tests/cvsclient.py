@@ -0,0 +1,129 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Tests for the CVS client/server protocol
+# :Creato:   dom 18 ott 2026 00:58:21 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+from unittest import TestCase
+from vcpx.cvsclient import parse_cvsroot, parse_mode, parse_mod_time
+
+FAKE_SERVER = """\
+import sys
+
+log = open(sys.argv[1], 'a')
+log.write('START\\n')
+args = []
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+    log.write(line)
+    line = line[:-1]
+    if line == 'valid-requests':
+        sys.stdout.write('Valid-requests Root Valid-responses valid-requests '
+                         'UseUnchanged Global_option Argument Directory '
+                         'Entry Unchanged update\\nok\\n')
+    elif line.startswith('Directory '):
+        log.write(sys.stdin.readline())
+    elif line.startswith('Argument '):
+        args.append(line[9:])
+    elif line == 'update':
+        rev = args[args.index('-r')+1]
+        for name in args[args.index('--')+1:]:
+            if '/' in name:
+                dir, base = name.rsplit('/', 1)
+                dir += '/'
+            else:
+                dir, base = './', name
+            if rev == 'dead':
+                sys.stdout.write('Removed %s\\n/cvsroot/mod/%s\\n' % (dir, name))
+            else:
+                data = '%s at %s\\n' % (name, rev)
+                sys.stdout.write('Mod-time 25 Jan 2004 10:00:00 -0000\\n')
+                sys.stdout.write('Updated %s\\n/cvsroot/mod/%s\\n/%s/%s///T%s\\n'
+                                 'u=rw,g=r,o=r\\n%d\\n%s' % (
+                    dir, name, base, rev, rev, len(data), data))
+        sys.stdout.write('ok\\n')
+        args = []
+    sys.stdout.flush()
+"""
+
+
+class CvsProtocol(TestCase):
+    """Tests the session with the CVS server"""
+
+    def testParsers(self):
+        """Verify the parsing of CVSROOTs, modes and times"""
+
+        self.assertEqual(parse_cvsroot(':local:/cvs'),
+                         ('local', None, None, '/cvs'))
+        self.assertEqual(parse_cvsroot('/cvs'), ('local', None, None, '/cvs'))
+        self.assertEqual(parse_cvsroot(':ext:lele@host:/cvs'),
+                         ('ext', 'lele', 'host', '/cvs'))
+        self.assertEqual(parse_cvsroot('host:/cvs'),
+                         ('ext', None, 'host', '/cvs'))
+        self.assertEqual(parse_cvsroot(':pserver:anon@host:2401/cvs'),
+                         ('pserver', 'anon', 'host', '/cvs'))
+        self.assertEqual(parse_mode('u=rwx,g=rx,o='), 0750)
+        self.assertEqual(parse_mod_time('25 Jan 2004 10:00:00 -0000'),
+                         1075024800)
+        self.assertEqual(parse_mod_time('25 Jan 2004 12:00:00 +0200'),
+                         1075024800)
+
+    def testSession(self):
+        """Verify several updates within a single session"""
+
+        from atexit import register
+        from os import mkdir, chmod
+        from os.path import join, exists, getmtime
+        from shutil import rmtree
+        from sys import executable
+        from tempfile import mkdtemp
+        from vcpx.cvsclient import CvsServerSession
+        from vcpx.repository.cvs import CvsEntriesCache
+
+        tmpdir = mkdtemp('', 'tailor')
+        register(rmtree, tmpdir)
+        script = join(tmpdir, 'cvs')
+        requests = join(tmpdir, 'requests')
+        open(script + '.py', 'w').write(FAKE_SERVER)
+        open(script, 'w').write('#!/bin/sh\nexec %s %s.py %s\n' % (
+            executable, script, requests))
+        chmod(script, 0755)
+
+        basedir = join(tmpdir, 'wc')
+        for dir in (basedir, join(basedir, 'sub')):
+            mkdir(dir)
+            mkdir(join(dir, 'CVS'))
+        open(join(basedir, 'CVS', 'Repository'), 'w').write('mod\n')
+        open(join(basedir, 'sub', 'CVS', 'Repository'), 'w').write(
+            '/cvsroot/mod/sub\n')
+        open(join(basedir, 'CVS', 'Entries'), 'w').write(
+            '/a/1.1/Tue Jul 13 12:49:02 2004//\nD/sub////\n')
+        open(join(basedir, 'sub', 'CVS', 'Entries'), 'w').write('')
+        open(join(basedir, 'a'), 'w').write('a at 1.1\n')
+
+        session = CvsServerSession(':local:/cvsroot', basedir, script)
+        session.update(['a', 'sub/b'], '1.2', ['-d', '-P'])
+        session.update(['a'], 'dead')
+        session.close()
+
+        self.assertEqual(open(join(basedir, 'sub', 'b')).read(),
+                         'sub/b at 1.2\n')
+        self.assertEqual(getmtime(join(basedir, 'sub', 'b')), 1075024800)
+        self.failIf(exists(join(basedir, 'a')))
+
+        entries = CvsEntriesCache(basedir)
+        self.assertEqual(entries.getFileInfo('a'), None)
+        self.assertEqual(entries.getFileInfo('sub/b').cvs_version, '1.2')
+
+        log = open(requests).read()
+        self.assertEqual(log.count('START'), 1)
+        self.assertEqual(log.count('update\n'), 2)
+        self.assert_('Root /cvsroot\n' in log)
+        self.assert_('Directory .\n/cvsroot/mod\n' in log)
+        self.assert_('Directory sub\n/cvsroot/mod/sub\n' in log)
+        self.assert_('Entry /a/1.1/Tue Jul 13 12:49:02 2004//\n'
+                     'Unchanged a\n' in log)
+        self.assert_('Entry /a/1.2/' in log)
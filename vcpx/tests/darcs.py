@@ -304,7 +304,11 @@ class DarcsPullParser(DarcsParserTestCase):
     def testParsePull(self):
         """Verify basic darcs pull parser behaviour"""
 
-        from vcpx.changes import Changeset
+        from vcpx.changes import Changeset as BaseChangeset
+
+        class Changeset(BaseChangeset):
+            # The base class has no __dict__ to hold the darcs_hash
+            pass
 
         output = self.getDarcsOutput('darcs-pull_parser_test')
         hashes = self.getDarcsOutput('darcs-pull_parser_test', ext='.hashes')
@@ -360,3 +364,100 @@ class DarcsPullParser(DarcsParserTestCase):
         self.failUnlessEqual(first.log, '\n\n(jgoerzen@complete.org--projects/tla-buildpackage--head--1.0--patch-2)')
         last = results[-1]
         self.failUnlessEqual(last.log, 'Keywords:\n\nAdded some code in Python to get things going.\n')
+
+
+FAKE_DARCS = """\
+import sys
+
+args = sys.argv[1:]
+log = open(args.pop(0), 'a')
+xml = open(args.pop(0)).read()
+log.write(' '.join(args) + '\\n')
+if args[0] == 'pull' and '--dry-run' in args:
+    sys.stdout.write(xml)
+elif args[0] == 'changes':
+    hash = args[args.index('--match')+1][len('hash '):]
+    for patch in xml.split('<patch ')[1:]:
+        if hash in patch:
+            patch = patch.replace('</changelog>', '')
+            sys.stdout.write('<changelog>\\n<patch %s</changelog>\\n' % patch)
+"""
+
+
+class DarcsSummaryPull(DarcsParserTestCase):
+    """Tests for the entries collected by darcs pull --summary"""
+
+    def setUp(self):
+        from atexit import register
+        from os import chmod
+        from os.path import join, split
+        from shutil import rmtree
+        from sys import executable
+        from tempfile import mkdtemp
+
+        tmpdir = mkdtemp('', 'tailor')
+        register(rmtree, tmpdir)
+        script = join(tmpdir, 'darcs')
+        self.requests = join(tmpdir, 'requests')
+        data = join(split(__file__)[0], 'data',
+                    'darcs-all_actions_test.log')
+        open(script + '.py', 'w').write(FAKE_DARCS)
+        open(script, 'w').write('#!/bin/sh\nexec %s %s.py %s %s "$@"\n' % (
+            executable, script, self.requests, data))
+        chmod(script, 0755)
+
+        class FakeRepository:
+            name = 'darcs'
+            basedir = tmpdir
+            repository = 'upstream'
+            darcs_version = '2.4.4'
+            replace_badchars = {}
+
+            def command(self, *args):
+                return [script] + list(args)
+
+        self.wd = DarcsSourceWorkingDir(FakeRepository())
+
+    def requested(self, command):
+        return [l for l in open(self.requests).read().splitlines()
+                if l.startswith(command + ' ')]
+
+    def testSummaryEntries(self):
+        """Verify the summarized entries survive the state file"""
+
+        from copy import deepcopy
+        from vcpx.statefile import StateFile
+
+        summarized = list(self.wd._getUpstreamChangesets(None))
+        self.assertEqual(len(summarized), 4)
+
+        # The entries are the same the changes command would produce
+        for cs in summarized:
+            self.failUnless(cs.darcs_summary)
+            plain = deepcopy(cs)
+            del plain.darcs_summary
+            plain.entries = []
+            self.assertEqual(self.wd._applyChangeset(plain), [])
+            self.assertEqual([str(e) for e in plain.entries],
+                             [str(e) for e in cs.entries])
+        self.assertEqual(len(self.requested('changes')), 4)
+
+        sf = StateFile(self.requests + '.sf', None)
+        sf.setPendingChangesets(summarized)
+        sf.finalize()
+
+        sf = StateFile(self.requests + '.sf', None)
+        self.failUnless(sf.pending())
+        reloaded = list(sf)
+        sf.finalize()
+        self.assertEqual(reloaded, summarized)
+        for cs, orig in zip(reloaded, summarized):
+            self.failUnless(cs.darcs_summary)
+            self.assertEqual(cs.darcs_hash, orig.darcs_hash)
+            self.assertEqual(cs.entries, orig.entries)
+            self.assertEqual(self.wd._applyChangeset(cs), [])
+            self.assertEqual(cs.entries, orig.entries)
+
+        # No other changes command, but a pull for each changeset
+        self.assertEqual(len(self.requested('changes')), 4)
+        self.assertEqual(len(self.requested('pull')), 9)
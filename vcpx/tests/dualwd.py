@@ -0,0 +1,188 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Tests for the dual working directory
+# :Creato:   sab 17 ott 2026 17:21:08 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+from os import listdir, mkdir, readlink, symlink
+from os.path import exists, join
+from unittest import TestCase
+from vcpx.dualwd import DualWorkingDir
+from vcpx.mirror import Mirror
+from vcpx.repository.mock import MockChangeset as Changeset, \
+     MockChangesetEntry as Entry
+
+
+class FakeRepository(object):
+    EXTRA_RSYNC_FLAGS = None
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+
+
+class FakeWorkingDir(object):
+    def __init__(self, basedir):
+        self.repository = FakeRepository(basedir)
+
+
+class DualWorkingDirTestCase(TestCase):
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        from atexit import register
+        from shutil import rmtree
+
+        self.basedir = mkdtemp('', 'tailor')
+        register(rmtree, self.basedir)
+        mkdir(join(self.basedir, 'source'))
+        mkdir(join(self.basedir, 'target'))
+        self.dwd = DualWorkingDir.__new__(DualWorkingDir)
+        self.dwd.source = FakeWorkingDir(join(self.basedir, 'source'))
+        self.dwd.target = FakeWorkingDir(join(self.basedir, 'target'))
+        self.dwd.full_sync_interval = 0
+        self.dwd._unverified_syncs = 0
+        self.dwd.mirror = Mirror()
+
+    def apply(self, changeset):
+        for e in changeset.entries:
+            e.apply(self.dwd.source.repository.basedir)
+        self.dwd._syncTargetWithSource(changeset)
+
+    def read(self, name):
+        return open(join(self.dwd.target.repository.basedir, name)).read()
+
+
+class EntriesSync(DualWorkingDirTestCase):
+    "Exercise the mirroring of the entries touched by a changeset"
+
+    def testSync(self):
+        """Verify that the touched entries are mirrored"""
+
+        sbdir = self.dwd.source.repository.basedir
+        tbdir = self.dwd.target.repository.basedir
+
+        self.apply(Changeset("Add some files",
+                             [Entry(Entry.ADDED, 'dir/'),
+                              Entry(Entry.ADDED, 'dir/a', contents='a'),
+                              Entry(Entry.ADDED, 'b', contents='b')]))
+        symlink('b', join(sbdir, 'link'))
+        open(join(sbdir, 'untouched'), 'w').write('x')
+        self.dwd._syncEntries(Changeset("Add a link",
+                                        [Entry(Entry.ADDED, 'link')]))
+        self.assertEqual(self.read('dir/a'), 'a')
+        self.assertEqual(readlink(join(tbdir, 'link')), 'b')
+        self.failIf(exists(join(tbdir, 'untouched')))
+
+        self.apply(Changeset("Rename dir and edit",
+                             [Entry(Entry.RENAMED, 'new/', 'dir/'),
+                              Entry(Entry.UPDATED, 'b', contents='B')]))
+        self.assertEqual(self.read('new/a'), 'a')
+        self.assertEqual(self.read('b'), 'B')
+        # The target backend is in charge of the old entries
+        self.assertEqual(self.read('dir/a'), 'a')
+
+        self.apply(Changeset("Remove", [Entry(Entry.DELETED, 'b')]))
+        self.failUnless(exists(join(tbdir, 'b')))
+
+    def testDelete(self):
+        """Verify that --delete targets get the removals mirrored"""
+
+        tbdir = self.dwd.target.repository.basedir
+        self.dwd.target.repository.EXTRA_RSYNC_FLAGS = ['--delete']
+
+        self.apply(Changeset("Add some files",
+                             [Entry(Entry.ADDED, 'dir/'),
+                              Entry(Entry.ADDED, 'dir/a', contents='a'),
+                              Entry(Entry.ADDED, 'b', contents='b')]))
+        self.apply(Changeset("Rename and remove",
+                             [Entry(Entry.RENAMED, 'new/', 'dir/'),
+                              Entry(Entry.DELETED, 'b')]))
+        self.assertEqual(listdir(tbdir), ['new'])
+        self.assertEqual(self.read('new/a'), 'a')
+
+
+class Mirroring(DualWorkingDirTestCase):
+    "Exercise the cheap copies of the files"
+
+    def testReflinkProbe(self):
+        """Verify the reflink probe leaves nothing behind"""
+
+        mirror = self.dwd.mirror
+        sbdir = self.dwd.source.repository.basedir
+        tbdir = self.dwd.target.repository.basedir
+        self.failUnless(mirror.canReflink(sbdir, tbdir) in (True, False))
+        self.assertEqual(listdir(sbdir), [])
+        self.assertEqual(listdir(tbdir), [])
+
+    def testHardlinks(self):
+        """Verify the bootstrap mirror with hard links"""
+
+        from os import rename, stat
+
+        sbdir = self.dwd.source.repository.basedir
+        tbdir = self.dwd.target.repository.basedir
+        self.dwd.mirror = Mirror(hardlinks=True)
+        self.dwd.mirror.reflinks = False
+        for e in Changeset("Add some files",
+                           [Entry(Entry.ADDED, 'dir/'),
+                            Entry(Entry.ADDED, 'dir/a', contents='a'),
+                            Entry(Entry.ADDED, 'b', contents='b')]).entries:
+            e.apply(sbdir)
+        mkdir(join(sbdir, '.svn'))
+
+        import vcpx.dualwd
+
+        saved = vcpx.dualwd.IGNORED_METADIRS
+        vcpx.dualwd.IGNORED_METADIRS = ['.svn']
+        try:
+            self.dwd._mirrorTree()
+        finally:
+            vcpx.dualwd.IGNORED_METADIRS = saved
+
+        self.failIf(exists(join(tbdir, '.svn')))
+        self.assertEqual(self.read('dir/a'), 'a')
+        self.assertEqual(stat(join(sbdir, 'b')).st_ino,
+                         stat(join(tbdir, 'b')).st_ino)
+
+        # Replacing a file breaks the link
+        open(join(sbdir, 'b.new'), 'w').write('B')
+        rename(join(sbdir, 'b.new'), join(sbdir, 'b'))
+        self.dwd._syncEntries(Changeset("Edit b",
+                                        [Entry(Entry.UPDATED, 'b')]))
+        self.assertEqual(self.read('b'), 'B')
+        self.assertEqual(stat(join(sbdir, 'b')).st_ino,
+                         stat(join(tbdir, 'b')).st_ino)
+
+    def testMirrorDelete(self):
+        """Verify the bootstrap mirror honors --delete"""
+
+        sbdir = self.dwd.source.repository.basedir
+        tbdir = self.dwd.target.repository.basedir
+        self.dwd.mirror = Mirror(hardlinks=True)
+        self.dwd.mirror.reflinks = False
+        self.dwd.target.repository.EXTRA_RSYNC_FLAGS = ['--delete']
+        for e in Changeset("Add some files",
+                           [Entry(Entry.ADDED, 'dir/'),
+                            Entry(Entry.ADDED, 'dir/a', contents='a')]).entries:
+            e.apply(sbdir)
+        for e in Changeset("Stale files",
+                           [Entry(Entry.ADDED, 'dir/'),
+                            Entry(Entry.ADDED, 'dir/old', contents='o'),
+                            Entry(Entry.ADDED, 'olddir/'),
+                            Entry(Entry.ADDED, 'olddir/x', contents='x')
+                            ]).entries:
+            e.apply(tbdir)
+        mkdir(join(tbdir, '_darcs'))
+
+        import vcpx.dualwd
+
+        saved = vcpx.dualwd.IGNORED_METADIRS
+        vcpx.dualwd.IGNORED_METADIRS = ['_darcs']
+        try:
+            self.dwd._mirrorTree()
+        finally:
+            vcpx.dualwd.IGNORED_METADIRS = saved
+
+        self.assertEqual(sorted(listdir(tbdir)), ['_darcs', 'dir'])
+        self.assertEqual(listdir(join(tbdir, 'dir')), ['a'])
@@ -0,0 +1,257 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- git specific tests
+# :Creato:   sab 17 ott 2026 15:02:11 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+from unittest import TestCase
+from datetime import datetime
+from vcpx.repository.git.source import changesets_from_gitlog
+from vcpx.tzinfo import UTC
+
+
+class GitLogParser(TestCase):
+    """Ensure the git log parser does its job"""
+
+    def getGitLog(self, testname):
+        from os.path import join, split
+
+        logname = join(split(__file__)[0], 'data', testname)+'.log'
+        return file(logname, 'rb')
+
+    def testMergeAndRename(self):
+        """Verify git log parser on merges and renames"""
+
+        log = self.getGitLog('git-merge_rename_test')
+        tags = {'93d2de157cd36a409cf00ce8541792beb09547df': ['v1']}
+        csets = list(changesets_from_gitlog(log, tags))
+
+        self.assertEqual([cs.log for cs in csets],
+                         ['First\nindented line', 'side', 'Rename a',
+                          "Merge branch 'side'", 'empty', 'Edit c, remove d'])
+
+        cset = csets[0]
+        self.assertEqual(cset.revision,
+                         '01057dc0d4b0df35f8132b4f9cacc5c135223b53')
+        self.assertEqual(cset.author, 'Lele Gaifax <lele@nautilus.homeip.net>')
+        self.assertEqual(cset.date, datetime(2006, 1, 2, 15, 4, 5, 0, UTC))
+        self.assertEqual(cset.date.utcoffset().seconds, 7200)
+        self.assertEqual(len(cset.entries), 1)
+        self.assertEqual(cset.entries[0].name, 'a')
+        self.assertEqual(cset.entries[0].action_kind, cset.entries[0].ADDED)
+
+        cset = csets[2]
+        self.assertEqual(len(cset.entries), 2)
+        entry = cset.entries[0]
+        self.assertEqual(entry.name, 'c')
+        self.assertEqual(entry.old_name, 'a')
+        self.assertEqual(entry.action_kind, entry.RENAMED)
+        entry = cset.entries[1]
+        self.assertEqual(entry.name, 'd')
+        self.assertEqual(entry.action_kind, entry.ADDED)
+
+        # Only the differences against the first parent are considered
+        cset = csets[3]
+        self.assertEqual(len(cset.entries), 1)
+        self.assertEqual(cset.entries[0].name, 'b')
+
+        cset = csets[4]
+        self.assertEqual(cset.entries, [])
+        self.assertEqual(cset.tags, ['v1'])
+
+        cset = csets[5]
+        self.assertEqual([(e.name, e.action_kind) for e in cset.entries],
+                         [('c', 'UPD'), ('d', 'DEL')])
+
+
+class GitFastImport(TestCase):
+    """Exercise the git target in fast-import mode"""
+
+    CONFIG = """\
+[%(test_name)s]
+source = mock:source
+target = git:target
+root-directory = %(test_dir)s
+state-file = state
+
+[mock:source]
+subdir = tree
+
+[git:target]
+subdir = tree
+fast-import = True
+fast-import-checkpoint = 2
+"""
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from atexit import register
+
+        self.test_name = self.id().split('.')[-1]
+        self.test_dir = mkdtemp('', 'tailor')
+        register(rmtree, self.test_dir)
+
+    def getChangesets(self):
+        from vcpx.repository.mock import MockChangeset as Changeset, \
+             MockChangesetEntry as Entry
+
+        changesets = [
+            Changeset("Add some files",
+                [ Entry(Entry.ADDED, 'dir/'),
+                  Entry(Entry.ADDED, 'dir/a1', contents="a1"),
+                  Entry(Entry.ADDED, 'dir/a2', contents="a2"),
+                  Entry(Entry.ADDED, 'dir/sub/a3', contents="a3"),
+                  Entry(Entry.ADDED, 'b', contents="b"),
+                ]),
+            Changeset("Move things around",
+                [ Entry(Entry.RENAMED, 'a.root', 'dir/a1'),
+                  Entry(Entry.RENAMED, 'newdir/', 'dir/'),
+                  Entry(Entry.UPDATED, 'newdir/sub/a3', contents="A3"),
+                ]),
+            Changeset("Remove and edit",
+                [ Entry(Entry.DELETED, 'b'),
+                  Entry(Entry.DELETED, 'newdir/sub/'),
+                  Entry(Entry.UPDATED, 'a.root', contents="A1"),
+                ]),
+            Changeset("Add a file with spaces",
+                [ Entry(Entry.ADDED, 'a file with "quotes"', contents="q"),
+                ]),
+            ]
+        changesets[2].tags = ['Version 1.0']
+        return changesets
+
+    def testImport(self):
+        """Verify the history imported by git fast-import"""
+
+        from cStringIO import StringIO
+        from vcpx.config import Config
+        from vcpx.tailor import Tailorizer
+        from vcpx.repository.git import GitExternalCommand, PIPE
+
+        test_name = self.test_name
+        test_dir = self.test_dir
+        config = Config(StringIO(self.CONFIG % vars()), {})
+        project = Tailorizer(test_name, config)
+        project.workingDir().source.changesets = self.getChangesets()
+        project()
+
+        repository = project.workingDir().target.repository
+
+        def git(*args):
+            c = GitExternalCommand(repository, cwd=repository.basedir,
+                                   command=repository.command(*args))
+            out = c.execute(stdout=PIPE)[0]
+            self.assertEqual(c.exit_status, 0)
+            return out.read()
+
+        history = [(git('log', '-1', '--format=%s', rev).split('] ')[1],
+                    git('ls-tree', '-r', '--name-only', rev).split('\n')[:-1],
+                    git('show', rev + ':a.root', '--'))
+                   for rev in git('rev-list', '--reverse', 'HEAD').split()[1:]]
+        self.assertEqual(history, [
+            ('Move things around\n', ['a.root', 'b', 'newdir/a2',
+                                      'newdir/sub/a3'], 'a1'),
+            ('Remove and edit\n', ['a.root', 'newdir/a2'], 'A1'),
+            ('Add a file with spaces\n', ['"a file with \\"quotes\\""',
+                                          'a.root', 'newdir/a2'], 'A1'),
+            ])
+        self.assertEqual(git('show', 'HEAD~1:newdir/a2'), 'a2')
+        self.assertEqual(git('rev-parse', 'Version_1_0^{commit}'),
+                         git('rev-parse', 'HEAD~1'))
+        self.assertEqual(git('status', '--porcelain'), '')
+        state_file = project.state_file
+        self.assertEqual(state_file.lastAppliedChangeset().log,
+                         'Add a file with spaces')
+        self.failIf(state_file.pending())
+
+    def testKilledFastImport(self):
+        """Verify the state file does not go past the last checkpoint"""
+
+        from os import kill
+        from signal import SIGKILL
+        from cStringIO import StringIO
+        from vcpx.config import Config
+        from vcpx.tailor import Tailorizer
+        from vcpx.source import ChangesetApplicationFailure
+        from vcpx.repository.git import GitExternalCommand, PIPE
+
+        class KillingTailorizer(Tailorizer):
+            def _applied(self, changeset):
+                if changeset.log == 'Add a file with spaces':
+                    target = self.workingDir().target
+                    kill(target._fast_import[0].pid, SIGKILL)
+
+        test_name = self.test_name
+        test_dir = self.test_dir
+        config = Config(StringIO(self.CONFIG % vars()), {})
+        project = KillingTailorizer(test_name, config)
+        project.workingDir().source.changesets = self.getChangesets()
+        self.assertRaises(ChangesetApplicationFailure, project)
+
+        repository = project.workingDir().target.repository
+        c = GitExternalCommand(repository, cwd=repository.basedir,
+                               command=repository.command('log', '-1',
+                                                          '--format=%s'))
+        tip = c.execute(stdout=PIPE)[0].read()
+        self.assertEqual(tip.split('] ')[1], 'Remove and edit\n')
+
+        state_file = project.state_file
+        state_file.finalize()
+        self.assertEqual(state_file.lastAppliedChangeset().log,
+                         'Remove and edit')
+        self.assertEqual([cs.log for cs in state_file],
+                         ['Add a file with spaces'])
+
+
+FAKE_GIT = """\
+import signal, sys
+
+# Fail when started with SIGINT ignored, that is uninterruptible
+sys.exit(signal.getsignal(signal.SIGINT) == signal.SIG_IGN)
+"""
+
+
+class GitLogStreaming(TestCase):
+    """Ensure the streamed git log can be interrupted"""
+
+    def testInterruptibleLog(self):
+        """Verify git log does not inherit an ignored SIGINT"""
+
+        from atexit import register
+        from os.path import join
+        from shutil import rmtree
+        from signal import signal, SIGINT, SIG_IGN
+        from sys import executable
+        from tempfile import mkdtemp
+        from vcpx.repository.git.source import GitSourceWorkingDir
+        from vcpx.statefile import StateFile
+
+        basedir = mkdtemp('', 'tailor')
+        register(rmtree, basedir)
+        script = join(basedir, 'git.py')
+        open(script, 'w').write(FAKE_GIT)
+
+        class FakeRepository:
+            name = 'git'
+            env = {}
+
+            def command(self, *args):
+                return [executable, script] + list(args)
+
+        repository = FakeRepository()
+        repository.basedir = basedir
+        wd = GitSourceWorkingDir(repository)
+
+        # The log is started lazily, while the state file gets written
+        sf = StateFile(join(basedir, 'state'), None)
+        sf.setPendingChangesets(wd._changesetsFromLog(['HEAD']))
+        self.assertEqual(sf.pendingCount(), 0)
+        sf.finalize()
+
+        previous = signal(SIGINT, SIG_IGN)
+        try:
+            self.assertEqual(list(wd._changesetsFromLog(['HEAD'])), [])
+        finally:
+            signal(SIGINT, previous)
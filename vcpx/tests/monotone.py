@@ -0,0 +1,214 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Tests for the monotone backend
+# :Creato:   sab 17 ott 2026 10:21:34 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+from unittest import TestCase
+from vcpx.repository.monotone import MonotoneStdio, MonotoneDiffParser, \
+     MonotoneChangeset, MonotoneRevToCset
+from vcpx.source import GetUpstreamChangesetsFailure
+
+FAKE_STDIO = """\
+import sys
+
+version = sys.argv[1]
+log = open(sys.argv[2], 'a')
+log.write('START\\n')
+
+def string(first):
+    size = first
+    while True:
+        ch = sys.stdin.read(1)
+        if ch == ':':
+            break
+        size += ch
+    return sys.stdin.read(int(size))
+
+def words():
+    result = []
+    while True:
+        ch = sys.stdin.read(1)
+        if ch == 'e':
+            return result
+        result.append(string(ch))
+
+if version == '2':
+    sys.stdout.write('format-version: 2\\n\\n')
+cmdnum = 0
+while True:
+    ch = sys.stdin.read(1)
+    if not ch:
+        break
+    options = []
+    if ch == 'o':
+        options = words()
+        ch = sys.stdin.read(1)
+    cmd = words()
+    log.write('%s %s\\n' % (cmd, options))
+    if cmd[0] == 'fail':
+        out, err, status = '', 'no such command', 1
+    else:
+        out, err, status = '%s;%s\\n' % (','.join(cmd), ','.join(options)), '', 0
+    if version == '2':
+        sys.stdout.write('%d:w:7:warning' % cmdnum)
+        for chunk in (out[:3], out[3:]):
+            if chunk:
+                sys.stdout.write('%d:m:%d:%s' % (cmdnum, len(chunk), chunk))
+        if err:
+            sys.stdout.write('%d:e:%d:%s' % (cmdnum, len(err), err))
+        sys.stdout.write('%d:l:1:%d' % (cmdnum, status))
+    else:
+        payload = err or out
+        sys.stdout.write('%d:%d:m:3:%s' % (cmdnum, status, payload[:3]))
+        sys.stdout.write('%d:%d:l:%d:%s' % (cmdnum, status, len(payload)-3,
+                                            payload[3:]))
+    sys.stdout.flush()
+    cmdnum += 1
+"""
+
+REVISION = """\
+format_version "1"
+
+new_manifest [0000000000000000000000000000000000000003]
+
+old_revision [0000000000000000000000000000000000000001]
+
+delete "old"
+
+add_dir "dir"
+
+add_file "dir/new"
+ content [0000000000000000000000000000000000000004]
+
+patch "file"
+ from [0000000000000000000000000000000000000005]
+   to [0000000000000000000000000000000000000006]
+
+set "file"
+ attr "mtn:execute"
+value "true"
+
+old_revision [0000000000000000000000000000000000000002]
+
+patch "other"
+ from [0000000000000000000000000000000000000007]
+   to [0000000000000000000000000000000000000008]
+"""
+
+
+CERTS = """\
+      key "key-dummy"
+signature "ok"
+     name "author"
+    value "lele"
+    trust "trusted"
+
+      key "key-dummy"
+signature "ok"
+     name "branch"
+    value "%s"
+    trust "trusted"
+
+      key "key-dummy"
+signature "ok"
+     name "date"
+    value "2007-06-11T00:08:33"
+    trust "trusted"
+"""
+
+
+class MonotoneAutomate(TestCase):
+    """Tests the monotone automate stdio session"""
+
+    def setUp(self):
+        from atexit import register
+        from os.path import join
+        from shutil import rmtree
+        from tempfile import mkdtemp
+
+        self.tmpdir = mkdtemp('', 'tailor')
+        register(rmtree, self.tmpdir)
+        self.script = join(self.tmpdir, 'mtn.py')
+        self.requests = join(self.tmpdir, 'requests')
+        open(self.script, 'w').write(FAKE_STDIO)
+
+    def __session(self, version):
+        from sys import executable
+
+        return MonotoneStdio([executable, self.script, version, self.requests])
+
+    def __check(self, version):
+        stdio = self.__session(version)
+        self.assertEqual(stdio.run('parents', ['abc']), 'parents,abc;\n')
+        self.assertEqual(stdio.run('certs', ['abc'], [('key', 'value')]),
+                         'certs,abc;key,value\n')
+        self.assertRaises(GetUpstreamChangesetsFailure, stdio.run, 'fail')
+        self.assertEqual(stdio.run('get_revision', ['def']),
+                         'get_revision,def;\n')
+        stdio.close()
+
+        log = open(self.requests).read()
+        self.assertEqual(log.count('START'), 1)
+        self.assertEqual(log.count('\n'), 5)
+
+    def testOriginalFormat(self):
+        """Verify the session with the original stdio output format"""
+
+        self.__check('1')
+
+    def testFormatVersion2(self):
+        """Verify the session with the stdio output format version 2"""
+
+        self.__check('2')
+
+    def testChangesFromRevision(self):
+        """Verify the changes are read from the revision of real parents"""
+
+        class FakeRepository:
+            def automate(self, command, args=(), options=()):
+                assert command == 'get_revision'
+                return REVISION
+
+        ancestor = '0000000000000000000000000000000000000001'
+        chset = MonotoneChangeset(ancestor, 'rev')
+        chset.real_ancestors = [ancestor,
+                                '0000000000000000000000000000000000000002']
+        MonotoneDiffParser(FakeRepository(), None).convertDiff(chset)
+        self.assertEqual([(e.action_kind, e.name) for e in chset.entries],
+                         [('DEL', 'old'), ('ADD', 'dir'), ('ADD', 'dir/new'),
+                          ('UPD', 'file')])
+
+    def testBoundedCertsCache(self):
+        """Verify only the first selected revisions keep their certs cached"""
+
+        class FakeRepository:
+            certs_cache = {}
+            queries = []
+
+            def automate(self, command, args=(), options=()):
+                self.queries.append((command, args[0]))
+                if command == 'parents':
+                    return ''
+                if args[0].startswith('other'):
+                    return CERTS % 'other.branch'
+                return CERTS % 'the.branch'
+
+        repository = FakeRepository()
+        mtr = MonotoneRevToCset(repository, None, 'the.branch')
+        mtr.CACHED_CERTS = 2
+        csets = mtr.getCset(['base', 'r1', 'other1', 'r2', 'r3', 'r4'], False)
+        self.assertEqual([(cs.lin_ancestor, cs.revision) for cs in csets],
+                         [('base', 'r1'), ('r1', 'r2'), ('r2', 'r3'),
+                          ('r3', 'r4')])
+        self.assertEqual(sorted(repository.certs_cache.keys()), ['r1', 'r2'])
+
+        # The cached certs are not asked again, the others are
+        del repository.queries[:]
+        for cs in csets:
+            mtr.logparser.convertLog(cs)
+        self.assertEqual([r for c, r in repository.queries if c == 'certs'],
+                         ['r3', 'r4'])
+        self.assertEqual(repository.certs_cache, {})
+        self.assertEqual(csets[3].author, 'lele')
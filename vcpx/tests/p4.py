@@ -0,0 +1,192 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Tests for the p4 library
+# :Creato:   sab 17 ott 2026 11:42:08 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+from unittest import TestCase
+
+FAKE_P4 = """\
+import marshal, sys, time
+
+args = sys.argv[1:]
+log = open(args.pop(0), 'a')
+log.write(' '.join(args) + '\\n')
+assert args.pop(0) == '-G'
+batch = None
+while args[0].startswith('-'):
+    option, value = args.pop(0), args.pop(0)
+    if option == '-x':
+        batch = [line[:-1] for line in sys.stdin.readlines()]
+command = args.pop(0)
+out = sys.stdout
+stamp = str(int(time.mktime((2007, 3, 16, 23, 6, 43, 0, 0, -1))))
+
+if command == 'changes':
+    for change in ('3', '2'):
+        marshal.dump({'code': 'stat', 'change': change, 'time': stamp,
+                      'user': 'lele', 'client': 'ws', 'status': 'submitted',
+                      'desc': 'Change number\\n%s\\n' % change}, out)
+elif command == 'describe':
+    for change in batch:
+        if change == '404':
+            marshal.dump({'code': 'error', 'severity': 3, 'generic': 1,
+                          'data': 'Change 404 unknown.\\n'}, out)
+            continue
+        marshal.dump({'code': 'stat', 'change': change, 'time': stamp,
+                      'user': 'lele', 'client': 'ws', 'status': 'submitted',
+                      'desc': 'Fix #%s\\n' % change,
+                      'depotFile0': '//depot/a b', 'rev0': '2',
+                      'action0': 'edit', 'type0': 'text',
+                      'depotFile1': '//depot/new', 'rev1': '1',
+                      'action1': 'branch', 'type1': 'text'}, out)
+elif command == 'filelog':
+    for path in batch:
+        marshal.dump({'code': 'stat', 'depotFile': path.split('#')[0],
+                      'rev0': '1', 'change0': '3', 'action0': 'branch',
+                      'time0': stamp, 'user0': 'lele', 'client0': 'ws',
+                      'type0': 'text', 'desc0': 'Branch it\\n',
+                      'how0,0': 'branch from', 'file0,0': '//depot/old',
+                      'srev0,0': '#none', 'erev0,0': '#4'}, out)
+elif command == 'sync':
+    marshal.dump({'code': 'stat', 'depotFile': '//depot/a b', 'rev': '2',
+                  'action': 'updated', 'clientFile': '/ws/a b',
+                  'change': '3'}, out)
+    marshal.dump({'code': 'error', 'severity': 2, 'generic': 17,
+                  'data': '//depot/new - file(s) up-to-date.\\n'}, out)
+"""
+
+
+class P4Marshal(TestCase):
+    """Tests the marshalled output of the p4 library"""
+
+    def setUp(self):
+        from atexit import register
+        from os import chmod
+        from os.path import join
+        from shutil import rmtree
+        from sys import executable
+        from tempfile import mkdtemp
+
+        tmpdir = mkdtemp('', 'tailor')
+        register(rmtree, tmpdir)
+        script = join(tmpdir, 'p4')
+        self.requests = join(tmpdir, 'requests')
+        open(script + '.py', 'w').write(FAKE_P4)
+        open(script, 'w').write('#!/bin/sh\nexec %s %s.py %s "$@"\n' % (
+            executable, script, self.requests))
+        chmod(script, 0755)
+        self.script = script
+
+    def __p4(self):
+        from vcpx.repository.p4.p4lib import P4
+
+        return P4(p4=self.script, client='my ws')
+
+    def testChanges(self):
+        """Verify the list of changes"""
+
+        changes = self.__p4().changes('//depot/...')
+        self.assertEqual([c['change'] for c in changes], [3, 2])
+        self.assertEqual(changes[0]['date'], '2007/03/16')
+        self.assertEqual(changes[0]['description'], 'Change number 3')
+        self.assertEqual(open(self.requests).read(),
+                         '-G -c my ws changes //depot/...\n')
+
+    def testDescribe(self):
+        """Verify the description of one or more changes"""
+
+        from vcpx.repository.p4.p4lib import P4LibError
+
+        p4 = self.__p4()
+        desc = p4.describe(3, shortForm=True)
+        self.assertEqual(desc['change'], 3)
+        self.assertEqual(desc['date'], '2007/03/16 23:06:43')
+        self.assertEqual(desc['description'], 'Fix #3\n')
+        self.assertEqual(desc['files'],
+                         [{'depotFile': '//depot/a b', 'rev': 2,
+                           'action': 'edit'},
+                          {'depotFile': '//depot/new', 'rev': 1,
+                           'action': 'branch'}])
+
+        descs = p4.describe([4, 5], shortForm=True)
+        self.assertEqual([d['change'] for d in descs], [4, 5])
+        self.assertRaises(P4LibError, p4.describe, [6, 404], shortForm=True)
+        self.assertEqual(open(self.requests).read().count('describe -s'), 3)
+
+    def testFilelogAndSync(self):
+        """Verify the file history and the sync records"""
+
+        p4 = self.__p4()
+        log = p4.filelog('//depot/new#1', maxRevs=1)
+        self.assertEqual(log[0]['depotFile'], '//depot/new')
+        rev = log[0]['revs'][0]
+        self.assertEqual((rev['rev'], rev['change'], rev['action']),
+                         (1, 3, 'branch'))
+        self.assertEqual(rev['notes'], ['branch from //depot/old#1,#4'])
+
+        hits = p4.sync('//depot/...@3')
+        self.assertEqual(hits, [{'depotFile': '//depot/a b', 'rev': 2,
+                                 'comment': 'updating /ws/a b',
+                                 'notes': []}])
+
+    def getSource(self):
+        from vcpx.repository.p4.source import P4SourceWorkingDir
+
+        class FakeRepository:
+            name = 'p4'
+            EXECUTABLE = self.script
+            depot_path = '//depot/'
+            p4client = None
+            p4port = None
+            basedir = self.requests + '.wc'
+
+        return P4SourceWorkingDir(FakeRepository())
+
+    def applyPending(self, wd):
+        self.failUnless(wd.state_file.pending())
+        for cs in wd.state_file:
+            self.failUnless(wd._willApplyChangeset(cs))
+            wd._applyChangeset(cs)
+            self.assertEqual([(e.action_kind, e.name) for e in cs.entries],
+                             [('ADD', 'new'), ('UPD', 'a b')])
+            self.assertEqual(cs.log, 'Fix #%s\n' % cs.revision)
+            wd.state_file.applied()
+        wd.state_file.finalize()
+
+    def testIncrementalSource(self):
+        """Verify the source asks only for the new changes, in batches"""
+
+        from vcpx.statefile import StateFile
+
+        wd = self.getSource()
+        wd.setStateFile(StateFile(self.requests + '.sf', None))
+        changesets = wd._getUpstreamChangesets('1')
+        self.assertEqual([cs.revision for cs in changesets], ['2', '3'])
+        wd.state_file.setPendingChangesets(changesets)
+        self.applyPending(wd)
+
+        log = open(self.requests).read().splitlines()
+        self.assertEqual(log[0], '-G changes //depot/...@>1')
+        self.assertEqual(len([l for l in log if 'describe' in l]), 1)
+        self.assertEqual(len([l for l in log if 'filelog' in l]), 2)
+
+    def testResumedSource(self):
+        """Verify the changes resumed from the state file are batched"""
+
+        from vcpx.statefile import SQLiteStateFile
+
+        wd = self.getSource()
+        changesets = wd._getUpstreamChangesets('1')
+        sf = SQLiteStateFile(self.requests + '.db', None)
+        sf.setPendingChangesets(changesets)
+        sf.finalize()
+
+        # A new session, that did not fetch the changes
+        wd = self.getSource()
+        wd.setStateFile(SQLiteStateFile(self.requests + '.db', None))
+        self.applyPending(wd)
+
+        log = open(self.requests).read().splitlines()
+        self.assertEqual(len([l for l in log if 'describe' in l]), 1)
@@ -0,0 +1,129 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Tests for the RCS files reader
+# :Creato:   sab 17 ott 2026 22:41:08 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+from unittest import TestCase
+from os.path import join, split
+from vcpx.rcs import RcsFile, rlog
+
+REPOSITORY = join(split(__file__)[0], 'data', 'rcs-repository')
+
+
+class RcsFileParser(TestCase):
+    """Tests for the RCS file parser"""
+
+    def testRevisions(self):
+        """Verify the texts rebuilt from the RCS deltas"""
+
+        rcsfile = RcsFile(join(REPOSITORY, 'mod', 'hello.c,v'))
+        self.assertEqual(rcsfile.head, '1.3')
+        self.assertEqual(rcsfile.symbol('BR'), '1.2.2')
+        self.assertEqual(rcsfile.revisions['1.3'].log,
+                         'Drop gone, mention @2\n')
+        self.assertEqual(rcsfile.checkout('1.1'), 'one\ntwo\n')
+        self.assertEqual(rcsfile.checkout('1.2'), 'one\ntwo\nthree\n')
+        self.assertEqual(rcsfile.checkout('1.2.2.2'),
+                         'zero\none\ntwo\nthree\nbranch\n')
+        self.assertEqual(rcsfile.checkout('1.3'), 'one\n2\nthree\n'
+                         '$Id: hello.c,v 1.3 2004/01/04 10:00:00 lele Exp $\n')
+        self.assertEqual(rcsfile.checkout('1.3', 'k'),
+                         'one\n2\nthree\n$Id$\n')
+        self.assertEqual(rcsfile.getLinesCount('1.3'), (2, 1))
+        self.assertEqual(rcsfile.getLinesCount('1.1'), None)
+
+    def testSelection(self):
+        """Verify the selection of revisions with rlog -r syntax"""
+
+        rcsfile = RcsFile(join(REPOSITORY, 'mod', 'hello.c,v'))
+        self.assertEqual(rcsfile.select(':HEAD'), ['1.3', '1.2', '1.1'])
+        self.assertEqual(rcsfile.select('HEAD:HEAD'), ['1.3'])
+        self.assertEqual(rcsfile.select(':REL_1'), ['1.2', '1.1'])
+        self.assertEqual(rcsfile.select('BR'), ['1.2.2.2', '1.2.2.1'])
+        self.assertEqual(rcsfile.select('BR.'), ['1.2.2.2'])
+        self.assertEqual(rcsfile.select('REL_BR'), ['1.2.2.1'])
+        self.assertEqual(rcsfile.select('UNKNOWN'), [])
+
+    def testRlog(self):
+        """Verify the changesets built from the emulated rlog"""
+
+        from StringIO import StringIO
+        from vcpx.repository.cvs import changesets_from_cvslog
+
+        log = StringIO(''.join(rlog(REPOSITORY, 'mod', ':HEAD', True)))
+        csets = list(changesets_from_cvslog(log, 'mod'))
+        self.assertEqual(len(csets), 3)
+
+        cset = csets[0]
+        self.assertEqual(cset.log, 'Initial import')
+        self.assertEqual([(e.name, e.action_kind) for e in cset.entries],
+                         [('hello.c', cset.entries[0].ADDED),
+                          ('sub/x', cset.entries[0].ADDED)])
+
+        cset = csets[2]
+        self.assertEqual(cset.author, 'lele')
+        self.assertEqual([(e.name, e.action_kind, e.new_revision)
+                          for e in cset.entries],
+                         [('hello.c', cset.entries[0].UPDATED, '1.3'),
+                          ('gone', cset.entries[0].DELETED, '1.2')])
+
+        log = StringIO(''.join(rlog(REPOSITORY, 'mod', 'BR',
+                                    after='2004-01-04 00:00:00')))
+        csets = list(changesets_from_cvslog(log, 'mod'))
+        self.assertEqual(len(csets), 1)
+        self.assertEqual(csets[0].log, 'More branch work')
+
+
+class FakeRepository(object):
+    name = 'cvs:source'
+    module = 'mod'
+    rcs_root = REPOSITORY
+    freeze_keywords = False
+    batch_updates = False
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+
+
+class DirectUpdate(TestCase):
+    """Tests the update of a CVS working copy from the RCS files"""
+
+    def testUpdate(self):
+        """Verify the files and the CVS/Entries written from the RCS files"""
+
+        from atexit import register
+        from os import mkdir
+        from os.path import exists
+        from shutil import rmtree
+        from tempfile import mkdtemp
+        from vcpx.repository.cvs import CvsWorkingDir, CvsEntriesCache
+
+        basedir = mkdtemp('', 'tailor')
+        register(rmtree, basedir)
+        mkdir(join(basedir, 'CVS'))
+        open(join(basedir, 'CVS', 'Entries'), 'w').write('D/sub////\n')
+
+        wd = CvsWorkingDir(FakeRepository(basedir))
+        wd._updateEntries(['hello.c'], '1.2')
+        wd._updateEntries(['gone'], '1.1')
+        self.assertEqual(open(join(basedir, 'hello.c')).read(),
+                         'one\ntwo\nthree\n')
+        self.assertEqual(open(join(basedir, 'gone')).read(), '$Id$\n')
+
+        entries = CvsEntriesCache(basedir)
+        self.assertEqual(entries.getFileInfo('hello.c').cvs_version, '1.2')
+        self.assertEqual(entries.getFileInfo('hello.c').cvs_tag, 'T1.2')
+
+        wd._updateEntries(['hello.c', 'gone'], '1.3')
+        wd._updateEntries(['gone'], '1.2')
+        self.failIf(exists(join(basedir, 'gone')))
+        self.assert_(open(join(basedir, 'hello.c')).read().endswith(
+            '$Id: hello.c,v 1.3 2004/01/04 10:00:00 lele Exp $\n'))
+
+        entries.refresh()
+        self.assertEqual(entries.getFileInfo('hello.c').cvs_version, '1.3')
+        self.assertEqual(entries.getFileInfo('gone'), None)
+        self.assert_('D/sub////\n' in open(join(basedir, 'CVS',
+                                                'Entries')).readlines())
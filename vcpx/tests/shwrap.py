@@ -6,7 +6,7 @@
 #
 
 from unittest import TestCase
-from vcpx.shwrap import ExternalCommand, PIPE
+from vcpx.shwrap import ExternalCommand, ExternalPipeline, PIPE
 from sys import platform
 from tempfile import gettempdir
 
@@ -131,3 +131,73 @@ class SystemCommand(TestCase):
         c.MAX_CMDLINE_LENGTH = None
         out = c.execute(args, stdout=PIPE)[0]
         self.assertEqual(out.read(), ' '.join(args)+'\n')
+
+    def testStreamedOutput(self):
+        """Verify the streamed execution"""
+
+        if platform == 'win32':
+            return
+
+        c = ExternalCommand(['sh', '-c', 'echo uno; echo due >&2; echo tre; exit 3'])
+        out, err = c.execute(stdout=PIPE, stderr=PIPE, stream=True)
+        self.assertEqual(c.exit_status, None)
+        self.assertEqual(out.readline(), 'uno\n')
+        self.assertEqual(list(out), ['tre\n'])
+        self.assertEqual(c.exit_status, 3)
+        self.assertEqual(err.read(), 'due\n')
+
+        c = ExternalCommand(['cat'])
+        out = c.execute(stdout=PIPE, input='ciao\n' * 1000, stream=True)[0]
+        self.assertEqual(out.read(5), 'ciao\n')
+        self.assertEqual(len(out.read()), 5 * 999)
+        self.assertEqual(c.exit_status, 0)
+
+    def testPipeline(self):
+        """Verify the commands connected by a pipeline"""
+
+        if platform == 'win32':
+            return
+
+        p = ExternalPipeline([['sh', '-c', 'cat; echo due >&2'],
+                              ['sort', '-r'],
+                              ['sh', '-c', 'cat; exit 2']])
+        out, err = p.execute(input='uno\ntre\n', stdout=PIPE, stderr=PIPE)
+        self.assertEqual(out.read(), 'uno\ntre\n')
+        self.assertEqual(err.read(), 'due\n')
+        self.assertEqual(p.exit_statuses, [0, 0, 2])
+        self.assertEqual(p.exit_status, 2)
+
+        p = ExternalPipeline([['yes'], ['sed', 's/y/n/'],
+                              ['head', '-n', '3']])
+        out = p.execute(stdout=PIPE, stream=True)[0]
+        self.assertEqual(p.exit_status, None)
+        self.assertEqual(list(out), ['n\n', 'n\n', 'n\n'])
+        # The endless command gets killed by the broken pipe
+        self.assertEqual(p.exit_statuses[2], 0)
+        self.assertNotEqual(p.exit_status, 0)
+
+        p = ExternalPipeline([['true'], ['/does/not/exist']])
+        self.assertRaises(OSError, p.execute)
+
+    def testInterruptibleChildren(self):
+        """Verify the commands do not inherit an ignored SIGINT"""
+
+        if platform == 'win32':
+            return
+
+        from signal import signal, SIGINT, SIG_IGN
+        from sys import executable
+
+        probe = [executable, '-c', 'import signal; '
+                 'print signal.getsignal(signal.SIGINT) == signal.SIG_IGN']
+
+        previous = signal(SIGINT, SIG_IGN)
+        try:
+            c = ExternalCommand(probe)
+            self.assertEqual(c.execute(stdout=PIPE)[0].read(), 'False\n')
+            out = c.execute(stdout=PIPE, stream=True)[0]
+            self.assertEqual(out.read(), 'False\n')
+            p = ExternalPipeline([probe, ['cat']])
+            self.assertEqual(p.execute(stdout=PIPE)[0].read(), 'False\n')
+        finally:
+            signal(SIGINT, previous)
@@ -0,0 +1,163 @@
+# -*- mode: python; coding: utf-8 -*-
+# :Progetto: vcpx -- Tests for the changeset application loop
+# :Creato:   sab 17 ott 2026 10:12:40 CEST
+# :Autore:   Lele Gaifax <lele@nautilus.homeip.net>
+# :Licenza:  GNU General Public License
+#
+
+from unittest import TestCase
+from vcpx.statefile import StateFile
+from vcpx.shwrap import ReopenableNamedTemporaryFile
+from vcpx.repository.mock import MockWorkingDir, \
+     MockChangeset as Changeset, MockChangesetEntry as Entry
+
+
+class FakeRepository(object):
+    name = 'mock:source'
+    delay_before_apply = None
+
+    def __init__(self, basedir):
+        self.basedir = basedir
+
+
+class PipelinedApplication(TestCase):
+    "Exercise the pipelined application of the pending changesets"
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        from atexit import register
+        from shutil import rmtree
+
+        self.basedir = mkdtemp('', 'tailor')
+        register(rmtree, self.basedir)
+        self.rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+        self.changesets = [
+            Changeset("Add a", [Entry(Entry.ADDED, 'a', contents='a')]),
+            Changeset("Add b", [Entry(Entry.ADDED, 'b', contents='b')]),
+            Changeset("Edit a", [Entry(Entry.UPDATED, 'a', contents='A')]),
+            ]
+        sf = StateFile(self.rontf.name, None)
+        sf.setPendingChangesets(self.changesets)
+
+    def getWorkingDir(self):
+        wd = MockWorkingDir(FakeRepository(self.basedir))
+        wd.setStateFile(StateFile(self.rontf.name, None))
+        wd.getPendingChangesets()
+        return wd
+
+    def testOrder(self):
+        """Verify that the pipeline replays the changesets in order"""
+
+        wd = self.getWorkingDir()
+        events = []
+
+        def stage(changeset):
+            events.append(('stage', changeset.revision))
+            return True
+
+        def replay(changeset):
+            last = wd.state_file.last_applied
+            events.append(('replay', changeset.revision,
+                           last and last.revision))
+
+        last, conflicts = wd.applyPendingChangesets(replay=replay, stage=stage)
+
+        revs = [cs.revision for cs in self.changesets]
+        self.assertEqual(last, self.changesets[-1])
+        self.assertEqual(conflicts, [])
+        self.assertEqual(events, [('stage', revs[0]),
+                                  ('replay', revs[0], None),
+                                  ('stage', revs[1]),
+                                  ('replay', revs[1], revs[0]),
+                                  ('stage', revs[2]),
+                                  ('replay', revs[2], revs[1])])
+
+        sf = StateFile(self.rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), self.changesets[-1])
+        self.assertEqual(sf.pending(), False)
+
+    def testFailingReplay(self):
+        """Verify that a failed replay leaves the changeset pending"""
+
+        wd = self.getWorkingDir()
+
+        def replay(changeset):
+            if changeset == self.changesets[1]:
+                raise Exception('boom')
+
+        self.assertRaises(Exception, wd.applyPendingChangesets,
+                          replay=replay, stage=lambda cs: True)
+
+        sf = StateFile(self.rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), self.changesets[0])
+        self.assertEqual(sf.next(), self.changesets[1])
+
+
+class PagedWorkingDir(MockWorkingDir):
+    "Hand out the upstream changesets two at a time"
+
+    def __init__(self, *args, **kwargs):
+        super(PagedWorkingDir, self).__init__(*args, **kwargs)
+        self.requests = []
+
+    def _getUpstreamChangesets(self, sincerev):
+        self.requests.append(sincerev)
+        start = 0
+        for i, cs in enumerate(self.changesets):
+            if cs.revision == sincerev:
+                start = i+1
+        return iter(self.changesets[start:start+2])
+
+    def _getNextUpstreamPage(self, sincerev):
+        if sincerev != self.changesets[-1].revision:
+            return self._getUpstreamChangesets(sincerev)
+
+
+class PagedApplication(TestCase):
+    "Exercise the application of changesets fetched in pages"
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        from atexit import register
+        from shutil import rmtree
+
+        self.basedir = mkdtemp('', 'tailor')
+        register(rmtree, self.basedir)
+        self.changesets = [
+            Changeset("Add a", [Entry(Entry.ADDED, 'a', contents='a')]),
+            Changeset("Add b", [Entry(Entry.ADDED, 'b', contents='b')]),
+            Changeset("Edit a", [Entry(Entry.UPDATED, 'a', contents='A')]),
+            Changeset("Edit b", [Entry(Entry.UPDATED, 'b', contents='B')]),
+            Changeset("Add c", [Entry(Entry.ADDED, 'c', contents='c')]),
+            ]
+
+    def __apply(self, **kwargs):
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+        wd = PagedWorkingDir(FakeRepository(self.basedir))
+        wd.changesets = self.changesets
+        wd.setStateFile(StateFile(rontf.name, None))
+        wd.getPendingChangesets()
+        self.assertEqual(wd.state_file.pendingCount(), 2)
+
+        replayed = []
+        last, conflicts = wd.applyPendingChangesets(replay=replayed.append,
+                                                    **kwargs)
+        self.assertEqual(replayed, self.changesets)
+        self.assertEqual(last, self.changesets[-1])
+
+        revs = [cs.revision for cs in self.changesets]
+        self.assertEqual(wd.requests, [None, revs[1], revs[3]])
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), self.changesets[-1])
+        self.assertEqual(sf.pending(), False)
+
+    def testPages(self):
+        """Verify the pages get appended to the state file"""
+
+        self.__apply()
+
+    def testPipelinedPages(self):
+        """Verify the pages get appended also in the pipelined mode"""
+
+        self.__apply(stage=lambda cs: True)
@@ -6,7 +6,7 @@
 #
 
 from unittest import TestCase
-from vcpx.statefile import StateFile
+from vcpx.statefile import StateFile, SQLiteStateFile
 from vcpx.shwrap import ReopenableNamedTemporaryFile
 from vcpx.repository.mock import MockChangeset as Changeset, MockChangesetEntry as Entry
 
@@ -274,3 +274,446 @@ class Statefile(TestCase):
         cs = sf.next()
 
         self.assertRaises(StopIteration, sf.next)
+
+    def testLegacyConversion(self):
+        """Verify the conversion of old plain pickle state files"""
+
+        from cPickle import dump
+        from os.path import exists
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        old = open(rontf.name, 'w')
+        for obj in (None, None, 1, 2, 3, 4, 5):
+            dump(obj, old)
+        old.close()
+
+        journal = open(rontf.name + '.journal', 'w')
+        dump(2, journal)
+        journal.close()
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 2)
+        self.assertEqual(list(sf), [3, 4, 5])
+        self.assert_(exists(rontf.name + '.old'))
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 2)
+        sf.next()
+        sf.applied()
+        sf.finalize()
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 3)
+        self.assertEqual(list(sf), [4, 5])
+
+    def testLostIndex(self):
+        """Verify the state file survives the loss of its index"""
+
+        from os import unlink
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        sf = StateFile(rontf.name, None)
+        sf.setPendingChangesets([1,2,3,4,5])
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), None)
+        sf.next()
+        sf.applied()
+        sf.next()
+        sf.applied()
+        sf.finalize()
+
+        unlink(rontf.name + '.journal')
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 2)
+        self.assertEqual(sf.pending(), True)
+        self.assertEqual(list(sf), [3, 4, 5])
+
+
+    def testOutOfQueueApplied(self):
+        """Verify the recovery after applying a changeset not queued"""
+
+        from os import unlink
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        sf = StateFile(rontf.name, None)
+        sf.setPendingChangesets([1,2,3])
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), None)
+        sf.next()
+        sf.applied()
+        sf.applied(99)
+        sf.finalize()
+
+        # Crash before the index reached the disk
+        unlink(rontf.name + '.journal')
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 99)
+        self.assertEqual(sf.pendingCount(), 2)
+        self.assertEqual(list(sf), [2,3])
+        sf.applied()
+        sf.finalize()
+
+        unlink(rontf.name + '.journal')
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 3)
+        self.assertEqual(sf.pending(), False)
+
+    def testConsumptionMarks(self):
+        """Verify applying a queued changeset does not copy it in the log"""
+
+        from os.path import getsize
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        big = ['x' * 1000]
+        sf = StateFile(rontf.name, None)
+        sf.setPendingChangesets([big, big])
+        size = getsize(rontf.name)
+        sf.next()
+        sf.applied()
+        self.assert_(getsize(rontf.name) - size < 100)
+        sf.finalize()
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), big)
+        self.assertEqual(list(sf), [big])
+
+    def testAppend(self):
+        """Verify the pending changesets appended while iterating"""
+
+        from os import unlink
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        sf = StateFile(rontf.name, None)
+        sf.setPendingChangesets([1,2])
+        self.assertEqual(sf.next(), 1)
+        sf.applied()
+        self.assertEqual(sf.next(), 2)
+        sf.appendPendingChangesets([3,4])
+        self.assertEqual(sf.pendingCount(), 3)
+        sf.applied()
+        self.assertEqual(sf.next(), 3)
+        sf.finalize()
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 2)
+        self.assertEqual(sf.pendingCount(), 2)
+        self.assertEqual(list(sf), [3,4])
+
+        # The index is rebuilt consistently
+        unlink(rontf.name + '.journal')
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.pendingCount(), 2)
+        self.assertEqual(list(sf), [3,4])
+
+    def testInterruptibleWrite(self):
+        """Verify the changesets are produced with SIGINT not ignored"""
+
+        from signal import getsignal, SIGINT, SIG_IGN
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        sf = StateFile(rontf.name, None)
+        sf.setPendingChangesets([1,2])
+        sf.next()
+        sf.applied()
+        sf.finalize()
+
+        def stream():
+            for cs in [3,4]:
+                self.assertNotEqual(getsignal(SIGINT), SIG_IGN)
+                yield cs
+            raise KeyboardInterrupt
+
+        sf = StateFile(rontf.name, None)
+        self.assertRaises(KeyboardInterrupt, sf.setPendingChangesets, stream())
+        self.assertNotEqual(getsignal(SIGINT), SIG_IGN)
+
+        # The interrupted fetch left the previous state untouched
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 1)
+        self.assertEqual(list(sf), [2])
+
+        sf = StateFile(rontf.name, None)
+        sf.appendPendingChangesets(iter([5,6]))
+        self.assertRaises(KeyboardInterrupt, sf.appendPendingChangesets,
+                          stream())
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.pendingCount(), 3)
+        self.assertEqual(list(sf), [2,5,6])
+
+    def testHold(self):
+        """Verify that held changesets are recorded only when released"""
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        sf = StateFile(rontf.name, None)
+        sf.setPendingChangesets([1,2,3,4])
+        sf.next()
+        sf.applied()
+        sf.hold()
+        sf.next()
+        sf.applied()
+        sf.next()
+        sf.applied()
+        sf.finalize()
+
+        # Still open, until released
+        self.assertEqual(sf.pendingCount(), 3)
+        sf.release()
+        self.assertEqual(sf.archive, None)
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 3)
+        self.assertEqual(list(sf), [4])
+        sf.hold()
+        sf.applied()
+        sf.finalize()
+        sf.release(False)
+
+        sf = StateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 3)
+        self.assertEqual(sf.pendingCount(), 1)
+        sf.finalize()
+
+
+class SQLiteStatefile(TestCase):
+    "Exercise the SQLite state file"
+
+    def testStateFile(self):
+        """Verify the SQLite state file behaviour"""
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        sf = SQLiteStateFile(rontf.name, None)
+        sf.setPendingChangesets([1,2,3,4,5])
+        self.assertEqual(sf.pendingCount(), 5)
+
+        sf = SQLiteStateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), None)
+        cs = sf.next()
+        sf.applied()
+        cs = sf.next()
+        self.assertEqual(cs, 2)
+
+        # Not applied, so it remains pending
+        sf = SQLiteStateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 1)
+        self.assertEqual(sf.pendingCount(), 4)
+        i = 2
+        for cs in sf:
+            self.assertEqual(cs, i)
+            sf.applied()
+            i += 1
+        sf.finalize()
+        self.assertEqual(sf.pending(), False)
+        self.assertEqual(sf.lastAppliedChangeset(), 5)
+
+    def testChangesets(self):
+        """Verify the SQLite state file with "real" changesets"""
+
+        changesets = [
+            Changeset("Add dir/a{1,2,3}",
+                [ Entry(Entry.ADDED, 'dir/'),
+                  Entry(Entry.ADDED, 'dir/a1'),
+                  ]),
+            Changeset("Initially empty", []),
+            Changeset("Spread around",
+                [ Entry(Entry.RENAMED, 'newdir/', 'dir/'),
+                  Entry(Entry.UPDATED, 'newdir/a1', contents="ciao"),
+                  ]),
+            ]
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        sf = SQLiteStateFile(rontf.name, None)
+        sf.setPendingChangesets(changesets)
+
+        sf = SQLiteStateFile(rontf.name, None)
+        self.assertEqual(sf.lookup(changesets[2].revision), changesets[2])
+        cs = sf.next()
+        cs.entries.append(Entry(Entry.ADDED, 'dir2'))
+        sf.applied()
+        self.assertEqual(sf.lookup(changesets[0].revision), None)
+
+        sf = SQLiteStateFile(rontf.name, None)
+        last = sf.lastAppliedChangeset()
+        self.assertEqual(last, changesets[0])
+        self.assertEqual(len(last.entries), 3)
+        self.assertEqual(sf.next(), changesets[1])
+
+    def testAppend(self):
+        """Verify the pending changesets appended to the SQLite state file"""
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        sf = SQLiteStateFile(rontf.name, None)
+        sf.setPendingChangesets([1,2])
+        self.assertEqual(sf.next(), 1)
+        sf.applied()
+        sf.appendPendingChangesets([3,4])
+        self.assertEqual(sf.pendingCount(), 3)
+        self.assertEqual(list(sf), [2,3,4])
+
+        sf = SQLiteStateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 1)
+        self.assertEqual(sf.pendingCount(), 3)
+
+    def testHold(self):
+        """Verify that held changesets are recorded only when released"""
+
+        rontf = ReopenableNamedTemporaryFile('sf', 'tailor')
+
+        sf = SQLiteStateFile(rontf.name, None)
+        sf.setPendingChangesets([1,2,3,4])
+        sf.next()
+        sf.applied()
+        sf.hold()
+        sf.next()
+        sf.applied()
+        sf.next()
+        sf.applied()
+        sf.finalize()
+
+        # Still open, until released
+        self.assertEqual(sf.pendingCount(), 3)
+        sf.release()
+        self.assertEqual(sf.archive, None)
+
+        sf = SQLiteStateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 3)
+        self.assertEqual(list(sf), [4])
+        sf.hold()
+        sf.applied()
+        sf.finalize()
+        sf.release(False)
+
+        sf = SQLiteStateFile(rontf.name, None)
+        self.assertEqual(sf.lastAppliedChangeset(), 3)
+        self.assertEqual(sf.pendingCount(), 1)
+        sf.finalize()
+
+
+class ChangesetPickling(TestCase):
+    "Exercise the compact pickled form of the changesets"
+
+    def getChangeset(self):
+        from datetime import datetime
+        from vcpx.changes import Changeset as BaseChangeset
+        from vcpx.tzinfo import UTC
+
+        cs = BaseChangeset('rev-1', datetime(2005, 8, 17, 18, 51, 46, 0, UTC),
+                           'lele', 'Some changes', tags=['v1'])
+        e = cs.addEntry('a/b', 'rev-1')
+        e.action_kind = e.RENAMED
+        e.old_name = 'a/c'
+        e.is_directory = True
+        cs.addEntry('a/d', 'rev-1').action_kind = e.DELETED
+        return cs
+
+    def testRoundTrip(self):
+        """Verify the compact pickle round trip"""
+
+        from cPickle import dumps, loads, HIGHEST_PROTOCOL
+
+        cs = self.getChangeset()
+        self.failIf(hasattr(cs, '__dict__'))
+        self.failIf(hasattr(cs.entries[0], '__dict__'))
+        for protocol in (0, HIGHEST_PROTOCOL):
+            copy = loads(dumps(cs, protocol))
+            self.assertEqual(copy, cs)
+            self.assertEqual(copy.log, cs.log)
+            self.assertEqual(copy.tags, ['v1'])
+            self.assertEqual(copy.entries, cs.entries)
+            self.assertEqual(copy.entries[0].is_directory, True)
+            self.assertEqual(copy.entries[0].is_symlink, False)
+            self.assertEqual(copy.entries[1].action_kind, Entry.DELETED)
+
+    def testInterning(self):
+        """Verify that repeated strings are shared"""
+
+        from cPickle import dumps, loads
+
+        cs = self.getChangeset()
+        copy = loads(dumps(cs, 2))
+        self.failUnless(copy.author is cs.author)
+        self.failUnless(copy.entries[0].name is cs.entries[0].name)
+        self.failUnless(copy.entries[1].new_revision is
+                        cs.entries[0].new_revision)
+
+    def testActionKindCodes(self):
+        """Verify that the action kinds are pickled as small integers"""
+
+        from vcpx.changes import ChangesetEntry
+
+        cs = self.getChangeset()
+        state = cs.entries[0].__getstate__()
+        self.assertEqual(type(state[4]), int)
+        self.assertEqual(state[5], 0)
+
+        e = ChangesetEntry.__new__(ChangesetEntry)
+        e.__setstate__(state)
+        self.assertEqual(e.action_kind, e.RENAMED)
+        self.assertEqual(e.status, None)
+
+        # The compact state written before the codes carried the strings
+        e = ChangesetEntry.__new__(ChangesetEntry)
+        e.__setstate__(('a/b', None, None, 'rev-1', 'ADD', 'APPLIED',
+                        None, 0, None))
+        self.assertEqual(e.action_kind, e.ADDED)
+        self.assertEqual(e.status, e.APPLIED)
+
+    def testForgetInterned(self):
+        """Verify that the interned unicode strings can be released"""
+
+        from vcpx.changes import intern_string, forget_interned_strings
+
+        name = u'\xe0/b'
+        self.failUnless(intern_string(u'\xe0/' + u'b') is
+                        intern_string(name))
+        self.assertEqual(type(intern_string('a/b')), str)
+        forget_interned_strings()
+        self.failIf(intern_string(u'\xe0/' + u'b') is name)
+
+    def testSubclassAttributes(self):
+        """Verify that subclasses attributes survive the pickle"""
+
+        from cPickle import dumps, loads
+
+        cs = Changeset("Add a", [Entry(Entry.ADDED, 'a', contents='a')])
+        copy = loads(dumps(cs, 2))
+        self.assertEqual(copy, cs)
+        self.assertEqual(copy.entries[0].contents, 'a')
+
+    def testLegacyState(self):
+        """Verify that old style pickled changesets can be loaded"""
+
+        from datetime import datetime
+        from vcpx.changes import Changeset as BaseChangeset, ChangesetEntry
+        from vcpx.tzinfo import UTC
+
+        e = ChangesetEntry.__new__(ChangesetEntry)
+        e.__setstate__({'name': 'a/b', 'action_kind': 'ADD',
+                        'new_revision': 'rev-1'})
+        self.assertEqual(e.action_kind, e.ADDED)
+        self.assertEqual(e.old_name, None)
+        self.assertEqual(e.is_directory, False)
+
+        cs = BaseChangeset.__new__(BaseChangeset)
+        cs.__setstate__({'revision': 'rev-1', 'author': 'lele',
+                         'date': datetime(2005, 8, 17, 18, 51, 46),
+                         'log': 'Old one', 'entries': [e],
+                         'obsolete': True})
+        self.assertEqual(cs, self.getChangeset())
+        self.assertEqual(cs.date.tzinfo, UTC)
+        self.assertEqual(cs.tags, None)
+        self.assertEqual(cs.entries, [e])
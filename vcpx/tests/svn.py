@@ -355,3 +355,545 @@ class SvnLogParser(TestCase):
 
         cset = csets.next()
         self.assertEqual(len(cset.entries), 1)
+
+
+class SvnDump(TestCase):
+    """Ensure the svn dump machinery does its job"""
+
+    def getDump(self):
+        from cStringIO import StringIO
+        from vcpx.svndump import DumpWriter
+
+        stream = StringIO()
+        writer = DumpWriter(stream)
+        writer.writeHeader()
+        writer.writeRevision({'svn:log': 'create tree', 'svn:author': 'lele',
+                              'svn:date': '2004-11-12T15:05:37.134366Z'})
+        writer.writeNode('trunk', 'add', 'dir', properties={})
+        writer.writeNode('trunk/dir', 'add', 'dir', properties={})
+        writer.writeNode('trunk/dir/a.txt', 'add', 'file', 'a\r\nb\n', {})
+        writer.writeNode('trunk/run', 'add', 'file', '#!/bin/sh\n',
+                         {'svn:executable': '*'})
+        writer.writeRevision({'svn:log': 'rename and edit',
+                              'svn:author': 'lele',
+                              'svn:date': '2004-11-12T15:06:04.193650Z'})
+        writer.writeNode('trunk/b.txt', 'add', 'file', 'B\n',
+                         copyfrom=('trunk/dir/a.txt', 1))
+        writer.writeNode('trunk/dir/a.txt', 'delete')
+        writer.writeNode('trunk/run', 'change', 'file', 'exit 0\n')
+        writer.writeNode('outside', 'add', 'dir', properties={})
+        writer.writeRevision({'svn:log': 'outside', 'svn:author': 'lele',
+                              'svn:date': '2004-11-12T15:07:00.000000Z'})
+        writer.writeNode('outside/c', 'add', 'file', 'c', {})
+        writer.writeRevision({'svn:log': 'remove', 'svn:author': 'lele',
+                              'svn:date': '2004-11-12T15:08:00.000000Z'})
+        writer.writeNode('trunk/dir', 'delete')
+        stream.seek(0)
+        return stream
+
+    def testReadWrite(self):
+        """Verify the dump round trip"""
+
+        from vcpx.svndump import read_dump
+
+        revisions = list(read_dump(self.getDump()))
+        self.assertEqual([r.number for r in revisions], [1, 2, 3, 4])
+        self.assertEqual(revisions[0].properties['svn:log'], 'create tree')
+        node = revisions[0].nodes[2]
+        self.assertEqual((node.path, node.action, node.kind),
+                         ('trunk/dir/a.txt', 'add', 'file'))
+        self.assertEqual(node.text, 'a\r\nb\n')
+        self.assertEqual(revisions[0].nodes[3].properties,
+                         {'svn:executable': '*'})
+        node = revisions[1].nodes[0]
+        self.assertEqual((node.copyfrom_path, node.copyfrom_rev),
+                         ('trunk/dir/a.txt', 1))
+        node = revisions[1].nodes[1]
+        self.assertEqual((node.action, node.kind, node.text, node.properties),
+                         ('delete', None, None, None))
+
+    def testChangesets(self):
+        """Verify the changesets built from a dump"""
+
+        from vcpx.repository.svn import changesets_from_svndump
+
+        csets = list(changesets_from_svndump(self.getDump(),
+                                             FR('file:///tmp/t/repo',
+                                                '/trunk')))
+        self.assertEqual([cs.revision for cs in csets], ['1', '2', '4'])
+
+        cset = csets[0]
+        self.assertEqual(cset.author, 'lele')
+        self.assertEqual(cset.date, datetime(2004,11,12,15,05,37,134366,UTC))
+        self.assertEqual(cset.log, 'create tree')
+        self.assertEqual([(e.action_kind, e.name, e.is_directory)
+                          for e in cset.entries],
+                         [('ADD', 'dir', True), ('ADD', 'dir/a.txt', False),
+                          ('ADD', 'run', False)])
+        self.assertEqual(cset.entries[1].contents, 'a\r\nb\n')
+
+        cset = csets[1]
+        self.assertEqual([(e.action_kind, e.name, e.old_name)
+                          for e in cset.entries],
+                         [('REN', 'b.txt', 'dir/a.txt'),
+                          ('UPD', 'run', None)])
+        self.assertEqual(cset.entries[0].copyfrom, ('trunk/dir/a.txt', 1))
+
+        cset = csets[2]
+        self.assertEqual([(e.action_kind, e.name) for e in cset.entries],
+                         [('DEL', 'dir')])
+
+    def testApply(self):
+        """Verify the application of the changesets built from a dump"""
+
+        from atexit import register
+        from os import stat
+        from os.path import join, exists
+        from shutil import rmtree
+        from tempfile import mkdtemp
+        from vcpx.repository.svn import changesets_from_svndump, SvnWorkingDir
+
+        basedir = mkdtemp('', 'tailor')
+        register(rmtree, basedir)
+        repository = FR('file:///tmp/t/repo', '/trunk')
+        repository.name = 'svn'
+        repository.basedir = basedir
+        repository.use_dump = True
+        wd = SvnWorkingDir(repository)
+
+        csets = list(changesets_from_svndump(self.getDump(), repository))
+        for cs in csets:
+            self.assertEqual(wd._applyChangeset(cs), [])
+            if cs.revision == '1':
+                self.assertEqual(open(join(basedir, 'dir', 'a.txt'),
+                                      'rb').read(), 'a\r\nb\n')
+                self.failUnless(stat(join(basedir, 'run')).st_mode & 0100)
+        self.assertEqual(open(join(basedir, 'b.txt')).read(), 'B\n')
+        self.assertEqual(open(join(basedir, 'run')).read(), 'exit 0\n')
+        self.failIf(exists(join(basedir, 'dir')))
+        self.assertEqual(csets[-1].entries[0].is_directory, True)
+        # The applied changesets do not carry the content anymore
+        self.assertEqual(csets[0].entries[1].contents, None)
+
+    def getDumpingRepository(self, status=0):
+        from atexit import register
+        from os.path import join
+        from shutil import rmtree
+        from sys import executable
+        from tempfile import mkdtemp
+
+        basedir = mkdtemp('', 'tailor')
+        register(rmtree, basedir)
+        script = join(basedir, 'svnadmin.py')
+        dumpfile = join(basedir, 'dump')
+        open(script, 'w').write(FAKE_SVNADMIN)
+        open(dumpfile, 'wb').write(self.getDump().read())
+
+        class DumpingRepository(FakeRepository):
+            name = 'svn'
+            use_dump = True
+            log_page_size = 0
+
+            def command(self, *args, **kwargs):
+                return [executable, script, dumpfile, str(status)] + list(args)
+
+            def localPath(self):
+                return '/tmp/t/repo'
+
+        repository = DumpingRepository('file:///tmp/t/repo', '/trunk')
+        repository.basedir = basedir
+        return repository
+
+    def testPagedDump(self):
+        """Verify the dump read in pages"""
+
+        from vcpx.repository.svn import SvnWorkingDir
+
+        repository = self.getDumpingRepository()
+        repository.log_page_size = 2
+        wd = SvnWorkingDir(repository)
+
+        page = list(wd._getUpstreamChangesets(None))
+        self.assertEqual([cs.revision for cs in page], ['1', '2'])
+        page = list(wd._getNextUpstreamPage('2'))
+        self.assertEqual([cs.revision for cs in page], ['4'])
+        # Nothing after the youngest revision
+        page = list(wd._getNextUpstreamPage('4'))
+        self.assertEqual(page, [])
+        self.assertEqual(wd._getNextUpstreamPage('4'), None)
+
+    def testInterruptibleDump(self):
+        """Verify svnadmin dump does not inherit an ignored SIGINT"""
+
+        from os.path import join
+        from signal import signal, SIGINT, SIG_IGN
+        from vcpx.repository.svn import SvnWorkingDir
+        from vcpx.statefile import StateFile
+
+        repository = self.getDumpingRepository()
+        wd = SvnWorkingDir(repository)
+
+        # The dump is started lazily, while the state file gets written
+        sf = StateFile(join(repository.basedir, 'state'), None)
+        sf.setPendingChangesets(wd._getUpstreamChangesets(None))
+        self.assertEqual(sf.pendingCount(), 3)
+        sf.finalize()
+
+        previous = signal(SIGINT, SIG_IGN)
+        try:
+            page = list(wd._getUpstreamChangesets(None))
+        finally:
+            signal(SIGINT, previous)
+        self.assertEqual([cs.revision for cs in page], ['1', '2', '4'])
+
+    def testFailedDump(self):
+        """Verify that a failing svnadmin dump is not taken as complete"""
+
+        from vcpx.repository.svn import SvnWorkingDir
+        from vcpx.source import GetUpstreamChangesetsFailure
+
+        wd = SvnWorkingDir(self.getDumpingRepository(status=1))
+        self.assertRaises(GetUpstreamChangesetsFailure,
+                          list, wd._getUpstreamChangesets(None))
+
+    def testAppend(self):
+        """Verify the resumed dump knows the existing paths"""
+
+        from vcpx.shwrap import ReopenableNamedTemporaryFile
+        from vcpx.svndump import append_to_dump, read_dump
+
+        rontf = ReopenableNamedTemporaryFile('dump', 'tailor')
+        filename = rontf.name
+        writer = append_to_dump(filename)
+        writer.stream.write(self.getDump().read()[len(
+            'SVN-fs-dump-format-version: 2\n\n'):])
+        writer.stream.close()
+
+        writer = append_to_dump(filename)
+        self.assertEqual(writer.revision, 4)
+        paths = writer.paths.keys()
+        paths.sort()
+        self.assertEqual(paths, ['outside', 'outside/c', 'trunk',
+                                 'trunk/b.txt', 'trunk/run'])
+        self.assertEqual(writer.writeRevision({}), 5)
+        writer.writeNode('tags', 'add', 'dir', properties={})
+        writer.writeNode('tags/v1', 'add', 'dir', copyfrom=('trunk', 4))
+        self.assertEqual(writer.paths['tags/v1/b.txt'], 'file')
+        writer.stream.close()
+
+        revisions = list(read_dump(open(filename)))
+        self.assertEqual(len(revisions), 5)
+        self.assertEqual(revisions[-1].nodes[1].copyfrom_path, 'trunk')
+
+    def testTarget(self):
+        """Verify the commits written as a dump"""
+
+        from atexit import register
+        from os import mkdir, rename
+        from os.path import join
+        from shutil import rmtree
+        from tempfile import mkdtemp
+        from vcpx.repository.svn import SvnWorkingDir
+        from vcpx.shwrap import ReopenableNamedTemporaryFile
+        from vcpx.svndump import read_dump
+
+        basedir = mkdtemp('', 'tailor')
+        register(rmtree, basedir)
+        rontf = ReopenableNamedTemporaryFile('dump', 'tailor')
+        repository = FR('file:///tmp/t/repo', '/trunk')
+        repository.name = 'svn'
+        repository.basedir = basedir
+        repository.dump_file = rontf.name
+        repository.tags_path = '/tags'
+        repository.encode = lambda s: s
+        wd = SvnWorkingDir(repository)
+        date = datetime(2004,11,12,15,05,37,134366,UTC)
+
+        mkdir(join(basedir, 'd'))
+        open(join(basedir, 'a'), 'w').write('a\n')
+        wd._addPathnames(['d', 'a'])
+        wd._commit(date, 'lele', 'first', isinitialcommit=True)
+
+        rename(join(basedir, 'a'), join(basedir, 'd', 'b'))
+        wd._addPathnames(['d'])
+        wd._renamePathname('a', 'd/b')
+        wd._commit(date, 'lele', 'second', 'the log')
+        wd._tag('v1/final', date, 'lele')
+        wd.finalizeTargetRepository()
+
+        revisions = list(read_dump(open(rontf.name)))
+        self.assertEqual([r.properties['svn:log'] for r in revisions],
+                         ['first', 'second\nthe log', 'v1/final'])
+        self.assertEqual(revisions[0].properties['svn:date'],
+                         '2004-11-12T15:05:37.000000Z')
+        self.assertEqual([(n.action, n.path) for n in revisions[0].nodes],
+                         [('add', 'trunk'), ('add', 'tags'),
+                          ('add', 'trunk/d'), ('add', 'trunk/a')])
+        self.assertEqual([(n.action, n.path, n.copyfrom_path, n.copyfrom_rev)
+                          for n in revisions[1].nodes],
+                         [('add', 'trunk/d/b', 'trunk/a', 1),
+                          ('delete', 'trunk/a', None, None)])
+        self.assertEqual(revisions[1].nodes[0].text, 'a\n')
+        self.assertEqual([(n.path, n.copyfrom_path, n.copyfrom_rev)
+                          for n in revisions[2].nodes],
+                         [('tags/v1_final', 'trunk', 2)])
+
+
+FAKE_SVNADMIN = """\
+import signal, sys
+
+if signal.getsignal(signal.SIGINT) == signal.SIG_IGN:
+    sys.stderr.write('svnadmin: started with SIGINT ignored\\n')
+    sys.exit(3)
+args = sys.argv[1:]
+dump = open(args.pop(0), 'rb').read()
+status = int(args.pop(0))
+lower = int(args[args.index('--revision')+1].split(':')[0])
+revisions = dump.split('Revision-number: ')[1:]
+if lower > len(revisions):
+    sys.stderr.write('svnadmin: E205000: Revisions must not be greater '
+                     'than the youngest revision (%d)\\n' % len(revisions))
+    sys.exit(1)
+sys.stdout.write(''.join(['Revision-number: ' + r for r in revisions
+                          if int(r.split('\\n')[0]) >= lower]))
+if status:
+    sys.stderr.write('svnadmin: E160004: Corrupt node-revision\\n')
+    sys.exit(status)
+"""
+
+
+FAKE_SVN = """\
+import sys
+
+if sys.argv[2] == 'remove':
+    updated = []
+    for line in open(sys.argv[1]).read().splitlines():
+        if line.startswith('update '):
+            updated.extend(line.split()[5:])
+    for name in sys.argv[5:]:
+        if name not in updated:
+            sys.stderr.write("svn: Directory '%s' is out of date\\n" % name)
+            sys.exit(1)
+open(sys.argv[1], 'a').write(' '.join(sys.argv[2:]) + '\\n')
+if sys.argv[2] == 'commit':
+    sys.stdout.write('Sending        a/g\\nCommitted revision 7.\\n')
+"""
+
+
+class SvnFastCommit(TestCase):
+    """Ensure the fast commit mode limits its work to the touched dirs"""
+
+    def getWorkingDir(self):
+        """Return a fast-commit working dir driving a fake svn"""
+
+        from atexit import register
+        from os import makedirs
+        from os.path import join
+        from shutil import rmtree
+        from sys import executable
+        from tempfile import mkdtemp
+        from vcpx.repository.svn import SvnWorkingDir
+
+        basedir = mkdtemp('', 'tailor')
+        register(rmtree, basedir)
+        makedirs(join(basedir, 'a', 'b'))
+        script = join(basedir, 'svn.py')
+        requests = join(basedir, 'requests')
+        open(script, 'w').write(FAKE_SVN)
+
+        class FastRepository(FakeRepository):
+            name = 'svn'
+            fast_commit = True
+            commit_all_files = True
+            use_propset = False
+            ignore_externals = False
+            post_commit_check = True
+            post_commit_check_interval = 2
+            dump_file = None
+
+            def command(self, *args, **kwargs):
+                return [executable, script, requests] + list(args)
+
+            def encode(self, s):
+                return s
+
+        repository = FastRepository('file:///tmp/t/repo', '/trunk')
+        repository.basedir = basedir
+        return SvnWorkingDir(repository), requests
+
+    def testFastCommit(self):
+        """Verify the update and the sampled check in fast-commit mode"""
+
+        wd, requests = self.getWorkingDir()
+        date = datetime(2004,11,12,15,05,37,134366,UTC)
+
+        for i in range(2):
+            wd._commit(date, 'lele', 'patch', 'log', ['a/b/f', 'a/g'])
+            wd._postCommitCheck()
+
+        log = [line.split(' ', 1)[0] == 'commit' and 'commit' or line
+               for line in open(requests).read().splitlines()]
+        self.assertEqual(log,
+                         ['commit',
+                          'update --quiet --revision 7 --non-recursive . a a/b',
+                          'commit',
+                          'update --quiet --revision 7 --non-recursive . a a/b',
+                          'status --non-recursive . a a/b'])
+
+    def testGrandparentRemoval(self):
+        """Verify a grandparent of a committed entry can be removed"""
+
+        wd, requests = self.getWorkingDir()
+        date = datetime(2004,11,12,15,05,37,134366,UTC)
+
+        wd._commit(date, 'lele', 'patch', 'log', ['a/b/f'])
+        wd._removePathnames(['a'])
+
+        log = [line.split(' ', 1)[0] == 'commit' and 'commit' or line
+               for line in open(requests).read().splitlines()]
+        self.assertEqual(log,
+                         ['commit',
+                          'update --quiet --revision 7 --non-recursive . a a/b',
+                          'remove --quiet --force a'])
+
+
+KINDS_LOG = """\
+<?xml version="1.0"?>
+<log>
+<logentry revision="2">
+<author>lele</author>
+<date>2009-03-01T10:00:00.000000Z</date>
+<paths>
+<path kind="dir" action="A" copyfrom-path="/trunk/dir" copyfrom-rev="1">/trunk/copy</path>
+<path kind="file" action="M">/trunk/copy/a.txt</path>
+<path kind="dir" action="A">/trunk/new</path>
+<path kind="file" action="A">/trunk/new/b.txt</path>
+<path kind="dir" action="D">/trunk/old</path>
+</paths>
+<msg>kinds</msg>
+</logentry>
+<logentry revision="3">
+<author>lele</author>
+<date>2009-03-01T10:01:00.000000Z</date>
+<paths>
+<path kind="" action="D">/trunk/copy</path>
+</paths>
+<msg>no kinds</msg>
+</logentry>
+</log>
+"""
+
+
+class SvnLogKinds(TestCase):
+    """Ensure the svn log parser records the kind of the entries"""
+
+    def testKinds(self):
+        """Verify the kinds and the copies stated by the log"""
+
+        from cStringIO import StringIO
+
+        csets = changesets_from_svnlog(StringIO(KINDS_LOG),
+                                       FR('file:///tmp/t/repo', '/trunk'))
+
+        cset = csets.next()
+        self.assertEqual(cset.kinds_known, True)
+        self.assertEqual(cset.copies, ['copy'])
+        self.assertEqual([(e.name, e.action_kind, e.is_directory)
+                          for e in cset.entries],
+                         [('copy', 'ADD', True), ('copy/a.txt', 'ADD', False),
+                          ('new', 'ADD', True), ('new/b.txt', 'ADD', False),
+                          ('old', 'DEL', True)])
+
+        cset = csets.next()
+        self.assertEqual(cset.kinds_known, False)
+        self.assertEqual(cset.copies, [])
+
+
+FAKE_SVN_LS = """\
+import sys
+
+open(sys.argv[1], 'a').write(' '.join(sys.argv[2:]) + '\\n')
+if sys.argv[2] == 'ls':
+    sys.stdout.write('''<?xml version="1.0"?>
+<lists>
+<list path="%s">
+<entry kind="file"><name>a.txt</name></entry>
+<entry kind="dir"><name>sub</name></entry>
+<entry kind="file"><name>sub/b.txt</name></entry>
+</list>
+</lists>
+''' % sys.argv[-1])
+"""
+
+
+class SvnCopiedSubtree(TestCase):
+    """Ensure the content of the copied directories comes from svn ls"""
+
+    def getWorkingDir(self):
+        """Return a working dir driving a fake svn"""
+
+        from atexit import register
+        from os.path import join
+        from shutil import rmtree
+        from sys import executable
+        from tempfile import mkdtemp
+        from vcpx.repository.svn import SvnWorkingDir
+
+        basedir = mkdtemp('', 'tailor')
+        register(rmtree, basedir)
+        script = join(basedir, 'svn.py')
+        requests = join(basedir, 'requests')
+        open(script, 'w').write(FAKE_SVN_LS)
+
+        class LsRepository(FakeRepository):
+            name = 'svn'
+            use_dump = False
+            ignore_externals = False
+
+            def command(self, *args, **kwargs):
+                return [executable, script, requests] + list(args)
+
+            def encode(self, s):
+                return s
+
+        repository = LsRepository('file:///tmp/t/repo', '/trunk')
+        repository.basedir = basedir
+        return SvnWorkingDir(repository), requests
+
+    def getChangeset(self):
+        from cStringIO import StringIO
+
+        csets = changesets_from_svnlog(StringIO(KINDS_LOG),
+                                       FR('file:///tmp/t/repo', '/trunk'))
+        return csets.next()
+
+    def testListedSubtree(self):
+        """Verify the copied directories are expanded with svn ls"""
+
+        wd, requests = self.getWorkingDir()
+        cset = self.getChangeset()
+        wd._applyChangeset(cset)
+
+        self.assertEqual([(e.name, e.action_kind, e.is_directory)
+                          for e in cset.entries],
+                         [('copy', 'ADD', True), ('copy/a.txt', 'ADD', False),
+                          ('new', 'ADD', True), ('new/b.txt', 'ADD', False),
+                          ('old', 'DEL', True), ('copy/sub', 'ADD', True),
+                          ('copy/sub/b.txt', 'ADD', False)])
+        self.assertEqual(open(requests).read().splitlines(),
+                         ['update --revision 2 .',
+                          'ls --recursive --xml --non-interactive '
+                          'file:///tmp/t/repo/trunk/copy@2'])
+
+    def testUnneededSubtree(self):
+        """Verify the copied directories are not expanded when useless"""
+
+        wd, requests = self.getWorkingDir()
+        wd.subtree_entries = False
+        cset = self.getChangeset()
+        wd._applyChangeset(cset)
+
+        self.assertEqual([e.name for e in cset.entries],
+                         ['copy', 'copy/a.txt', 'new', 'new/b.txt', 'old'])
+        self.assertEqual(open(requests).read().splitlines(),
+                         ['update --revision 2 .'])
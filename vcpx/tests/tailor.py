@@ -718,3 +718,82 @@ class CvsReappearedDirectory(OperationalTest):
         manifest = svnls.execute('file://%s/cvsresurdirtest.svnrepo/test/bar' % self.TESTDIR,
                                  stdout=PIPE)[0]
         self.assertEqual(manifest.read(), "again\n")
+
+
+SCHEDULER_CONFIG = """\
+[DEFAULT]
+source = mock:source
+target = mock:target
+
+[p1]
+root-directory = %(testdir)s/shared
+
+[p2]
+root-directory = %(testdir)s/shared
+
+[p3]
+root-directory = %(testdir)s/alone
+"""
+
+class Scheduling(TestCase):
+    "Exercise the parallel scheduler"
+
+    def setUp(self):
+        from tempfile import mkdtemp
+        from atexit import register
+        from shutil import rmtree
+
+        self.testdir = mkdtemp('', 'tailor')
+        register(rmtree, self.testdir)
+        self.config = Config(StringIO(SCHEDULER_CONFIG % {
+            'testdir': self.testdir}), {})
+
+    def getScheduler(self, projects, jobs, failing=()):
+        from os.path import join
+        from time import time, sleep
+        from vcpx.tailor import Scheduler
+
+        testdir = self.testdir
+
+        class FakeScheduler(Scheduler):
+            def _tailorize(self, projname):
+                log = open(join(testdir, projname), 'w')
+                log.write('%r\n' % time())
+                sleep(0.2)
+                log.write('%r\n' % time())
+                log.close()
+                if projname in failing:
+                    return self.FAILED
+                return self.OK
+
+        return FakeScheduler(self.config, projects, jobs)
+
+    def getTimes(self, projname):
+        from os.path import join
+
+        return [float(l) for l in open(join(self.testdir, projname))]
+
+    def testRootDirectoryLock(self):
+        """Verify that projects sharing their root directory are serialized"""
+
+        self.getScheduler(['p1', 'p2', 'p3'], 3).run()
+
+        start1, end1 = self.getTimes('p1')
+        start2, end2 = self.getTimes('p2')
+        start3, end3 = self.getTimes('p3')
+        self.assert_(end1 <= start2)
+        self.assert_(start3 < end1)
+
+    def testFailureSummary(self):
+        """Verify that failed projects are reported at the end"""
+
+        from vcpx.tailor import ProjectsFailure
+
+        scheduler = self.getScheduler(['p1', 'p2', 'p3'], 2, ('p2',))
+        try:
+            scheduler.run()
+        except ProjectsFailure, e:
+            self.assertEqual(str(e), 'p2')
+        else:
+            self.fail('ProjectsFailure not raised')
+        self.assertEqual(len(self.getTimes('p3')), 2)